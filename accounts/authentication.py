@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+from uuid import UUID
+
+from django.conf import settings
+from django.db import router
+from django.utils.crypto import salted_hmac
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from accounts.models import CustomUser, UserProfile
+from social_media_assignment.database import primary_reads
+
+AUTH_VERSION_CLAIM = 'auth_version'
+
+
+def get_auth_version(credentials_version, is_active, is_staff, is_superuser):
+    """
+    Fingerprint of the credentials and flags a token was issued for. Changing
+    the password, deactivating the account or changing its staff or superuser
+    status changes it and so revokes every token carrying the old value, whose
+    flag claims are out of date. Upgrading the password hash doesn't.
+    """
+    value = f'{credentials_version}|{is_active}|{is_staff}|{is_superuser}'
+    return salted_hmac('accounts.auth-version', value).hexdigest()[:16]
+
+
+class AuthVersionCache:
+    """
+    Small thread-safe LRU of ``user_id -> auth version`` whose entries expire
+    after ``ttl`` seconds, so revocations made by other processes are seen
+    within that delay.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            version, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return version
+
+    def set(self, user_id, version):
+        with self._lock:
+            self._entries[user_id] = (version, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+auth_versions = AuthVersionCache(
+    maxsize=getattr(settings, 'ACCOUNTS_AUTH_VERSION_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'ACCOUNTS_AUTH_VERSION_CACHE_TTL', 60),
+)
+
+
+def get_current_auth_version(user_id):
+    version = auth_versions.get(user_id)
+    if version is None:
+        row = CustomUser.objects.filter(pk=user_id).values_list(
+            'credentials_version', 'is_active', 'is_staff', 'is_superuser').first()
+        version = get_auth_version(*row) if row else ''
+        auth_versions.set(user_id, version)
+    return version
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds ``request.user`` from the token claims.
+
+    The user is a ``CustomUser`` loaded with the claim fields only: ``id``,
+    ``username``, ``is_active``, ``is_staff`` and ``is_superuser`` are free to
+    read, and so is ``user.profile``, primed from the ``profile_id`` claim. The
+    flags are as current as the auth version, which covers them. Every other
+    field is deferred and costs one query each time a view first reads it;
+    views needing several should load the user with ``only()``. Tokens issued
+    before these claims existed fall back to the regular lookup.
+
+    The auth version, the fallback lookup and the deferred fields are read from
+    the primary, a lagging replica would still accept revoked tokens.
+    """
+
+    def get_user(self, validated_token):
+        with primary_reads():
+            return self._get_user(validated_token)
+
+    def _get_user(self, validated_token):
+        if AUTH_VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = UUID(str(validated_token[api_settings.USER_ID_CLAIM]))
+        except (KeyError, ValueError):
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        if get_current_auth_version(user_id) != validated_token[AUTH_VERSION_CLAIM]:
+            raise AuthenticationFailed('User is inactive or the token was revoked', code='token_revoked')
+
+        db = router.db_for_read(CustomUser)
+        claims = {
+            'id': user_id,
+            'username': validated_token.get('username'),
+            'is_active': True,
+            'is_staff': validated_token.get('is_staff', False),
+            'is_superuser': validated_token.get('is_superuser', False),
+        }
+        # from_db takes the values in the model's field order.
+        names = [field.attname for field in CustomUser._meta.concrete_fields if field.attname in claims]
+        user = CustomUser.from_db(db, names, [claims[name] for name in names])
+        profile = None
+        if validated_token.get('profile_id'):
+            profile = UserProfile.from_db(db, ['id', 'user_id'], [UUID(validated_token['profile_id']), user_id])
+            profile._state.fields_cache['user'] = user
+        user._state.fields_cache['profile'] = profile
+        return user
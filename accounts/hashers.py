@@ -0,0 +1,58 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_rehash_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='password-rehash')
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    ``pbkdf2_sha256`` with the work factor taken from
+    ``ACCOUNTS_PBKDF2_ITERATIONS``. It keeps the stock algorithm name, so
+    existing hashes still verify and are flagged for an upgrade when the
+    iteration count changes.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'ACCOUNTS_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+def rehash_password(user, raw_password):
+    """
+    Re-hash ``raw_password`` with the preferred hasher and store it, unless the
+    password changed in the meantime. ``credentials_version`` is left alone,
+    so tokens issued for the old hash stay valid.
+    """
+    from accounts.models import CustomUser
+
+    password = make_password(raw_password)
+    if CustomUser.objects.filter(pk=user.pk, password=user.password).update(password=password):
+        user.password = password
+
+
+def _rehash_in_background(user, raw_password):
+    close_old_connections()
+    try:
+        rehash_password(user, raw_password)
+    except Exception:
+        logger.exception('Upgrading the password hash of user %s failed', user.pk)
+    finally:
+        close_old_connections()
+
+
+def schedule_rehash(user, raw_password):
+    """
+    ``check_password`` setter that upgrades an outdated hash off the request
+    path, or inline when ``ACCOUNTS_PASSWORD_REHASH`` is ``'inline'``.
+    """
+    mode = getattr(settings, 'ACCOUNTS_PASSWORD_REHASH', 'background')
+    if mode == 'inline':
+        rehash_password(user, raw_password)
+    elif mode == 'background':
+        _rehash_executor.submit(_rehash_in_background, user, raw_password)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_customuser_accounts_user_username_ci_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='credentials_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Bumped on every password change, revokes the tokens issued before it.'),
+        ),
+    ]
@@ -1,6 +1,8 @@
+from django.contrib.auth.hashers import check_password, make_password
 from django.contrib.auth.models import AbstractUser, UserManager
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
+from django.db.models.functions import Lower
 
 from social_media_assignment.base_models import BaseModel
 
@@ -32,6 +34,25 @@ class CustomUserManager(UserManager):
 
         return self._create_user(email, password, **extra_fields)
 
+    def get_for_login(self, username_or_email):
+        """
+        Resolve a login identifier with a single indexed query. An exact email
+        match wins over an exact username match; a case-insensitive match is
+        only accepted when it is unambiguous.
+        """
+        normalized = username_or_email.lower()
+        candidates = list(self.alias(username_ci=Lower('username'), email_ci=Lower('email')).filter(
+            models.Q(email_ci=normalized) | models.Q(username_ci=normalized)).select_related('profile')[:5])
+        for user in candidates:
+            if user.email == username_or_email:
+                return user
+        for user in candidates:
+            if user.username == username_or_email:
+                return user
+        if len(candidates) == 1:
+            return candidates[0]
+        return None
+
 
 class CustomUser(AbstractUser, BaseModel):
     """
@@ -67,6 +88,11 @@ class CustomUser(AbstractUser, BaseModel):
                                    default=False,
                                    help_text='Designates whether the user can log into this admin site.',
                                    )
+    credentials_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text='Bumped on every password change, revokes the tokens issued before it.',
+    )
 
     USERNAME_FIELD = 'username'
     EMAIL_FIELD = 'email'
@@ -78,12 +104,28 @@ class CustomUser(AbstractUser, BaseModel):
     def __str__(self):
         return self.email
 
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        self.credentials_version += 1
+
+    def check_password(self, raw_password):
+        def setter(raw_password):
+            # Upgrading the hash of the same password keeps the tokens valid.
+            self.password = make_password(raw_password)
+            self.save(update_fields=['password'])
+        return check_password(raw_password, self.password, setter)
+
     class Meta:
         """
         to set table name in database
         """
         verbose_name = 'user'
         verbose_name_plural = 'users'
+        indexes = [
+            # Case-normalized login lookups, see ``CustomUserManager.get_for_login``.
+            models.Index(Lower('username'), name='accounts_user_username_ci'),
+            models.Index(Lower('email'), name='accounts_user_email_ci'),
+        ]
 
 
 class UserProfile(BaseModel):
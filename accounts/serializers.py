@@ -1,8 +1,13 @@
-from django.contrib.auth import authenticate
+from functools import partial
+
+from django.contrib.auth.hashers import check_password
 from rest_framework import status, serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
+from accounts import social_graph
+from accounts.authentication import AUTH_VERSION_CLAIM, get_auth_version
+from accounts.hashers import schedule_rehash
 from accounts.models import CustomUser, UserProfile
 
 
@@ -10,46 +15,48 @@ class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
     username_field = 'username_or_email'
 
     def validate(self, attrs):
-        user_objs = CustomUser.objects.filter(email=attrs.get(self.username_field)) or CustomUser.objects.filter(
-            username=attrs.get(self.username_field))
-
-        if user_objs.exists():
-            password = attrs.get('password')
-            credentials = {
-                'username': user_objs.last().username,
-                'password': password
-            }
-            if all(credentials.values()):
-                user = authenticate(**credentials)
-                if user is None:
-                    msg = {'password': "Please enter a valid password"}
-                    raise ValidationError(code=status.HTTP_400_BAD_REQUEST, detail=msg)
-
-                refresh = self.get_token(user)
-
-                data = {
-                    'success': True,
-                    'refresh': str(refresh),
-                    'access': str(refresh.access_token),
-                    'user': user.id
-                }
-                return data
-
-            else:
-                msg = f'Must include "{self.username_field}" and "password".'
-                msg = msg.format(username_field=self.username_field)
-                raise ValidationError(code=status.HTTP_400_BAD_REQUEST, detail=msg)
-
-        else:
+        username_or_email = attrs.get(self.username_field)
+        password = attrs.get('password')
+        if not (username_or_email and password):
+            msg = f'Must include "{self.username_field}" and "password".'
+            raise ValidationError(code=status.HTTP_400_BAD_REQUEST, detail=msg)
+
+        user = CustomUser.objects.get_for_login(username_or_email)
+        if user is None:
             msg = {'username_or_email': 'Account with this email/username does not exists'}
             raise ValidationError(code=status.HTTP_400_BAD_REQUEST, detail=msg)
 
+        # Verify against the row we already have instead of letting authenticate() look it up again.
+        password_ok = check_password(password, user.password, setter=partial(schedule_rehash, user))
+        if not password_ok or not self.user_can_authenticate(user):
+            msg = {'password': "Please enter a valid password"}
+            raise ValidationError(code=status.HTTP_400_BAD_REQUEST, detail=msg)
+
+        refresh = self.get_token(user)
+
+        data = {
+            'success': True,
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+            'user': user.id
+        }
+        return data
+
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
 
-        # Adding custom claims here
+        # Adding custom claims here, StatelessJWTAuthentication rebuilds request.user from them
         token['username'] = user.username
+        token['is_active'] = user.is_active
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        try:
+            token['profile_id'] = str(user.profile.pk)
+        except UserProfile.DoesNotExist:
+            token['profile_id'] = None
+        token[AUTH_VERSION_CLAIM] = get_auth_version(user.credentials_version, user.is_active, user.is_staff,
+                                                     user.is_superuser)
         return token
 
     def user_can_authenticate(self, user):
@@ -65,6 +72,21 @@ class UserProfileSerializer(serializers.ModelSerializer):
         }
 
 
+class UserProfileDetailSerializer(serializers.ModelSerializer):
+    follower_count = serializers.SerializerMethodField(read_only=True)
+    following_count = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = UserProfile
+        exclude = ('followers', 'modified_by', 'created_by', 'date_modified')
+
+    def get_follower_count(self, obj):
+        return social_graph.get_follower_count(obj.user_id)
+
+    def get_following_count(self, obj):
+        return social_graph.get_following_count(obj.user_id)
+
+
 class UserSerializer(serializers.ModelSerializer):
     profile = UserProfileSerializer()
 
@@ -86,3 +108,13 @@ class UserFollowSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
         fields = ('followers', )
+
+
+class BulkFollowSerializer(serializers.Serializer):
+    users = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=1000)
+
+
+class SuggestionSerializer(serializers.Serializer):
+    user_id = serializers.UUIDField(source='id')
+    username = serializers.CharField()
+    mutual_count = serializers.IntegerField()
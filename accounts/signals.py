@@ -0,0 +1,42 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from accounts import social_graph, suggestions
+from accounts.authentication import auth_versions
+from accounts.models import CustomUser, UserProfile
+
+
+@receiver(m2m_changed, sender=UserProfile.followers.through)
+def update_social_graph(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add':
+        edges, added = social_graph.follow_edges(instance, reverse, pk_set), True
+    elif action == 'post_remove':
+        edges, added = social_graph.follow_edges(instance, reverse, pk_set), False
+    elif action == 'pre_clear':
+        edges, added = social_graph.current_edges(instance, reverse), False
+    else:
+        return
+    social_graph.invalidate_edges(edges)
+    suggestions.apply_edges(edges, added=added)
+
+
+@receiver(pre_delete, sender=CustomUser)
+def forget_social_graph(sender, instance, **kwargs):
+    # The cascade deletes the follow rows without m2m_changed, the neighbours'
+    # sets are found before it runs.
+    user_ids = [instance.pk] + social_graph.get_neighbour_ids(instance.pk)
+    transaction.on_commit(partial(social_graph.invalidate, user_ids))
+
+
+@receiver(post_delete, sender=CustomUser)
+def forget_suggestions(sender, instance, **kwargs):
+    suggestions.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def forget_auth_version(sender, instance, **kwargs):
+    auth_versions.discard(instance.pk)
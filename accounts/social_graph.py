@@ -0,0 +1,175 @@
+"""
+Cached adjacency of the follow graph.
+
+``followers(user)`` are the users listed in ``user.profile.followers``,
+``following(user)`` the users whose ``profile.followers`` list ``user``.
+Both sets are cached per user as a sorted, packed run of 16 byte UUIDs: the
+count is the blob length, membership a binary search, and no per-id Python
+objects are kept in the cache.
+
+Follow changes delete the cached sets of both ends once the transaction
+commits, the next read loads them again. Writes that have to be exact, like
+fanning a post out, read the follow table instead.
+"""
+from functools import partial
+from uuid import UUID
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from accounts.models import UserProfile
+
+FOLLOWERS = 'followers'
+FOLLOWING = 'following'
+ID_SIZE = 16
+
+
+def _cache():
+    return caches[getattr(settings, 'SOCIAL_GRAPH_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'SOCIAL_GRAPH_CACHE_TIMEOUT', 3600)
+
+
+def _key(kind, user_id):
+    return f'social-graph:{kind}:{user_id}'
+
+
+def pack(ids):
+    return b''.join(sorted({UUID(str(user_id)).bytes for user_id in ids}))
+
+
+def unpack(blob):
+    return [UUID(bytes=blob[i:i + ID_SIZE]) for i in range(0, len(blob), ID_SIZE)]
+
+
+def contains(blob, user_id):
+    target = user_id.bytes
+    low, high = 0, len(blob) // ID_SIZE
+    while low < high:
+        middle = (low + high) // 2
+        value = blob[middle * ID_SIZE:(middle + 1) * ID_SIZE]
+        if value == target:
+            return True
+        if value < target:
+            low = middle + 1
+        else:
+            high = middle
+    return False
+
+
+def _load(kind, user_ids):
+    through = UserProfile.followers.through.objects
+    if kind == FOLLOWERS:
+        rows = through.filter(userprofile__user_id__in=user_ids).values_list('userprofile__user_id', 'customuser_id')
+    else:
+        rows = through.filter(customuser_id__in=user_ids).values_list('customuser_id', 'userprofile__user_id')
+    adjacency = {user_id: [] for user_id in user_ids}
+    for user_id, other_id in rows:
+        adjacency[user_id].append(other_id)
+    return {user_id: pack(ids) for user_id, ids in adjacency.items()}
+
+
+def _get_many(kind, user_ids):
+    """
+    Return ``{user_id: packed ids}``, loading every cache miss with one query.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    keys = {_key(kind, user_id): user_id for user_id in user_ids}
+    blobs = {keys[key]: blob for key, blob in _cache().get_many(keys).items()}
+    missing = [user_id for user_id in user_ids if user_id not in blobs]
+    if missing:
+        loaded = _load(kind, missing)
+        _cache().set_many({_key(kind, user_id): blob for user_id, blob in loaded.items()}, _timeout())
+        blobs.update(loaded)
+    return blobs
+
+
+def _get(kind, user_id):
+    return _get_many(kind, [user_id])[user_id]
+
+
+def get_follower_ids(user_id):
+    return unpack(_get(FOLLOWERS, user_id))
+
+
+def get_following_ids(user_id):
+    return unpack(_get(FOLLOWING, user_id))
+
+
+def get_follower_count(user_id):
+    return len(_get(FOLLOWERS, user_id)) // ID_SIZE
+
+
+def get_following_count(user_id):
+    return len(_get(FOLLOWING, user_id)) // ID_SIZE
+
+
+def get_follower_counts(user_ids):
+    return {user_id: len(blob) // ID_SIZE for user_id, blob in _get_many(FOLLOWERS, user_ids).items()}
+
+
+def get_following_counts(user_ids):
+    return {user_id: len(blob) // ID_SIZE for user_id, blob in _get_many(FOLLOWING, user_ids).items()}
+
+
+def is_following(follower_id, followee_id):
+    return contains(_get(FOLLOWERS, followee_id), follower_id)
+
+
+def exclude_following(user_id, user_ids):
+    """
+    Return the ``user_ids`` that ``user_id`` doesn't follow.
+    """
+    blob = _get(FOLLOWING, user_id)
+    return [other for other in user_ids if not contains(blob, other)]
+
+
+def invalidate_edges(edges):
+    """
+    Drop the cached sets of both ends of the ``(follower_id, followee_id)``
+    edges when the current transaction commits. Deleting instead of patching
+    the sets can't lose a concurrent change, and a read racing the write
+    can't cache the old sets for longer than until the commit.
+    """
+    user_ids = {user_id for edge in edges for user_id in edge}
+    if user_ids:
+        transaction.on_commit(partial(invalidate, user_ids))
+
+
+def get_neighbour_ids(user_id):
+    """
+    Return the users on the other end of ``user_id``'s follow edges, read from
+    the follow table.
+    """
+    through = UserProfile.followers.through.objects
+    return list({
+        *through.filter(customuser_id=user_id).values_list('userprofile__user_id', flat=True),
+        *through.filter(userprofile__user_id=user_id).values_list('customuser_id', flat=True),
+    })
+
+
+def invalidate(user_ids):
+    _cache().delete_many([_key(kind, user_id) for user_id in user_ids for kind in (FOLLOWERS, FOLLOWING)])
+
+
+def follow_edges(instance, reverse, pk_set):
+    """
+    Translate an ``m2m_changed`` call on ``UserProfile.followers`` into
+    ``(follower_id, followee_id)`` edges.
+    """
+    if reverse:
+        followees = UserProfile.objects.filter(pk__in=pk_set).values_list('user_id', flat=True)
+        return [(instance.pk, followee) for followee in followees]
+    return [(follower, instance.user_id) for follower in pk_set]
+
+
+def current_edges(instance, reverse):
+    """
+    Return every follow edge ``instance`` takes part in, e.g. before a ``clear()``.
+    """
+    if reverse:
+        return follow_edges(instance, reverse, set(instance.following.values_list('pk', flat=True)))
+    return follow_edges(instance, reverse, set(instance.followers.values_list('pk', flat=True)))
@@ -0,0 +1,129 @@
+"""
+"People you may know": users followed by the users someone follows, ranked by
+how many of those mutual connections lead to them.
+
+Candidates are counted with one grouped self-join of the follow table, over
+the ``MAX_SOURCES`` most recently followed users, so the cost doesn't grow
+with the size of the whole graph. The best ``SIZE`` counts are cached per
+user and patched as follow edges change:
+
+* when A follows B, the users B follows gain a mutual connection for A, and B
+  gains one for every user following A;
+* when A unfollows B, those counts drop again, A's own entry is recomputed.
+
+Only cached entries are patched. Users that are already followed are filtered
+out when reading, so writes never have to check follow state.
+"""
+import heapq
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count
+
+from accounts import social_graph
+from accounts.models import UserProfile
+
+DEFAULT_SUGGESTIONS = {
+    'CACHE': 'default',
+    'TIMEOUT': 3600,
+    'SIZE': 500,
+    'MAX_SOURCES': 5000,
+}
+
+
+def get_options():
+    return {**DEFAULT_SUGGESTIONS, **getattr(settings, 'ACCOUNTS_SUGGESTIONS', {})}
+
+
+def _cache():
+    return caches[get_options()['CACHE']]
+
+
+def _key(user_id):
+    return f'suggestions:{user_id}'
+
+
+def _top(counts, size):
+    if len(counts) <= size:
+        return counts
+    return dict(heapq.nlargest(size, counts.items(), key=lambda item: item[1]))
+
+
+def compute(user_id, options):
+    """
+    Return ``{candidate_id: mutual count}`` for the best ``SIZE`` candidates.
+    """
+    through = UserProfile.followers.through.objects
+    followees = through.filter(customuser_id=user_id).order_by('-pk').values('userprofile__user_id')
+    rows = through.filter(
+        customuser_id__in=followees[:options['MAX_SOURCES']],
+    ).exclude(
+        userprofile__user_id=user_id,
+    ).exclude(
+        userprofile__user_id__in=followees,
+    ).values('userprofile__user_id').annotate(
+        mutual=Count('customuser_id'),
+    ).order_by('-mutual', 'userprofile__user_id').values_list('userprofile__user_id', 'mutual')[:options['SIZE']]
+    return dict(rows)
+
+
+def get_counts(user_id):
+    options = get_options()
+    counts = _cache().get(_key(user_id))
+    if counts is None:
+        counts = compute(user_id, options)
+        _cache().set(_key(user_id), counts, options['TIMEOUT'])
+    return counts
+
+
+def get_suggestions(user_id, limit):
+    """
+    Return up to ``limit`` ``(candidate_id, mutual count)`` pairs, best first.
+    """
+    counts = get_counts(user_id)
+    candidates = social_graph.exclude_following(user_id, [
+        candidate for candidate, mutual in counts.items() if mutual > 0 and candidate != user_id])
+    return heapq.nlargest(limit, ((candidate, counts[candidate]) for candidate in candidates),
+                          key=lambda item: (item[1], str(item[0])))
+
+
+def apply_edges(edges, added):
+    """
+    Patch the cached counts after ``(follower_id, followee_id)`` edges were
+    added or removed.
+    """
+    options = get_options()
+    followees_by_follower = defaultdict(list)
+    for follower, followee in edges:
+        followees_by_follower[follower].append(followee)
+    if not added:
+        _cache().delete_many([_key(follower) for follower in followees_by_follower])
+
+    changes = defaultdict(Counter)
+    for follower, followees in followees_by_follower.items():
+        for user_id in social_graph.get_follower_ids(follower):
+            changes[user_id].update(followees)
+    keys = {_key(user_id): user_id for user_id in changes}
+    if added:
+        keys.update({_key(follower): follower for follower in followees_by_follower})
+    cached = _cache().get_many(keys)
+    if not cached:
+        return
+
+    delta = 1 if added else -1
+    updated = {}
+    for key, counts in cached.items():
+        user_id = keys[key]
+        if added and user_id in followees_by_follower:
+            for followee in followees_by_follower[user_id]:
+                changes[user_id].update(social_graph.get_following_ids(followee))
+        for candidate, change in changes[user_id].items():
+            counts[candidate] = counts.get(candidate, 0) + delta * change
+        updated[key] = _top({candidate: mutual for candidate, mutual in counts.items() if mutual > 0},
+                            options['SIZE'])
+    _cache().set_many(updated, options['TIMEOUT'])
+
+
+def invalidate(user_ids):
+    _cache().delete_many([_key(user_id) for user_id in user_ids])
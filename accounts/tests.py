@@ -1,8 +1,16 @@
-from django.test import TestCase
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from accounts import social_graph, suggestions
+from accounts.authentication import StatelessJWTAuthentication, auth_versions
 from accounts.models import CustomUser, UserProfile
+from accounts.throttling import LoginIPRateThrottle, LoginAccountRateThrottle
 
 
 class UserRegistrationTests(TestCase):
@@ -65,3 +73,313 @@ class FollowUnfollowUserTests(TestCase):
         response = self.client.delete(self.unfollow_url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(self.user2_profile.followers.filter(id=self.user1.id).exists())
+
+
+class BulkFollowTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(username='user', password='password', email='user@example.com')
+        UserProfile.objects.create(user=self.user)
+        self.targets = []
+        for i in range(5):
+            target = CustomUser.objects.create_user(username=f'target{i}', password='password',
+                                                    email=f'target{i}@example.com')
+            UserProfile.objects.create(user=target)
+            self.targets.append(target)
+        self.no_profile = CustomUser.objects.create_user(username='noprofile', password='password',
+                                                         email='noprofile@example.com')
+        self.client.force_authenticate(user=self.user)
+
+    def test_bulk_follow_reports_per_id_results(self):
+        self.targets[0].profile.followers.add(self.user)
+        payload = {'users': [str(target.id) for target in self.targets] + [str(self.no_profile.id),
+                                                                          str(self.user.id)]}
+        response = self.client.post('/accounts/follow/bulk/', payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual(results[str(self.targets[0].id)], 'already_following')
+        for target in self.targets[1:]:
+            self.assertEqual(results[str(target.id)], 'followed')
+            self.assertTrue(target.profile.followers.filter(id=self.user.id).exists())
+        self.assertEqual(results[str(self.no_profile.id)], 'not_found')
+        self.assertEqual(results[str(self.user.id)], 'self')
+
+    def test_bulk_follow_query_count_is_independent_of_list_size(self):
+        def follow(targets):
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.post('/accounts/follow/bulk/', {'users': [str(t.id) for t in targets]}, format='json')
+            return len(context.captured_queries)
+
+        self.assertEqual(follow(self.targets[:1]), follow(self.targets[1:]))
+
+    def test_bulk_unfollow(self):
+        for target in self.targets[:3]:
+            target.profile.followers.add(self.user)
+        payload = {'users': [str(target.id) for target in self.targets[:4]]}
+        response = self.client.post('/accounts/unfollow/bulk/', payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data['results'].values()), ['unfollowed'] * 3 + ['not_following'])
+        self.assertFalse(UserProfile.objects.filter(followers=self.user).exists())
+
+    def test_bulk_follow_updates_timelines(self):
+        from feed.models import Post
+
+        post = Post.objects.create(content='Mine', user=self.user)
+        self.client.post('/accounts/follow/bulk/', {'users': [str(self.targets[0].id)]}, format='json')
+        self.assertTrue(self.targets[0].timeline_entries.filter(post=post).exists())
+
+        self.client.post('/accounts/unfollow/bulk/', {'users': [str(self.targets[0].id)]}, format='json')
+        self.assertFalse(self.targets[0].timeline_entries.filter(post=post).exists())
+
+    def test_invalid_payload(self):
+        response = self.client.post('/accounts/follow/bulk/', {'users': ['not-a-uuid']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SocialGraphTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user1 = CustomUser.objects.create_user(username='user1', password='password1', email='test1@example.com')
+        self.user2 = CustomUser.objects.create_user(username='user2', password='password2', email='test2@example.com')
+        self.user3 = CustomUser.objects.create_user(username='user3', password='password3', email='test3@example.com')
+        self.user1_profile = UserProfile.objects.create(user=self.user1, first_name='User', last_name='One')
+        self.user2_profile = UserProfile.objects.create(user=self.user2)
+        self.client.force_authenticate(user=self.user1)
+
+    def test_cached_sets_follow_edge_changes(self):
+        self.assertEqual(social_graph.get_follower_ids(self.user1.id), [])
+        self.assertEqual(social_graph.get_following_count(self.user2.id), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user1_profile.followers.add(self.user2, self.user3)
+        self.assertEqual(sorted(social_graph.get_follower_ids(self.user1.id)), sorted([self.user2.id, self.user3.id]))
+        self.assertEqual(social_graph.get_following_ids(self.user2.id), [self.user1.id])
+        self.assertTrue(social_graph.is_following(self.user3.id, self.user1.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user3.following.remove(self.user1_profile)
+        self.assertEqual(social_graph.get_follower_count(self.user1.id), 1)
+        self.assertFalse(social_graph.is_following(self.user3.id, self.user1.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user1_profile.followers.clear()
+        self.assertEqual(social_graph.get_following_ids(self.user2.id), [])
+
+    def test_cached_sets_are_kept_until_commit(self):
+        social_graph.get_follower_ids(self.user1.id)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user1_profile.followers.add(self.user2)
+            self.assertEqual(social_graph.get_follower_ids(self.user1.id), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(social_graph.get_follower_ids(self.user1.id), [self.user2.id])
+
+    def test_deleted_user_leaves_neighbours_sets(self):
+        self.user1_profile.followers.add(self.user2)
+        self.assertEqual(social_graph.get_following_ids(self.user2.id), [self.user1.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user1.delete()
+        self.assertEqual(social_graph.get_following_ids(self.user2.id), [])
+
+    def test_cached_reads_skip_the_join_table(self):
+        self.user1_profile.followers.add(self.user2)
+        social_graph.get_follower_ids(self.user1.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(social_graph.get_follower_count(self.user1.id), 1)
+
+    def test_profile_detail_counts(self):
+        self.user1_profile.followers.add(self.user2, self.user3)
+        self.user2_profile.followers.add(self.user1)
+        response = self.client.get(f'/accounts/profile/{self.user1.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['follower_count'], 2)
+        self.assertEqual(response.data['following_count'], 1)
+        self.assertNotIn('followers', response.data)
+
+
+class SuggestionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.users = [
+            CustomUser.objects.create_user(username=f'user{i}', password='password', email=f'test{i}@example.com')
+            for i in range(6)
+        ]
+        self.profiles = [UserProfile.objects.create(user=user) for user in self.users]
+        me, friend1, friend2, common, other, _ = self.users
+        # me follows friend1 and friend2, both follow common, friend2 also follows other
+        self.profiles[1].followers.add(me)
+        self.profiles[2].followers.add(me)
+        self.profiles[3].followers.add(friend1, friend2)
+        self.profiles[4].followers.add(friend2)
+        self.client.force_authenticate(user=me)
+
+    def test_ranked_by_mutual_connections(self):
+        response = self.client.get('/accounts/suggestions/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(row['username'], row['mutual_count']) for row in response.data['results']],
+                         [('user3', 2), ('user4', 1)])
+
+        response = self.client.get('/accounts/suggestions/?limit=1')
+        self.assertEqual([row['username'] for row in response.data['results']], ['user3'])
+
+    def test_followed_users_and_self_are_excluded(self):
+        self.profiles[0].followers.add(self.users[1])
+        self.profiles[3].followers.add(self.users[0])
+        self.assertEqual(suggestions.get_suggestions(self.users[0].id, 10), [(self.users[4].id, 1)])
+
+    def test_cached_counts_follow_edge_changes(self):
+        me = self.users[0]
+        suggestions.get_counts(me.id)
+        self.profiles[5].followers.add(self.users[1])
+        self.profiles[4].followers.remove(self.users[2])
+        with self.assertNumQueries(0):
+            counts = suggestions.get_counts(me.id)
+        self.assertEqual(counts, {self.users[3].id: 2, self.users[5].id: 1})
+        suggestions.invalidate([me.id])
+        self.assertEqual(suggestions.get_counts(me.id), counts)
+
+        # unfollowing drops the candidates only reached through that user
+        self.profiles[1].followers.remove(me)
+        self.assertEqual(suggestions.get_counts(me.id), {self.users[3].id: 1})
+
+    def test_counts_are_computed_with_one_query(self):
+        with self.assertNumQueries(1):
+            suggestions.get_counts(self.users[0].id)
+
+
+class UserLoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = '/accounts/token/'
+        self.user = CustomUser.objects.create_user(username='TestUser', password='testpassword',
+                                                   email='test@example.com')
+
+    def login(self, username_or_email, password='testpassword'):
+        return self.client.post(self.url, {'username_or_email': username_or_email, 'password': password},
+                                format='json')
+
+    def test_login_with_username_or_email(self):
+        for identifier in ('TestUser', 'testuser', 'test@example.com', 'Test@Example.com'):
+            response = self.login(identifier)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, identifier)
+            self.assertEqual(response.data['user'], self.user.id)
+            self.assertIn('access', response.data)
+
+    def test_login_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            response = self.login('test@example.com')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_ambiguous_case_insensitive_username(self):
+        CustomUser.objects.create_user(username='testuser', password='otherpassword', email='other@example.com')
+        self.assertEqual(self.login('TestUser').data['user'], self.user.id)
+        self.assertEqual(self.login('TESTUSER').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_credentials(self):
+        self.assertIn('password', self.login('TestUser', password='wrong').data)
+        self.assertIn('username_or_email', self.login('nobody').data)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.login('TestUser').status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(ACCOUNTS_PASSWORD_REHASH='inline', ACCOUNTS_PBKDF2_ITERATIONS=1000)
+    def test_outdated_hash_is_upgraded_on_login(self):
+        response = self.login('TestUser')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(self.user.check_password('testpassword'))
+
+        # The upgrade doesn't revoke the token issued with it.
+        auth_versions.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.assertEqual(self.client.get('/feed/posts/').status_code, status.HTTP_200_OK)
+
+    def test_login_attempts_are_throttled_per_account(self):
+        with mock.patch.dict(LoginAccountRateThrottle.THROTTLE_RATES, {'login_account': '2/min'}):
+            self.login('TestUser', password='wrong')
+            self.login('testuser', password='wrong')
+            response = self.login('TestUser')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_non_object_bodies_are_rejected(self):
+        for body in ([], 'TestUser', 1):
+            response = self.client.post(self.url, body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+
+    def test_login_attempts_are_throttled_per_ip(self):
+        with mock.patch.dict(LoginIPRateThrottle.THROTTLE_RATES, {'login_ip': '1/min'}):
+            self.login('nobody')
+            response = self.login('TestUser')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class StatelessJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        auth_versions.clear()
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(username='user1', password='password1', email='test1@example.com')
+        self.profile = UserProfile.objects.create(user=self.user)
+        response = self.client.post('/accounts/token/', {'username_or_email': 'user1', 'password': 'password1'},
+                                    format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+    def user_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [query['sql'] for query in context.captured_queries if 'FROM "accounts_customuser"' in query['sql']]
+
+    def test_request_user_comes_from_the_token(self):
+        self.user_queries('/feed/posts/')  # warm the auth version cache
+        self.assertEqual(self.user_queries('/feed/posts/'), [])
+
+    def test_user_is_hydrated_lazily(self):
+        authentication = StatelessJWTAuthentication()
+        token = authentication.get_validated_token(self.client._credentials['HTTP_AUTHORIZATION'].split()[1])
+        user = authentication.get_user(token)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(user.username, 'user1')
+            self.assertEqual((user.is_active, user.is_staff, user.is_superuser), (True, False, False))
+            self.assertEqual(user.profile.pk, self.profile.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'test1@example.com')
+
+    def test_deactivated_user_token_is_revoked(self):
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/feed/posts/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_staff_status_change_revokes_token(self):
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.post('/accounts/token/', {'username_or_email': 'user1', 'password': 'password1'},
+                                    format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.assertEqual(self.client.get('/metrics/').status_code, status.HTTP_200_OK)
+
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get('/feed/posts/').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.get('/metrics/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_password_change_revokes_token(self):
+        self.user.set_password('password2')
+        self.user.save()
+        response = self.client.get('/feed/posts/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_posts_are_created_for_the_token_user(self):
+        response = self.client.post('/feed/posts/', {'content': 'Hello'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['user'], self.user.id)
+
@@ -0,0 +1,29 @@
+from collections.abc import Mapping
+
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LoginIPRateThrottle(SimpleRateThrottle):
+    """
+    Limits login attempts per client IP before any password is hashed.
+    """
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class LoginAccountRateThrottle(SimpleRateThrottle):
+    """
+    Limits login attempts per targeted account, whatever IP they come from.
+    """
+    scope = 'login_account'
+
+    def get_cache_key(self, request, view):
+        # Other bodies are left to the serializer, which rejects them.
+        if not isinstance(request.data, Mapping):
+            return None
+        username_or_email = request.data.get('username_or_email')
+        if not isinstance(username_or_email, str) or not username_or_email:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': username_or_email.strip().lower()}
@@ -1,12 +1,17 @@
 from django.urls import path
 
-from accounts.views import UserObtainTokenPairView, UserRegistrationView, FollowUserView, UnfollowUserView
+from accounts.views import UserObtainTokenPairView, UserRegistrationView, FollowUserView, UnfollowUserView, \
+    BulkFollowView, BulkUnfollowView, UserProfileDetailView, SuggestionListView
 
 app_name = 'account'
 
 urlpatterns = [
     path('token/', UserObtainTokenPairView.as_view(), name='token_obtain_pair'),
     path('register/', UserRegistrationView.as_view(), name='register'),
+    path('profile/<uuid:pk>/', UserProfileDetailView.as_view(), name='profile_detail'),
+    path('suggestions/', SuggestionListView.as_view(), name='suggestions'),
+    path('follow/bulk/', BulkFollowView.as_view(), name='bulk_follow'),
+    path('unfollow/bulk/', BulkUnfollowView.as_view(), name='bulk_unfollow'),
     path('follow/<uuid:pk>/', FollowUserView.as_view(), name='follow_user'),
     path('unfollow/<uuid:pk>/', UnfollowUserView.as_view(), name='unfollow_user'),
 ]
@@ -1,17 +1,23 @@
+from django.db import router
+from django.db.models.signals import m2m_changed
 from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from accounts.serializers import UserTokenObtainPairSerializer, UserSerializer, UserFollowSerializer
+from accounts import suggestions
+from accounts.serializers import UserTokenObtainPairSerializer, UserSerializer, UserFollowSerializer, \
+    BulkFollowSerializer, UserProfileDetailSerializer, SuggestionSerializer
 from rest_framework import generics
 from rest_framework import status
 from rest_framework.response import Response
 
 from accounts.models import CustomUser, UserProfile
+from accounts.throttling import LoginIPRateThrottle, LoginAccountRateThrottle
 
 
 class UserObtainTokenPairView(TokenObtainPairView):
     permission_classes = (AllowAny,)
     serializer_class = UserTokenObtainPairSerializer
+    throttle_classes = (LoginIPRateThrottle, LoginAccountRateThrottle)
 
 
 class UserRegistrationView(generics.CreateAPIView):
@@ -27,6 +33,13 @@ class UserRegistrationView(generics.CreateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class UserProfileDetailView(generics.RetrieveAPIView):
+    queryset = UserProfile.objects.all()
+    serializer_class = UserProfileDetailSerializer
+    lookup_field = 'user_id'
+    lookup_url_kwarg = 'pk'
+
+
 class FollowUserView(generics.CreateAPIView):
     queryset = UserProfile.objects.all()
     serializer_class = UserFollowSerializer
@@ -48,3 +61,85 @@ class UnfollowUserView(generics.DestroyAPIView):
         user_to_unfollow = CustomUser.objects.get(pk=self.kwargs['pk'])
         user_to_unfollow.profile.followers.remove(request.user)
         return Response({"message": "User unfollowed successfully"}, status=status.HTTP_204_NO_CONTENT)
+
+
+class BulkFollowView(generics.GenericAPIView):
+    """
+    Follow or unfollow a list of users at once.
+
+    Targets are resolved with one query and the follow edges are written to the
+    ``UserProfile.followers`` through table with a single INSERT or DELETE.
+    ``m2m_changed`` is sent once for the whole batch so timelines and caches
+    are updated the same way as for ``followers.add``/``remove``.
+    """
+    serializer_class = BulkFollowSerializer
+    follow = True
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = request.user
+        user_ids = serializer.validated_data['users']
+
+        through = UserProfile.followers.through
+        profiles = dict(UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', 'id'))
+        profiles.pop(user.id, None)
+        following = set(through.objects.filter(
+            customuser_id=user.id, userprofile_id__in=profiles.values()).values_list('userprofile_id', flat=True))
+
+        if self.follow:
+            changed = [profile_id for profile_id in profiles.values() if profile_id not in following]
+            through.objects.bulk_create(
+                [through(customuser_id=user.id, userprofile_id=profile_id) for profile_id in changed],
+                ignore_conflicts=True,
+            )
+            action, done, unchanged = 'post_add', 'followed', 'already_following'
+        else:
+            changed = list(following)
+            through.objects.filter(customuser_id=user.id, userprofile_id__in=changed).delete()
+            action, done, unchanged = 'post_remove', 'unfollowed', 'not_following'
+
+        if changed:
+            m2m_changed.send(
+                sender=through, instance=user, action=action, reverse=True, model=UserProfile,
+                pk_set=set(changed), using=router.db_for_write(through),
+            )
+
+        changed = set(changed)
+        results = {}
+        for user_id in user_ids:
+            if user_id == user.id:
+                results[str(user_id)] = 'self'
+            elif user_id not in profiles:
+                results[str(user_id)] = 'not_found'
+            else:
+                results[str(user_id)] = done if profiles[user_id] in changed else unchanged
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+class BulkUnfollowView(BulkFollowView):
+    follow = False
+
+
+class SuggestionListView(generics.GenericAPIView):
+    """
+    Users followed by the people the current user follows, ranked by the
+    number of those mutual connections. ``?limit=`` caps the list (max 100).
+    """
+    serializer_class = SuggestionSerializer
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(max(int(request.query_params.get('limit', self.default_limit)), 1), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        ranked = suggestions.get_suggestions(request.user.id, limit)
+        users = CustomUser.objects.only('id', 'username').in_bulk([user_id for user_id, _ in ranked])
+        results = []
+        for user_id, mutual_count in ranked:
+            if user_id in users:
+                users[user_id].mutual_count = mutual_count
+                results.append(users[user_id])
+        return Response({'results': self.get_serializer(results, many=True).data})
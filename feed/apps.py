@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class FeedConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'feed'
+
+    def ready(self):
+        from feed import signals  # noqa: F401
+        from feed.search import restore_index
+        post_migrate.connect(restore_index, sender=self)
@@ -0,0 +1,140 @@
+"""
+Async views: the server-sent events stream and async variants of the hot
+feed endpoints, routed instead of ``feed.views`` when ``FEED_ASYNC_VIEWS`` is
+set and the project is served over ASGI.
+
+Reads use the async ORM and issue independent queries concurrently. Writes
+still go through the regular serializer/signal path in a worker thread.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from feed import events, page_cache
+from feed.prefetch import aprefetch_posts
+from feed.timeline import get_feed_sources
+from feed.views import PostListCreateAPIView, PostDetailView, LikeCreateView, CommentCreateView
+
+
+class AsyncAPIViewMixin:
+    """
+    ``APIView.dispatch`` for coroutine handlers. Authentication, permission and
+    throttle checks may query the database and run in a worker thread.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncPostListCreateAPIView(AsyncAPIViewMixin, PostListCreateAPIView):
+    async def get(self, request, *args, **kwargs):
+        if self.get_mode() == 'ranked':
+            return await sync_to_async(self.list)(request, *args, **kwargs)
+        response = await sync_to_async(page_cache.get_cached_response)(request)
+        if response is not None:
+            return response
+        timeline = await sync_to_async(self.get_queryset)()
+        page = await self.paginator.apaginate_queryset(timeline, request, view=self)
+        await aprefetch_posts(page, request.user.id)
+        data = self.get_paginated_response(self.get_serializer(page, many=True).data).data
+        return await sync_to_async(page_cache.cache_response)(request, data, page,
+                                                               getattr(timeline, 'pull_sources', ()))
+
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(self.create)(request, *args, **kwargs)
+
+
+class AsyncPostDetailView(AsyncAPIViewMixin, PostDetailView):
+    async def aget_object(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            post = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except queryset.model.DoesNotExist:
+            raise Http404('No %s matches the given query.' % queryset.model._meta.object_name)
+        self.check_object_permissions(self.request, post)
+        return post
+
+    async def get(self, request, *args, **kwargs):
+        post = await self.aget_object()
+        await aprefetch_posts([post], request.user.id)
+        return Response(self.get_serializer(post).data)
+
+    async def put(self, request, *args, **kwargs):
+        return await sync_to_async(self.update)(request, *args, **kwargs)
+
+    async def patch(self, request, *args, **kwargs):
+        return await sync_to_async(self.partial_update)(request, *args, **kwargs)
+
+    async def delete(self, request, *args, **kwargs):
+        return await sync_to_async(self.destroy)(request, *args, **kwargs)
+
+
+class AsyncLikeCreateView(AsyncAPIViewMixin, LikeCreateView):
+    async def post(self, request, *args, **kwargs):
+        # A buffered like may still be flushed inline and is journaled to disk.
+        return await sync_to_async(self.create)(request, *args, **kwargs)
+
+
+class AsyncCommentCreateView(AsyncAPIViewMixin, CommentCreateView):
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(self.create)(request, *args, **kwargs)
+
+
+class EventStreamView(AsyncAPIViewMixin, APIView):
+    """
+    Server-sent events of the posts, likes and comments made by the users in
+    the viewer's home feed, see ``feed.events``. Needs an ASGI server.
+
+    A comment line is sent every ``FEED_EVENTS_HEARTBEAT`` seconds to keep
+    proxies from closing an idle connection, and the stream ends after
+    ``FEED_EVENTS_MAX_AGE`` seconds so connections whose client went away are
+    reclaimed; ``EventSource`` reconnects on its own.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        sources = await sync_to_async(get_feed_sources)(request.user.id)
+        stream = self.stream(request.user.id, [request.user.id, *sources])
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @staticmethod
+    async def stream(user_id, topics):
+        heartbeat = getattr(settings, 'FEED_EVENTS_HEARTBEAT', 15)
+        loop = asyncio.get_running_loop()
+        closes_at = loop.time() + getattr(settings, 'FEED_EVENTS_MAX_AGE', 300)
+        # Subscribing once the server starts streaming ties the subscription
+        # to the loop that consumes it and to this generator's cleanup.
+        subscription = events.hub.subscribe(user_id, topics)
+        try:
+            yield 'retry: 3000\n\n'
+            while (remaining := closes_at - loop.time()) > 0:
+                try:
+                    yield await asyncio.wait_for(subscription.get(), min(heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+        finally:
+            events.hub.unsubscribe(subscription)
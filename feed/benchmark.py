@@ -0,0 +1,263 @@
+"""
+Request level benchmark of the main endpoints, run by ``benchmark_feed``.
+
+Every scenario sends real requests through the URL conf, middleware and JWT
+authentication with DRF's ``APIClient`` and records the latency and number of
+queries of each one. Write scenarios (like, comment, follow) undo their
+change after every request, outside of the measurement, so runs against the
+same dataset stay comparable.
+
+``feed_list`` runs with the page cache disabled, so it measures building the
+page. ``feed_list_cached`` requests every page once before measuring it, so it
+measures serving one from the cache.
+
+The queries of one request per scenario are explained to find the rows they
+read: on PostgreSQL with ``EXPLAIN ANALYZE``, on SQLite by adding up the rows
+of every table that is scanned without an index (index searches are not
+counted there).
+
+``benchmark_serializers`` compares the DRF serializers of posts, comments and
+likes with their compiled ``feed.fast_serializers`` counterparts, rendering
+included, and checks that both produce the same JSON.
+"""
+import json
+import math
+import random
+import statistics
+import time
+from collections import Counter
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser, UserProfile
+from accounts.serializers import UserTokenObtainPairSerializer
+from feed import fast_serializers, page_cache
+from feed.models import Comment, Like, Post
+from feed.prefetch import prefetch_posts
+from feed.serializers import CommentSerializer, LikeSerializer, PostSerializer
+from social_media_assignment.renderers import FastJSONRenderer
+
+SCENARIOS = ('feed_list', 'feed_list_cached', 'post_detail', 'like', 'comment', 'follow', 'login')
+# The benchmark runs in one process, the local memory cache can hold pages.
+SCENARIO_SETTINGS = {
+    'feed_list': {'FEED_PAGE_CACHE_TIMEOUT': 0},
+    'feed_list_cached': {'FEED_PAGE_CACHE_TIMEOUT': page_cache.DEFAULT_TIMEOUT},
+}
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(ordered, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def summarize(values, digits=2):
+    ordered = sorted(values)
+    summary = {'min': ordered[0], 'mean': statistics.fmean(ordered), 'max': ordered[-1]}
+    summary.update({f'p{pct}': percentile(ordered, pct) for pct in PERCENTILES})
+    return {key: round(value, digits) for key, value in summary.items()}
+
+
+def _walk_plan(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from _walk_plan(child)
+
+
+def explain(queries):
+    """
+    Return ``(rows scanned, [fully scanned tables])`` of the SELECTs in
+    ``queries``, ``(None, [])`` on databases that can't tell.
+    """
+    rows, full_scans, table_sizes = 0, [], {}
+    tables = set(connection.introspection.table_names())
+    with connection.cursor() as cursor:
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            if connection.vendor == 'postgresql':
+                cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql)
+                plan = cursor.fetchone()[0]
+                plan = json.loads(plan) if isinstance(plan, str) else plan
+                for node in _walk_plan(plan[0]['Plan']):
+                    if node['Node Type'].endswith('Scan'):
+                        rows += node.get('Actual Rows', 0) * node.get('Actual Loops', 1)
+                    if node['Node Type'] == 'Seq Scan':
+                        full_scans.append(node['Relation Name'])
+            elif connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                for *_, detail in cursor.fetchall():
+                    words = detail.split()
+                    if words[0] != 'SCAN' or 'USING' in words or words[1] not in tables:
+                        continue
+                    table = words[1]
+                    if table not in table_sizes:
+                        cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+                        table_sizes[table] = cursor.fetchone()[0]
+                    rows += table_sizes[table]
+                    full_scans.append(table)
+            else:
+                return None, []
+    return rows, sorted(set(full_scans))
+
+
+class Benchmark:
+    def __init__(self, prefix='bench', password='benchmark', sample=50, seed=1):
+        self.rng = random.Random(seed)
+        self.password = password
+        # Primary keys are random UUIDs, ordering by them is a reproducible sample.
+        users = CustomUser.objects.filter(username__startswith=prefix, profile__isnull=False).order_by('pk')
+        self.users = list(users[:sample])
+        self.post_ids = list(Post.objects.order_by('pk').values_list('pk', flat=True)[:sample * 20])
+        if len(self.users) < 2 or not self.post_ids:
+            raise ValueError(f'Not enough data, run generate_dataset with --prefix {prefix} first.')
+        self.tokens = {
+            user.pk: f'Bearer {UserTokenObtainPairSerializer.get_token(user).access_token}' for user in self.users
+        }
+        self.client = APIClient(raise_request_exception=False)
+
+    def run(self, scenarios=SCENARIOS, iterations=100, warmup=5):
+        return {
+            'database': connection.vendor,
+            'users': len(self.users),
+            'posts': len(self.post_ids),
+            'scenarios': {name: self.run_scenario(name, iterations, warmup) for name in scenarios},
+        }
+
+    def run_scenario(self, name, iterations, warmup):
+        prepare = getattr(self, f'prepare_{name}')
+        latencies, query_counts, statuses = [], [], Counter()
+        rows_scanned, full_scans = None, []
+        with override_settings(**SCENARIO_SETTINGS.get(name, {})):
+            for index in range(warmup + iterations):
+                user = self.users[index % len(self.users)]
+                method, path, data, headers, undo = prepare(user, index)
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = getattr(self.client, method)(path, data, format='json', **headers)
+                    elapsed = time.perf_counter() - start
+                if undo is not None:
+                    undo(response)
+                if index < warmup:
+                    continue
+                latencies.append(elapsed * 1000)
+                query_counts.append(len(captured))
+                statuses[response.status_code] += 1
+                if index == warmup:
+                    rows_scanned, full_scans = explain(captured.captured_queries)
+        return {
+            'iterations': iterations,
+            'errors': sum(count for code, count in statuses.items() if code >= 400),
+            'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+            'latency_ms': summarize(latencies),
+            'queries': summarize(query_counts),
+            'rows_scanned': rows_scanned,
+            'full_scans': full_scans,
+        }
+
+    def auth(self, user):
+        return {'HTTP_AUTHORIZATION': self.tokens[user.pk]}
+
+    def prepare_feed_list(self, user, index):
+        return 'get', '/feed/posts/', None, self.auth(user), None
+
+    def prepare_feed_list_cached(self, user, index):
+        self.client.get('/feed/posts/', **self.auth(user))
+        return self.prepare_feed_list(user, index)
+
+    def prepare_post_detail(self, user, index):
+        return 'get', f'/feed/posts/{self.rng.choice(self.post_ids)}/', None, self.auth(user), None
+
+    def prepare_like(self, user, index):
+        liked = set(Like.objects.filter(user=user, post_id__in=self.post_ids).values_list('post_id', flat=True))
+        post_id = self.rng.choice([post_id for post_id in self.post_ids if post_id not in liked])
+
+        def undo(response):
+            for like in Like.objects.filter(user=user, post_id=post_id):
+                like.delete()
+        return 'post', '/feed/like/', {'user': str(user.pk), 'post': str(post_id)}, self.auth(user), undo
+
+    def prepare_comment(self, user, index):
+        def undo(response):
+            if response.status_code == 201:
+                Comment.objects.get(pk=response.data['id']).delete()
+        data = {'user': str(user.pk), 'post': str(self.rng.choice(self.post_ids)), 'content': 'benchmark comment'}
+        return 'post', '/feed/comment/', data, self.auth(user), undo
+
+    def prepare_follow(self, user, index):
+        following = set(UserProfile.followers.through.objects.filter(
+            customuser_id=user.pk).values_list('userprofile__user_id', flat=True))
+        target = self.rng.choice([other for other in self.users if other.pk != user.pk and other.pk not in following])
+
+        def undo(response):
+            target.profile.followers.remove(user)
+        return 'post', f'/accounts/follow/{target.pk}/', None, self.auth(user), undo
+
+    def prepare_login(self, user, index):
+        # A different client address every time keeps the per-IP throttle out
+        # of the way. The per-account one allows 10 logins a minute per user.
+        headers = {'REMOTE_ADDR': f'10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}'}
+        return 'post', '/accounts/token/', {'username_or_email': user.username, 'password': self.password}, \
+            headers, None
+
+
+def time_calls(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, summarize(timings, digits=3)
+
+
+def benchmark_serializers(rows=50, repeat=20):
+    """
+    Serialize and render ``rows`` posts (with their recent comments, counts
+    and media), comments and likes both ways, ``repeat`` times each.
+    """
+    posts = prefetch_posts(list(Post.objects.order_by('-created_date', '-id')[:rows]))
+    cases = {
+        'post': (PostSerializer, posts),
+        'comment': (CommentSerializer, list(Comment.objects.order_by('-created_date', '-id')[:rows])),
+        'like': (LikeSerializer, list(Like.objects.order_by('-created_date', '-id')[:rows])),
+    }
+    results = {}
+    for name, (serializer_class, instances) in cases.items():
+        with override_settings(FEED_FAST_SERIALIZERS=False):
+            drf, drf_timings = time_calls(
+                lambda: JSONRenderer().render(serializer_class(instances, many=True).data), repeat)
+        fast, fast_timings = time_calls(
+            lambda: FastJSONRenderer().render(fast_serializers.serialize(serializer_class, instances)), repeat)
+        results[name] = {
+            'rows': len(instances),
+            'drf_ms': drf_timings,
+            'fast_ms': fast_timings,
+            'speedup': round(drf_timings['p50'] / fast_timings['p50'], 2) if fast_timings['p50'] else None,
+            'identical_json': drf == fast,
+        }
+    return results
+
+
+def compare(baseline, results, tolerance):
+    """
+    Return the regressions of ``results`` against ``baseline``: scenarios whose
+    p95 latency grew more than ``tolerance`` times or that run more queries.
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        before, after = previous['latency_ms']['p95'], current['latency_ms']['p95']
+        if before and after > before * tolerance:
+            regressions.append(f'{name}: p95 latency {before}ms -> {after}ms')
+        before, after = previous['queries']['max'], current['queries']['max']
+        if after > before:
+            regressions.append(f'{name}: up to {after} queries per request, was {before}')
+    return regressions
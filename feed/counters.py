@@ -0,0 +1,97 @@
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from feed.models import Comment, Like, Post, PostCounterShard
+
+COUNTER_FIELDS = ('like_count', 'comment_count')
+
+
+def get_shard_count():
+    return getattr(settings, 'FEED_COUNTER_SHARDS', 8)
+
+
+def increment(post_id, field, delta=1):
+    """
+    Add ``delta`` to the ``field`` counter of a post by bumping one randomly
+    picked shard row instead of the post row itself.
+    """
+    shard = random.randrange(get_shard_count())
+    shards = PostCounterShard.objects.filter(post_id=post_id, shard=shard)
+    if shards.update(**{field: F(field) + delta}):
+        return
+    if not Post.objects.filter(pk=post_id).exists():
+        return
+    try:
+        with transaction.atomic():
+            PostCounterShard.objects.create(post_id=post_id, shard=shard, **{field: delta})
+    except IntegrityError:
+        # A concurrent increment created the shard first.
+        shards.update(**{field: F(field) + delta})
+
+
+def increment_many(field, deltas):
+    """
+    Apply ``{post_id: delta}`` to the ``field`` counters, e.g. after a bulk insert.
+    """
+    for post_id, delta in deltas.items():
+        if delta:
+            increment(post_id, field, delta)
+
+
+def pending_counts_queryset(posts):
+    return PostCounterShard.objects.filter(post__in=posts).values('post').annotate(
+        like_count=Sum('like_count'), comment_count=Sum('comment_count'))
+
+
+def set_pending_counts(posts, rows):
+    pending = {row['post']: row for row in rows}
+    for post in posts:
+        post.pending_counts = pending.get(post.pk, {})
+    return posts
+
+
+def attach_pending_counts(posts):
+    """
+    Load the shard deltas of a page of posts with a single query and store them
+    on ``post.pending_counts`` for ``get_count``.
+    """
+    return set_pending_counts(posts, pending_counts_queryset(posts))
+
+
+async def aattach_pending_counts(posts):
+    return set_pending_counts(posts, [row async for row in pending_counts_queryset(posts)])
+
+
+def get_count(post, field):
+    """
+    Return the current value of a post counter: the folded value on the post
+    plus the deltas still waiting in its shards.
+    """
+    if not hasattr(post, 'pending_counts'):
+        attach_pending_counts([post])
+    return getattr(post, field) + (post.pending_counts.get(field) or 0)
+
+
+def reconcile(post_ids):
+    """
+    Recount likes and comments of ``post_ids`` from the source tables, store
+    the result on the posts and drop their shards. Fixes any drift left by
+    lost increments or out-of-band deletes.
+    """
+    likes = Like.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+        count=Count('id')).values('count')
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+        count=Count('id')).values('count')
+    with transaction.atomic():
+        # Lock the shards first so increments that commit while we recount
+        # land in a fresh shard instead of being wiped below.
+        list(PostCounterShard.objects.select_for_update().filter(post_id__in=post_ids).values_list('pk'))
+        Post.objects.filter(pk__in=post_ids).update(
+            like_count=Coalesce(Subquery(likes), 0),
+            comment_count=Coalesce(Subquery(comments), 0),
+        )
+        PostCounterShard.objects.filter(post_id__in=post_ids).delete()
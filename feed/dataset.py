@@ -0,0 +1,192 @@
+"""
+Reproducible synthetic dataset for ``benchmark_feed``.
+
+Users get a power-law follower graph: every user follows a Pareto distributed
+number of accounts, picked with probability proportional to
+``rank ** -exponent`` of a seeded popularity ranking, so a few accounts end up
+with most of the followers. Posts, likes and comments are spread over the
+``days`` days before ``epoch`` and favour popular authors.
+
+Rows are written with ``bulk_create``, which skips the model signals, so the
+timelines, counters and social graph caches are rebuilt at the end. The same
+seed and parameters always produce the same ids and rows. Their dates are
+relative to ``epoch``, the current time unless one is given, so only runs
+with the same ``epoch`` produce identical timestamps.
+"""
+import bisect
+import itertools
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from accounts import social_graph, suggestions
+from accounts.models import CustomUser, UserProfile
+from feed import counters
+from feed.models import Comment, Like, Post
+from feed.timeline import get_timeline_store
+
+WORDS = (
+    'coffee morning running weekend travel photo sunset city music concert friends family dinner recipe garden '
+    'book movie coding python django release launch team meeting holiday beach mountain hiking snow winter '
+    'summer spring autumn football match game night study exam project idea design startup market news'
+).split()
+
+
+DEFAULT_DATASET = {
+    'users': 1000,
+    'avg_following': 50,
+    'exponent': 1.1,
+    'posts_per_user': 10.0,
+    'likes_per_post': 5.0,
+    'comments_per_post': 1.0,
+    'days': 30,
+    'seed': 1,
+    'epoch': None,
+    'prefix': 'bench',
+    'password': 'benchmark',
+    'batch_size': 1000,
+}
+
+
+class DatasetGenerator:
+    def __init__(self, log=None, **options):
+        self.options = {**DEFAULT_DATASET, **options}
+        self.rng = random.Random(self.options['seed'])
+        self.now = self.options['epoch'] or timezone.now()
+        self.log = log or (lambda message: None)
+
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def text(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words))
+
+    def timestamp(self, after=None):
+        start = after or self.now - timedelta(days=self.options['days'])
+        return start + (self.now - start) * self.rng.random()
+
+    def popularity(self, count):
+        """
+        Cumulative ``rank ** -exponent`` weights of a seeded ranking of
+        ``count`` items, see ``pick``.
+        """
+        ranks = list(range(1, count + 1))
+        self.rng.shuffle(ranks)
+        return list(itertools.accumulate(rank ** -self.options['exponent'] for rank in ranks))
+
+    def pick(self, population, cum_weights):
+        return population[bisect.bisect(cum_weights, self.rng.random() * cum_weights[-1])]
+
+    def out_degree(self, count):
+        # Pareto(2) has mean 2, scale it to the requested average.
+        degree = int(self.options['avg_following'] / 2 * self.rng.paretovariate(2))
+        return min(degree, count - 1)
+
+    def generate(self):
+        options = self.options
+        with transaction.atomic():
+            users = self.create_users()
+            user_ids = [user.pk for user in users]
+            weights = self.popularity(len(user_ids))
+            edges = self.create_follows(user_ids, weights)
+            posts = self.create_posts(user_ids, weights)
+            likes = self.create_likes(user_ids, posts)
+            comments = self.create_comments(user_ids, posts)
+
+        self.log('Rebuilding caches, counters and timelines')
+        social_graph.invalidate(user_ids)
+        suggestions.invalidate(user_ids)
+        post_ids = [post.pk for post in posts]
+        for start in range(0, len(post_ids), options['batch_size']):
+            counters.reconcile(post_ids[start:start + options['batch_size']])
+        store = get_timeline_store()
+        for user_id in user_ids:
+            store.rebuild(user_id)
+        return {
+            'users': len(user_ids), 'follows': edges, 'posts': len(posts), 'likes': likes, 'comments': comments,
+            'options': options,
+        }
+
+    def create_users(self):
+        options = self.options
+        prefix = options['prefix']
+        usernames = [f'{prefix}{index:07d}' for index in range(options['users'])]
+        if CustomUser.objects.filter(username__in=usernames[:1]).exists():
+            raise ValueError(f'Users prefixed "{prefix}" already exist, pick another prefix.')
+        # One hash for everybody, hashing once per user would dominate the run.
+        password = make_password(options['password'])
+        users = [
+            CustomUser(id=self.uuid(), username=username, email=f'{username}@example.com', password=password)
+            for username in usernames
+        ]
+        CustomUser.objects.bulk_create(users, batch_size=options['batch_size'])
+        UserProfile.objects.bulk_create([
+            UserProfile(id=self.uuid(), user=user, first_name=self.rng.choice(WORDS).title(),
+                        last_name=self.rng.choice(WORDS).title())
+            for user in users
+        ], batch_size=options['batch_size'])
+        self.log(f'Created {len(users)} users')
+        return users
+
+    def create_follows(self, user_ids, weights):
+        profiles = dict(UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', 'id'))
+        through = UserProfile.followers.through
+        rows = []
+        for follower in user_ids:
+            followees = {self.pick(user_ids, weights) for _ in range(self.out_degree(len(user_ids)))}
+            followees.discard(follower)
+            rows.extend(through(customuser_id=follower, userprofile_id=profiles[followee])
+                        for followee in sorted(followees))
+        through.objects.bulk_create(rows, batch_size=self.options['batch_size'])
+        self.log(f'Created {len(rows)} follow edges')
+        return len(rows)
+
+    def create_posts(self, user_ids, weights):
+        # Popular accounts post more, the average stays at posts_per_user.
+        total = round(self.options['posts_per_user'] * len(user_ids))
+        posts = [
+            Post(id=self.uuid(), user_id=self.pick(user_ids, weights), content=self.text(self.rng.randint(5, 30)))
+            for _ in range(total)
+        ]
+        return self.bulk_create_dated(Post, posts, lambda post: self.timestamp())
+
+    def create_likes(self, user_ids, posts):
+        if not posts:
+            return 0
+        post_weights = self.popularity(len(posts))
+        pairs = {
+            (self.rng.choice(user_ids), self.pick(posts, post_weights))
+            for _ in range(round(self.options['likes_per_post'] * len(posts)))
+        }
+        likes = [Like(id=self.uuid(), user_id=user_id, post=post)
+                 for user_id, post in sorted(pairs, key=lambda pair: (str(pair[0]), str(pair[1].pk)))]
+        return len(self.bulk_create_dated(Like, likes, lambda like: self.timestamp(like.post.created_date)))
+
+    def create_comments(self, user_ids, posts):
+        if not posts:
+            return 0
+        post_weights = self.popularity(len(posts))
+        comments = [
+            Comment(id=self.uuid(), user_id=self.rng.choice(user_ids), post=self.pick(posts, post_weights),
+                    content=self.text(self.rng.randint(2, 15)))
+            for _ in range(round(self.options['comments_per_post'] * len(posts)))
+        ]
+        return len(self.bulk_create_dated(Comment, comments,
+                                          lambda comment: self.timestamp(comment.post.created_date)))
+
+    def bulk_create_dated(self, model, objs, get_date):
+        """
+        ``bulk_create`` then backdate ``created_date``, which ``auto_now_add``
+        overwrites on insert.
+        """
+        batch_size = self.options['batch_size']
+        model.objects.bulk_create(objs, batch_size=batch_size)
+        for obj in objs:
+            obj.created_date = get_date(obj)
+        model.objects.bulk_update(objs, ['created_date'], batch_size=batch_size)
+        self.log(f'Created {len(objs)} {model._meta.verbose_name_plural}')
+        return objs
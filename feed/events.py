@@ -0,0 +1,163 @@
+"""
+In-process pub/sub hub behind the ``/feed/events/`` server-sent events stream.
+
+Every connection subscribes to the users whose activity shows up in the
+viewer's home feed (the viewer and their ``profile.followers``). Model signals
+publish new posts, likes and comments to the topic of the acting user once the
+transaction commits. Each message is encoded once and handed to the event loop
+of every subscribed connection.
+
+Connections buffer at most ``FEED_EVENTS_QUEUE_SIZE`` messages. A client that
+falls behind has its backlog dropped and receives a single ``resync`` event
+telling it to refetch ``/feed/posts/``, so a slow reader never grows memory or
+holds back other connections.
+
+The hub only sees events of its own process. With several worker processes
+each connection only hears about writes made by the process serving it, so
+deployments with more than one worker need a shared broker instead.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+RESYNC = 'event: resync\ndata: {}\n\n'
+
+
+def get_queue_size():
+    return getattr(settings, 'FEED_EVENTS_QUEUE_SIZE', 100)
+
+
+def encode_event(event, data):
+    return f'id: {uuid4()}\nevent: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+class Subscription:
+    """
+    One SSE connection: the topics it listens to and its bounded queue.
+    ``deliver`` and ``get`` run on the connection's event loop.
+    """
+
+    def __init__(self, user_id, topics, loop, maxsize):
+        self.user_id = user_id
+        self.topics = set(topics)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.resync_pending = False
+        self.dropped = 0
+
+    def deliver(self, message):
+        if self.resync_pending:
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize() + 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            self.resync_pending = True
+
+    async def get(self):
+        message = await self.queue.get()
+        if message is RESYNC:
+            self.resync_pending = False
+        return message
+
+
+class EventHub:
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._by_user = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, topics, maxsize=None):
+        """
+        Register a connection, must be called from its event loop.
+        """
+        subscription = Subscription(user_id, topics, asyncio.get_running_loop(), maxsize or get_queue_size())
+        with self._lock:
+            self._by_user[user_id].add(subscription)
+            for topic in subscription.topics:
+                self._subscriptions[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._discard(self._by_user, subscription.user_id, subscription)
+            for topic in subscription.topics:
+                self._discard(self._subscriptions, topic, subscription)
+
+    def add_topics(self, edges):
+        """
+        Start delivering ``source_id``'s events to the open connections of
+        ``owner_id`` for every ``(owner_id, source_id)`` pair.
+        """
+        with self._lock:
+            for owner, source in edges:
+                for subscription in self._by_user.get(owner, ()):
+                    subscription.topics.add(source)
+                    self._subscriptions[source].add(subscription)
+
+    def remove_topics(self, edges):
+        with self._lock:
+            for owner, source in edges:
+                if owner == source:
+                    continue
+                for subscription in self._by_user.get(owner, ()):
+                    subscription.topics.discard(source)
+                    self._discard(self._subscriptions, source, subscription)
+
+    def publish(self, topic, message):
+        """
+        Queue ``message`` on every connection subscribed to ``topic``. Safe to
+        call from any thread.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(topic, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # The connection's loop is closed, it unsubscribes on its way out.
+                pass
+        return len(subscriptions)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._by_user.values())
+
+    @staticmethod
+    def _discard(index, key, subscription):
+        subscriptions = index.get(key)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del index[key]
+
+
+hub = EventHub()
+
+
+def publish_post(post):
+    hub.publish(post.user_id, encode_event('post', {
+        'id': post.pk, 'user': post.user_id, 'content': post.content, 'created_date': post.created_date,
+    }))
+
+
+def publish_like(like):
+    hub.publish(like.user_id, encode_event('like', {
+        'id': like.pk, 'user': like.user_id, 'post': like.post_id, 'created_date': like.created_date,
+    }))
+
+
+def publish_comment(comment):
+    hub.publish(comment.user_id, encode_event('comment', {
+        'id': comment.pk, 'user': comment.user_id, 'post': comment.post_id, 'content': comment.content,
+        'created_date': comment.created_date,
+    }))
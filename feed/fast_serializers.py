@@ -0,0 +1,247 @@
+"""
+Read-only fast path for the serializers of the hot read endpoints.
+
+``compile_serializer`` inspects a ``ModelSerializer`` once and turns every
+readable field into a small converter function, so serializing an object is
+a single dict comprehension over precomputed ``(name, converter)`` pairs.
+Fields are not instantiated, bound or looked up per object and plain dicts
+are built instead of ``OrderedDict``s. Converters read model instances (or
+any object with the model's attribute names, e.g. ``__slots__`` records) or,
+with ``source=VALUES``, ``.values()`` rows keyed by ``attname``.
+
+Simple model fields (UUIDs, datetimes, text, integers, choices, files and
+primary key relations) are converted inline to the same values the DRF fields
+return. ``SerializerMethodField``s call the serializer's method and any other field
+goes through its own ``to_representation``, both need model instances.
+
+Views opt in with ``FastReadSerializerMixin``; ``FEED_FAST_SERIALIZERS``
+switches the fast path off. Views whose serializer only has model fields, like
+the comment list, set ``fast_serializer_source = VALUES`` and query
+``.values(*value_names(serializer_class))``, which skips building model
+instances. Writes always use the DRF serializers.
+"""
+import datetime
+import operator
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.utils import timezone
+from rest_framework import fields, relations, serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import api_settings
+
+from social_media_assignment.profiler import current_profile
+
+ATTRIBUTES = 'attributes'
+VALUES = 'values'
+
+
+def is_enabled():
+    return getattr(settings, 'FEED_FAST_SERIALIZERS', True)
+
+
+class State:
+    """
+    What the converters need from one ``serialize`` call.
+    """
+
+    def __init__(self, serializer_class, context):
+        self.context = context
+        self.request = context.get('request')
+        self.timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+        self._serializer_class = serializer_class
+        self._serializer = None
+
+    @property
+    def serializer(self):
+        if self._serializer is None:
+            self._serializer = self._serializer_class(context=self.context)
+        return self._serializer
+
+
+def _nullable(get, convert):
+    def converter(obj, state):
+        value = get(obj)
+        return None if value is None else convert(value, state)
+    return converter
+
+
+def _string(value, state):
+    return str(value)
+
+
+def _integer(value, state):
+    return int(value)
+
+
+def _datetime(value, state):
+    if isinstance(value, str):
+        return value
+    if state.timezone is not None:
+        if timezone.is_aware(value):
+            value = value.astimezone(state.timezone)
+        else:
+            value = timezone.make_aware(value, state.timezone)
+    elif timezone.is_aware(value):
+        value = timezone.make_naive(value, datetime.timezone.utc)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _choice(choices):
+    def convert(value, state):
+        return value if value == '' else choices.get(str(value), value)
+    return convert
+
+
+def _file(get, storage=None):
+    def converter(obj, state):
+        value = get(obj)
+        if not value:
+            return None
+        url = storage.url(value) if storage is not None else value.url
+        return state.request.build_absolute_uri(url) if state.request is not None else url
+    return converter
+
+
+def _model_field(field, model):
+    if len(field.source_attrs) != 1:
+        return None
+    try:
+        model_field = model._meta.get_field(field.source_attrs[0])
+    except FieldDoesNotExist:
+        return None
+    return model_field if model_field.concrete else None
+
+
+def compile_field(field, model, source):
+    """
+    Return a ``converter(obj, state)`` producing ``field``'s representation.
+    """
+    if isinstance(field, serializers.SerializerMethodField) and source != VALUES:
+        method_name = field.method_name
+        return lambda obj, state: getattr(state.serializer, method_name)(obj)
+
+    model_field = _model_field(field, model)
+    if model_field is not None:
+        get = operator.itemgetter(model_field.attname) if source == VALUES else operator.attrgetter(
+            model_field.attname)
+        field_type = type(field)
+        if field_type is relations.PrimaryKeyRelatedField and field.pk_field is None and model_field.is_relation:
+            # The related model's pk, as DRF returns it.
+            return lambda obj, state: get(obj)
+        if field_type is fields.UUIDField and field.uuid_format == 'hex_verbose':
+            return _nullable(get, _string)
+        if field_type in (fields.CharField, fields.EmailField, fields.SlugField, fields.URLField):
+            return _nullable(get, _string)
+        if field_type is fields.IntegerField:
+            return _nullable(get, _integer)
+        if field_type is fields.ChoiceField:
+            return _nullable(get, _choice(field.choice_strings_to_values))
+        if field_type is fields.DateTimeField and not hasattr(field, 'timezone') and getattr(
+                field, 'format', api_settings.DATETIME_FORMAT) == fields.ISO_8601:
+            return _nullable(get, _datetime)
+        if field_type is fields.FileField and getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+            return _file(get, model_field.storage if source == VALUES else None)
+
+    if source == VALUES:
+        raise TypeError(f'{field.field_name} ({type(field).__name__}) can only be serialized from model instances.')
+
+    def converter(obj, state):
+        try:
+            attribute = field.get_attribute(obj)
+        except SkipField:
+            return None
+        check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+        return None if check_for_none is None else field.to_representation(attribute)
+    return converter
+
+
+class CompiledSerializer:
+    def __init__(self, serializer_class, source=ATTRIBUTES):
+        self.serializer_class = serializer_class
+        model = serializer_class.Meta.model
+        readable_fields = list(serializer_class()._readable_fields)
+        self.fields = tuple((field.field_name, compile_field(field, model, source)) for field in readable_fields)
+        # The .values() a VALUES serializer reads, compiling checked they exist.
+        self.value_names = tuple(
+            _model_field(field, model).attname for field in readable_fields) if source == VALUES else None
+
+    def serialize(self, instances, context=None, many=True):
+        state = State(self.serializer_class, context or {})
+        if current_profile.get() is not None:
+            serialize_one = self.profiled(state, current_profile.get())
+            return [serialize_one(obj) for obj in instances] if many else serialize_one(instances)
+        converters = self.fields
+        if not many:
+            return {name: convert(instances, state) for name, convert in converters}
+        return [{name: convert(obj, state) for name, convert in converters} for obj in instances]
+
+    def profiled(self, state, profile):
+        """
+        Serialize one object, timing every field for the slow request profiler.
+        """
+        prefix = self.serializer_class.__name__
+
+        def serialize_one(obj):
+            start = time.perf_counter()
+            ret = {}
+            for name, convert in self.fields:
+                field_start = time.perf_counter()
+                ret[name] = convert(obj, state)
+                profile.time_serializer(f'{prefix}.{name}', time.perf_counter() - field_start)
+            profile.time_serializer(prefix, time.perf_counter() - start)
+            return ret
+        return serialize_one
+
+
+@lru_cache(maxsize=None)
+def compile_serializer(serializer_class, source=ATTRIBUTES):
+    return CompiledSerializer(serializer_class, source)
+
+
+def serialize(serializer_class, instances, context=None, many=True, source=ATTRIBUTES):
+    return compile_serializer(serializer_class, source).serialize(instances, context, many)
+
+
+def value_names(serializer_class):
+    """
+    The ``.values()`` names to query for ``serializer_class`` with ``source=VALUES``.
+    """
+    return compile_serializer(serializer_class, VALUES).value_names
+
+
+class FastReadSerializer:
+    """
+    Stand-in for a DRF serializer that is only read from.
+    """
+
+    def __init__(self, serializer_class, instance, many=False, context=None, source=ATTRIBUTES):
+        self.serializer_class = serializer_class
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+        self.source = source
+
+    @property
+    def data(self):
+        return serialize(self.serializer_class, self.instance, self.context, self.many, self.source)
+
+
+class FastReadSerializerMixin:
+    """
+    Serialize objects with the compiled serializer when a view only reads
+    them. Serializers that validate data are left to DRF.
+    """
+    fast_serializer_source = ATTRIBUTES
+
+    def get_serializer(self, *args, **kwargs):
+        if not is_enabled() or not args or 'data' in kwargs or set(kwargs) - {'many'}:
+            return super().get_serializer(*args, **kwargs)
+        return FastReadSerializer(self.get_serializer_class(), args[0], kwargs.get('many', False),
+                                  self.get_serializer_context(), self.fast_serializer_source)
@@ -0,0 +1,246 @@
+import atexit
+import glob
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from uuid import UUID, uuid4
+
+from django.conf import settings
+from django.core.files import locks
+from django.db import close_old_connections
+
+from accounts.models import CustomUser
+from feed import counters, events, page_cache, ranking
+from feed.models import Like, Post
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIKE_BUFFER = {
+    # Seconds between background flushes, ``None`` only flushes on MAX_BATCH.
+    'FLUSH_INTERVAL': 0.005,
+    'MAX_BATCH': 500,
+    # Path prefix of the append-only files every accepted like is written to
+    # before it is acknowledged. Each process journals to its own locked
+    # ``<JOURNAL>.<pid>-<id>`` file and on start up replays and flushes the
+    # files of processes that died. ``None`` keeps pending likes in memory
+    # only, so they are lost if the process dies.
+    'JOURNAL': None,
+    # fsync the journal on every like. Survives machine crashes, costs a disk flush per request.
+    'FSYNC': False,
+}
+
+
+class LikeBuffer:
+    """
+    Write-behind buffer for likes.
+
+    Likes are queued in memory and written by ``flush`` with one
+    ``bulk_create(ignore_conflicts=True)``, either every ``flush_interval``
+    seconds from a background thread or as soon as ``max_batch`` likes are
+    pending.
+
+    With a ``journal`` every accepted like is also appended to a file of this
+    buffer's own, locked for as long as the buffer is open. Journals nobody
+    holds a lock on belong to dead processes: they are replayed and flushed
+    when a buffer starts.
+    """
+
+    def __init__(self, flush_interval=0.005, max_batch=500, journal=None, fsync=False):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.journal = journal
+        self.fsync = fsync
+        self._journal_file = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.stats = {
+            'accepted': 0,
+            'flushes': 0,
+            'written': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_flush_seconds': 0.0,
+            'flush_seconds_total': 0.0,
+        }
+        if journal:
+            self._open_journal()
+            if self._replay_journals():
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception('Flushing replayed likes failed, retrying on the next flush')
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULT_LIKE_BUFFER, **getattr(settings, 'FEED_LIKE_BUFFER', {})}
+        return cls(flush_interval=options['FLUSH_INTERVAL'], max_batch=options['MAX_BATCH'],
+                   journal=options['JOURNAL'], fsync=options['FSYNC'])
+
+    def add(self, user_id, post_id):
+        with self._lock:
+            self._pending.append((user_id, post_id))
+            if self.journal:
+                self._append_journal(user_id, post_id)
+            self.stats['accepted'] += 1
+            pending = len(self._pending)
+
+        if self.flush_interval is None:
+            if pending >= self.max_batch:
+                self.flush()
+            return
+        self._ensure_thread()
+        if pending >= self.max_batch:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """
+        Write every pending like and return how many rows were inserted.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            try:
+                written = self._write(batch)
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = batch
+                raise
+            if self.journal:
+                self._truncate_journal()
+            elapsed = time.monotonic() - started
+
+            self.stats['flushes'] += 1
+            self.stats['written'] += written
+            self.stats['last_batch_size'] = len(batch)
+            self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(batch))
+            self.stats['last_flush_seconds'] = elapsed
+            self.stats['flush_seconds_total'] += elapsed
+            logger.debug('Flushed %s buffered likes (%s new) in %.2fms', len(batch), written, elapsed * 1000)
+            return written
+
+    def _write(self, batch):
+        pairs = set(batch)
+        post_ids = {post_id for _, post_id in pairs}
+        user_ids = {user_id for user_id, _ in pairs}
+        live_posts = set(Post.objects.filter(pk__in=post_ids).values_list('pk', flat=True))
+        live_users = set(CustomUser.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        existing = set(Like.objects.filter(post_id__in=live_posts, user_id__in=live_users).values_list(
+            'user_id', 'post_id'))
+
+        likes = [
+            Like(user_id=user_id, post_id=post_id)
+            for user_id, post_id in pairs
+            if post_id in live_posts and user_id in live_users and (user_id, post_id) not in existing
+        ]
+        Like.objects.bulk_create(likes, ignore_conflicts=True)
+        counters.increment_many('like_count', Counter(like.post_id for like in likes))
+        page_cache.bump(page_cache.POST, {like.post_id for like in likes})
+        for like in likes:
+            ranking.record_engagement(like.user_id, like.post_id, 'like_count')
+            events.publish_like(like)
+        return len(likes)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='like-buffer-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing buffered likes failed, retrying on the next tick')
+
+    def close(self):
+        """
+        Release this buffer's journal, pending likes are left in it for the
+        next buffer to replay.
+        """
+        if self._journal_file is not None:
+            locks.unlock(self._journal_file)
+            self._journal_file.close()
+            self._journal_file = None
+
+    def _open_journal(self):
+        path = f'{self.journal}.{os.getpid()}-{uuid4().hex[:8]}'
+        self._journal_file = open(path, 'a+')
+        locks.lock(self._journal_file, locks.LOCK_EX)
+
+    def _write_journal(self, pairs):
+        self._journal_file.writelines(f'{user_id} {post_id}\n' for user_id, post_id in pairs)
+        self._journal_file.flush()
+        if self.fsync:
+            os.fsync(self._journal_file.fileno())
+
+    def _append_journal(self, user_id, post_id):
+        self._write_journal([(user_id, post_id)])
+
+    def _truncate_journal(self):
+        # Likes accepted while the batch was being written are still pending
+        # and have to survive the truncate.
+        with self._lock:
+            self._journal_file.seek(0)
+            self._journal_file.truncate()
+            self._write_journal(self._pending)
+
+    def _replay_journals(self):
+        """
+        Take over the journals of dead processes and return how many likes
+        they held.
+        """
+        replayed = 0
+        for path in sorted(glob.glob(glob.escape(self.journal) + '.*')):
+            if path == self._journal_file.name:
+                continue
+            with open(path, 'r+') as journal:
+                if not locks.lock(journal, locks.LOCK_EX | locks.LOCK_NB):
+                    continue
+                pairs = []
+                for line in journal:
+                    try:
+                        user_id, post_id = line.split()
+                        pairs.append((UUID(user_id), UUID(post_id)))
+                    except ValueError:
+                        logger.warning('Skipping malformed like journal line %r', line)
+                # Moved to this buffer's journal before the dead one is removed.
+                with self._lock:
+                    self._pending.extend(pairs)
+                    self._write_journal(pairs)
+                os.remove(path)
+                replayed += len(pairs)
+        return replayed
+
+
+_like_buffer = None
+_like_buffer_lock = threading.Lock()
+
+
+def get_like_buffer():
+    global _like_buffer
+    if _like_buffer is None:
+        with _like_buffer_lock:
+            if _like_buffer is None:
+                _like_buffer = LikeBuffer.from_settings()
+                atexit.register(_like_buffer.close)
+                atexit.register(_like_buffer.flush)
+    return _like_buffer
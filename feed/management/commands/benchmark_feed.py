@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from feed.benchmark import SCENARIOS, Benchmark, compare
+
+
+class Command(BaseCommand):
+    help = ('Measure latency percentiles, query counts and rows scanned of the feed, post detail, like, comment, '
+            'follow and login endpoints against a generate_dataset dataset, and report them as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=SCENARIOS,
+                            help='Run only this scenario. May be repeated.')
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--sample', type=int, default=50, help='Number of generated users acting in turn.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--prefix', default='bench', help='Username prefix given to generate_dataset.')
+        parser.add_argument('--password', default='benchmark', help='Password given to generate_dataset.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument('--baseline', help='JSON report of an earlier run to check for regressions.')
+        parser.add_argument('--tolerance', type=float, default=1.2,
+                            help='Allowed p95 latency growth against the baseline, as a factor.')
+
+    def handle(self, *args, **options):
+        try:
+            benchmark = Benchmark(options['prefix'], options['password'], options['sample'], options['seed'])
+        except ValueError as e:
+            raise CommandError(e)
+        results = benchmark.run(options['scenarios'] or SCENARIOS, options['iterations'], options['warmup'])
+
+        report = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                regressions = compare(json.load(f), results, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+            self.stderr.write(self.style.SUCCESS('No regressions against the baseline.'))
@@ -0,0 +1,20 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from feed.benchmark import benchmark_serializers
+
+
+class Command(BaseCommand):
+    help = 'Compare the DRF and the compiled read-only serializers of posts, comments and likes, rendering included.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50, help='Objects serialized per call, i.e. the page size.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        results = benchmark_serializers(options['rows'], options['repeat'])
+        self.stdout.write(json.dumps(results, indent=2))
+        different = [name for name, result in results.items() if not result['identical_json']]
+        if different:
+            raise CommandError(f'The compiled serializers render different JSON for: {", ".join(different)}')
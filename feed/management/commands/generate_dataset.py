@@ -0,0 +1,51 @@
+from argparse import ArgumentTypeError
+from datetime import timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from feed.dataset import DEFAULT_DATASET, DatasetGenerator
+
+
+def epoch(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ArgumentTypeError(f'"{value}" is not an ISO 8601 date and time.')
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, dt_timezone.utc)
+
+
+class Command(BaseCommand):
+    help = 'Generate a reproducible synthetic dataset: users, a power-law follower graph, posts, likes and comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=DEFAULT_DATASET['users'])
+        parser.add_argument('--avg-following', type=int, default=DEFAULT_DATASET['avg_following'],
+                            help='Average number of accounts each user follows.')
+        parser.add_argument('--exponent', type=float, default=DEFAULT_DATASET['exponent'],
+                            help='Power-law exponent of account popularity, higher concentrates followers more.')
+        parser.add_argument('--posts-per-user', type=float, default=DEFAULT_DATASET['posts_per_user'])
+        parser.add_argument('--likes-per-post', type=float, default=DEFAULT_DATASET['likes_per_post'])
+        parser.add_argument('--comments-per-post', type=float, default=DEFAULT_DATASET['comments_per_post'])
+        parser.add_argument('--days', type=int, default=DEFAULT_DATASET['days'],
+                            help='Posts, likes and comments are dated within the last DAYS days.')
+        parser.add_argument('--seed', type=int, default=DEFAULT_DATASET['seed'])
+        parser.add_argument('--epoch', type=epoch, default=DEFAULT_DATASET['epoch'],
+                            help='Date the dataset ends at, e.g. 2024-01-01T00:00:00Z. Defaults to now, give one '
+                                 'for identical timestamps across runs.')
+        parser.add_argument('--prefix', default=DEFAULT_DATASET['prefix'],
+                            help='Username prefix of the generated users.')
+        parser.add_argument('--password', default=DEFAULT_DATASET['password'],
+                            help='Password of every generated user.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_DATASET['batch_size'])
+
+    def handle(self, *args, **options):
+        generator = DatasetGenerator(
+            log=self.stdout.write, **{name: options[name] for name in DEFAULT_DATASET})
+        try:
+            result = generator.generate()
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(
+            'Generated {users} users, {follows} follows, {posts} posts, {likes} likes and {comments} comments.'.format(
+                **result)))
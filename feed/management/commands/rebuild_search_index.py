@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from feed import search
+
+
+class Command(BaseCommand):
+    help = 'Recreate the post full text index and its triggers (SQLite with FTS5 only).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database whose index is rebuilt. Defaults to the "default" database.')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if not search.has_fts5(connection):
+            raise CommandError('Full text search needs SQLite with FTS5, other databases are searched by scanning.')
+        search.build_index(connection)
+        self.stdout.write(self.style.SUCCESS('Rebuilt the post search index.'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import CustomUser
+from feed.timeline import get_timeline_store
+
+
+class Command(BaseCommand):
+    help = 'Backfill or rebuild the materialized home timelines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users', default=[],
+                            help='Rebuild only the timeline of this user id. May be repeated.')
+
+    def handle(self, *args, **options):
+        store = get_timeline_store()
+        users = CustomUser.objects.order_by('pk').values_list('pk', flat=True)
+        if options['users']:
+            users = users.filter(pk__in=options['users'])
+
+        rebuilt = 0
+        for user_id in users.iterator():
+            store.rebuild(user_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} timeline(s).'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from feed import counters
+from feed.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Recount post like/comment counters and fold their pending shards. Meant to run periodically.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true',
+                            help='Recount every post instead of only the ones with pending shards.')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.order_by('pk')
+        if not options['all']:
+            posts = posts.filter(counter_shards__isnull=False).distinct()
+
+        batch, reconciled = [], 0
+        for post_id in posts.values_list('pk', flat=True).iterator():
+            batch.append(post_id)
+            if len(batch) == options['batch_size']:
+                counters.reconcile(batch)
+                reconciled += len(batch)
+                batch = []
+        if batch:
+            counters.reconcile(batch)
+            reconciled += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {reconciled} post(s).'))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from social_media_assignment.database import get_replicas
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary database into the local SQLite replicas (DB_REPLICA_NAME), simulating replication.'
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        replicas = [alias for alias in get_replicas() if connections[alias].vendor == 'sqlite']
+        if primary.vendor != 'sqlite' or not replicas:
+            raise CommandError('Needs SQLite for the primary and at least one SQLite replica, set DB_REPLICA_NAME.')
+        primary.ensure_connection()
+        for alias in replicas:
+            replica = connections[alias]
+            replica.ensure_connection()
+            primary.connection.backup(replica.connection)
+            self.stdout.write(self.style.SUCCESS(f'Copied {DEFAULT_DB_ALIAS} to {alias} ({settings.DATABASES[alias]["NAME"]}).'))
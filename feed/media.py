@@ -0,0 +1,173 @@
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, close_old_connections, transaction
+
+from feed.models import MediaAsset
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, images are then stored without variants.
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+_processing_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='media-processing')
+
+
+class UploadOffsetError(Exception):
+    """
+    A chunk doesn't start where the upload left off.
+    """
+
+
+class _PartFile(File):
+    """
+    Lets ``FileSystemStorage`` move a finished upload into place instead of
+    copying it.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def get_upload_dir():
+    # Outside MEDIA_ROOT, unfinished uploads must not be served as media.
+    return getattr(settings, 'FEED_UPLOAD_TEMP_DIR', os.path.join(settings.BASE_DIR, 'uploads'))
+
+
+def get_part_path(session):
+    return os.path.join(get_upload_dir(), f'{session.pk}.part')
+
+
+def write_chunk(session, stream, start, length):
+    """
+    Stream ``length`` bytes from ``stream`` into the session's temporary file
+    at ``start`` without holding more than ``CHUNK_SIZE`` bytes in memory.
+    Returns the new ``received`` offset.
+    """
+    if start != session.received:
+        raise UploadOffsetError(session.received)
+
+    os.makedirs(get_upload_dir(), exist_ok=True)
+    path = get_part_path(session)
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as part:
+        part.seek(start)
+        remaining = length
+        while remaining:
+            data = stream.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            part.write(data)
+            remaining -= len(data)
+        part.truncate()
+    return start + length - remaining
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for data in iter(lambda: part.read(CHUNK_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def get_asset_name(sha256, filename, suffix=''):
+    extension = os.path.splitext(filename)[1].lower()
+    return f'assets/{sha256[:2]}/{sha256}{suffix}{extension}'
+
+
+def finish_upload(session):
+    """
+    Turn a fully received upload into a ``MediaAsset``. Identical content is
+    stored once: an upload whose hash is already known reuses that asset, and
+    one whose processing failed is processed again.
+    """
+    path = get_part_path(session)
+    sha256 = hash_file(path)
+    asset = MediaAsset.objects.filter(sha256=sha256).first()
+    if asset is not None:
+        return _reuse_asset(asset, path)
+
+    content_type = session.content_type or mimetypes.guess_type(session.filename)[0] or ''
+    with open(path, 'rb') as part:
+        name = default_storage.save(get_asset_name(sha256, session.filename), _PartFile(part))
+    if os.path.exists(path):
+        os.remove(path)
+    try:
+        with transaction.atomic():
+            asset = MediaAsset.objects.create(user_id=session.user_id, sha256=sha256, file=name,
+                                              content_type=content_type, size=session.size)
+    except IntegrityError:
+        # The same content was completed concurrently, keep the winner's copy.
+        default_storage.delete(name)
+        return _reuse_asset(MediaAsset.objects.get(sha256=sha256), None)
+    transaction.on_commit(lambda: schedule_processing(asset.pk))
+    return asset
+
+
+def _reuse_asset(asset, path):
+    if asset.status == MediaAsset.FAILED:
+        if path is not None and not default_storage.exists(asset.file.name):
+            with open(path, 'rb') as part:
+                asset.file.name = default_storage.save(asset.file.name, _PartFile(part))
+        asset.status = MediaAsset.PROCESSING
+        asset.save(update_fields=['file', 'status', 'date_modified'])
+        transaction.on_commit(lambda: schedule_processing(asset.pk))
+    if path is not None and os.path.exists(path):
+        os.remove(path)
+    return asset
+
+
+def make_variants(asset):
+    """
+    Return ``{name: storage name}`` of the resized copies of an image asset.
+    """
+    if Image is None or not asset.content_type.startswith('image/'):
+        return {}
+    variants = {}
+    for name, size in getattr(settings, 'FEED_MEDIA_VARIANTS', {}).items():
+        with default_storage.open(asset.file.name, 'rb') as source:
+            image = Image.open(source)
+            image.thumbnail(size)
+            output = io.BytesIO()
+            image.convert('RGB').save(output, format='JPEG', quality=85)
+        variant_name = get_asset_name(asset.sha256, 'variant.jpg', suffix=f'_{name}')
+        variants[name] = default_storage.save(variant_name, ContentFile(output.getvalue()))
+    return variants
+
+
+def process_asset(asset_id):
+    asset = MediaAsset.objects.get(pk=asset_id)
+    try:
+        asset.variants = make_variants(asset)
+        asset.status = MediaAsset.READY
+    except Exception:
+        logger.exception('Processing media asset %s failed', asset_id)
+        asset.status = MediaAsset.FAILED
+    asset.save(update_fields=['variants', 'status', 'date_modified'])
+
+
+def _process_in_background(asset_id):
+    close_old_connections()
+    try:
+        process_asset(asset_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_processing(asset_id):
+    if getattr(settings, 'FEED_MEDIA_PROCESSING', 'background') == 'inline':
+        process_asset(asset_id)
+    else:
+        _processing_executor.submit(_process_in_background, asset_id)
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.5 on 2026-10-18 09:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('feed', '0006_alter_like_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+                ('created_by', models.CharField(blank=True, max_length=50, null=True)),
+                ('modified_by', models.CharField(blank=True, max_length=50, null=True)),
+                ('post_created_date', models.DateTimeField()),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='feed.post')),
+            ],
+            options={
+                'verbose_name': 'timeline entry',
+                'verbose_name_plural': 'timeline entries',
+                'indexes': [models.Index(fields=['owner', '-post_created_date'], name='feed_timeline_owner_date')],
+                'unique_together': {('owner', 'post')},
+            },
+        ),
+    ]
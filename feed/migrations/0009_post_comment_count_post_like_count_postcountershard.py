@@ -0,0 +1,58 @@
+# Generated by Django 4.2.5 on 2026-10-18 09:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+import uuid
+
+
+def count_existing_engagement(apps, schema_editor):
+    Post = apps.get_model('feed', 'Post')
+    Like = apps.get_model('feed', 'Like')
+    Comment = apps.get_model('feed', 'Comment')
+    likes = Like.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+        count=Count('id')).values('count')
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+        count=Count('id')).values('count')
+    Post.objects.update(like_count=Coalesce(Subquery(likes), 0), comment_count=Coalesce(Subquery(comments), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0008_remove_timelineentry_feed_timeline_owner_date_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PostCounterShard',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+                ('created_by', models.CharField(blank=True, max_length=50, null=True)),
+                ('modified_by', models.CharField(blank=True, max_length=50, null=True)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('like_count', models.IntegerField(default=0)),
+                ('comment_count', models.IntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='feed.post')),
+            ],
+            options={
+                'verbose_name': 'post counter shard',
+                'verbose_name_plural': 'post counter shards',
+                'unique_together': {('post', 'shard')},
+            },
+        ),
+        migrations.RunPython(count_existing_engagement, migrations.RunPython.noop),
+    ]
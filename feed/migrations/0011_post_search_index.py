@@ -0,0 +1,60 @@
+# Generated by Django 4.2.5 on 2026-10-18 09:57
+
+from django.db import migrations
+
+CREATE_STATEMENTS = [
+    "CREATE VIRTUAL TABLE feed_post_fts USING fts5(content, content='feed_post', content_rowid='rowid', "
+    "tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER feed_post_fts_insert AFTER INSERT ON feed_post BEGIN "
+    "INSERT INTO feed_post_fts(rowid, content) VALUES (new.rowid, new.content); END",
+    "CREATE TRIGGER feed_post_fts_delete AFTER DELETE ON feed_post BEGIN "
+    "INSERT INTO feed_post_fts(feed_post_fts, rowid, content) VALUES ('delete', old.rowid, old.content); END",
+    "CREATE TRIGGER feed_post_fts_update AFTER UPDATE OF content ON feed_post BEGIN "
+    "INSERT INTO feed_post_fts(feed_post_fts, rowid, content) VALUES ('delete', old.rowid, old.content); "
+    "INSERT INTO feed_post_fts(rowid, content) VALUES (new.rowid, new.content); END",
+    "INSERT INTO feed_post_fts(feed_post_fts) VALUES ('rebuild')",
+]
+
+DROP_STATEMENTS = [
+    'DROP TRIGGER IF EXISTS feed_post_fts_insert',
+    'DROP TRIGGER IF EXISTS feed_post_fts_delete',
+    'DROP TRIGGER IF EXISTS feed_post_fts_update',
+    'DROP TABLE IF EXISTS feed_post_fts',
+    # Added by 0012_post_search_key.
+    'DROP TABLE IF EXISTS feed_post_search_key',
+]
+
+
+def has_fts5(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Only SQLite builds with FTS5 get an index, ``feed.search`` falls back to
+    scanning on other databases.
+    """
+    if has_fts5(schema_editor.connection):
+        for statement in CREATE_STATEMENTS:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP_STATEMENTS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0010_mediaasset_uploadsession_post_asset'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:20
+
+from django.db import migrations
+
+DROP_STATEMENTS = [
+    'DROP TRIGGER IF EXISTS feed_post_fts_insert',
+    'DROP TRIGGER IF EXISTS feed_post_fts_delete',
+    'DROP TRIGGER IF EXISTS feed_post_fts_update',
+    'DROP TABLE IF EXISTS feed_post_fts',
+    'DROP TABLE IF EXISTS feed_post_search_key',
+]
+
+CREATE_STATEMENTS = [
+    "CREATE TABLE feed_post_search_key (id INTEGER PRIMARY KEY, post_id char(32) NOT NULL UNIQUE)",
+    "CREATE VIRTUAL TABLE feed_post_fts USING fts5(content, content='', "
+    "tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER feed_post_fts_insert AFTER INSERT ON feed_post BEGIN "
+    "INSERT INTO feed_post_search_key(post_id) VALUES (new.id); "
+    "INSERT INTO feed_post_fts(rowid, content) SELECT id, new.content FROM feed_post_search_key "
+    "WHERE post_id = new.id; END",
+    "CREATE TRIGGER feed_post_fts_delete AFTER DELETE ON feed_post BEGIN "
+    "INSERT INTO feed_post_fts(feed_post_fts, rowid, content) "
+    "SELECT 'delete', id, old.content FROM feed_post_search_key WHERE post_id = old.id; "
+    "DELETE FROM feed_post_search_key WHERE post_id = old.id; END",
+    "CREATE TRIGGER feed_post_fts_update AFTER UPDATE OF content ON feed_post BEGIN "
+    "INSERT INTO feed_post_fts(feed_post_fts, rowid, content) "
+    "SELECT 'delete', id, old.content FROM feed_post_search_key WHERE post_id = old.id; "
+    "INSERT INTO feed_post_fts(rowid, content) SELECT id, new.content FROM feed_post_search_key "
+    "WHERE post_id = new.id; END",
+    "INSERT INTO feed_post_search_key(post_id) SELECT id FROM feed_post",
+    "INSERT INTO feed_post_fts(rowid, content) SELECT feed_post_search_key.id, feed_post.content "
+    "FROM feed_post_search_key JOIN feed_post ON feed_post.id = feed_post_search_key.post_id",
+]
+
+
+def rebuild_search_index(apps, schema_editor):
+    """
+    Move an index keyed on ``feed_post``'s rowid to the stable search keys.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or 'feed_post_fts' not in connection.introspection.table_names():
+        return
+    for statement in DROP_STATEMENTS + CREATE_STATEMENTS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0011_post_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+    ]
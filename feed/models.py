@@ -3,10 +3,63 @@ from accounts.models import CustomUser
 from social_media_assignment.base_models import BaseModel
 
 
+class MediaAsset(BaseModel):
+    """
+    An uploaded file stored once under its content hash, together with the
+    variants (thumbnails, resized copies) made by ``feed.media``.
+    """
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PROCESSING, 'Processing'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    )
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='media_assets')
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='assets/')
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PROCESSING)
+    variants = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        """
+        to set table name in database
+        """
+        verbose_name = 'media asset'
+        verbose_name_plural = 'media assets'
+
+
+class UploadSession(BaseModel):
+    """
+    A resumable upload: chunks are appended to a temporary file until
+    ``received`` reaches ``size``.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    asset = models.ForeignKey(MediaAsset, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        """
+        to set table name in database
+        """
+        verbose_name = 'upload session'
+        verbose_name_plural = 'upload sessions'
+
+
 class Post(BaseModel):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     content = models.TextField()
     file = models.FileField(upload_to='file/', blank=True, null=True)
+    asset = models.ForeignKey(MediaAsset, on_delete=models.SET_NULL, null=True, blank=True, related_name='posts')
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         """
@@ -14,6 +67,9 @@ class Post(BaseModel):
         """
         verbose_name = 'post'
         verbose_name_plural = 'posts'
+        indexes = [
+            models.Index(fields=['user', '-created_date', '-id'], name='feed_post_user_date'),
+        ]
 
 
 class Like(BaseModel):
@@ -40,3 +96,51 @@ class Comment(BaseModel):
         """
         verbose_name = 'comment'
         verbose_name_plural = 'comments'
+        indexes = [
+            models.Index(fields=['post', '-created_date', '-id'], name='feed_comment_post_date'),
+        ]
+
+
+class PostCounterShard(BaseModel):
+    """
+    Pending like/comment count deltas of a post, spread over several rows so
+    concurrent increments don't all queue behind one row lock.
+
+    ``reconcile_counters`` folds the deltas back into ``Post.like_count`` and
+    ``Post.comment_count``.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='counter_shards')
+    shard = models.PositiveSmallIntegerField()
+    like_count = models.IntegerField(default=0)
+    comment_count = models.IntegerField(default=0)
+
+    class Meta:
+        """
+        to set table name in database
+        """
+        verbose_name = 'post counter shard'
+        verbose_name_plural = 'post counter shards'
+        unique_together = ('post', 'shard')
+
+
+class TimelineEntry(BaseModel):
+    """
+    Materialized home timeline row: ``post`` is visible in ``owner``'s feed.
+
+    ``post_created_date`` is copied from the post so a page of the timeline can
+    be read straight off the ``(owner, post_created_date)`` index.
+    """
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    post_created_date = models.DateTimeField()
+
+    class Meta:
+        """
+        to set table name in database
+        """
+        verbose_name = 'timeline entry'
+        verbose_name_plural = 'timeline entries'
+        unique_together = ('owner', 'post')
+        indexes = [
+            models.Index(fields=['owner', '-post_created_date', '-post'], name='feed_timeline_owner_date'),
+        ]
@@ -0,0 +1,167 @@
+"""
+Cache of serialized home feed pages.
+
+A cached page records the version stamps of everything it was built from:
+
+* ``timeline:<user>``, bumped when a post is pushed to or a follow edge changes
+  the viewer's timeline;
+* ``author:<user>`` for every author pulled at read time, bumped when they post;
+* ``post:<post>`` for every post on the page, bumped when the post, its likes,
+  comments or media change.
+
+A page is served from the cache only while all of those stamps are unchanged,
+so invalidating never has to know which pages or cursors a change affects.
+The stamps also make up the page's ``ETag``. They are bumped once the change
+commits, so a page read before the commit isn't cached under the new stamps.
+Stamps are read after the page was built, a change racing that window is
+picked up after ``FEED_PAGE_CACHE_TIMEOUT`` at the latest.
+
+The stamps only invalidate pages in the processes that see them, so unless
+``FEED_PAGE_CACHE_TIMEOUT`` is set, pages are only cached when
+``FEED_PAGE_CACHE`` is shared between the workers (Redis, Memcached).
+
+Pages read from a replica, or while the cache is disabled, are neither cached
+nor given an ``ETag``: the replica may lag behind the stamps, and the stale
+page would be served until the next change.
+"""
+import hashlib
+from functools import partial
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from social_media_assignment.caching import is_shared_cache
+from social_media_assignment.database import is_replica_read
+
+TIMELINE = 'timeline'
+AUTHOR = 'author'
+POST = 'post'
+DEFAULT_TIMEOUT = 300
+
+
+def _alias():
+    return getattr(settings, 'FEED_PAGE_CACHE', 'default')
+
+
+def _cache():
+    return caches[_alias()]
+
+
+def _timeout():
+    timeout = getattr(settings, 'FEED_PAGE_CACHE_TIMEOUT', None)
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUT if is_shared_cache(_alias()) else 0
+    return timeout
+
+
+def is_enabled():
+    return _timeout() != 0
+
+
+def version_key(kind, object_id):
+    return f'feed-version:{kind}:{object_id}'
+
+
+def page_key(request):
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'feed-page:{request.user.id}:{url}'
+
+
+def bump(kind, object_ids):
+    """
+    Give the ``kind`` stamps of ``object_ids`` a new value once the current
+    transaction commits, which invalidates every cached page depending on them.
+    """
+    keys = {version_key(kind, object_id) for object_id in object_ids}
+    if keys and is_enabled():
+        transaction.on_commit(partial(_set_versions, keys))
+
+
+def _set_versions(keys):
+    version = uuid4().hex[:12]
+    _cache().set_many({key: version for key in keys}, None)
+
+
+def get_versions(keys):
+    """
+    Return the current stamp of every key, creating the missing ones.
+    """
+    versions = _cache().get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = uuid4().hex[:12]
+            versions[key] = version if _cache().add(key, version, None) else _cache().get(key, version)
+    return versions
+
+
+def get_etag(key, versions):
+    digest = hashlib.md5(key.encode())
+    for dependency in sorted(versions):
+        digest.update(f'{dependency}={versions[dependency]}'.encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def is_not_modified(request, etag):
+    """
+    Whether ``If-None-Match`` matches ``etag``, compared weakly as RFC 9110
+    requires for that header.
+    """
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return etags == ['*'] or etag in [tag.removeprefix('W/') for tag in etags]
+
+
+def _respond(request, data, etag):
+    if is_not_modified(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def get_cached_response(request):
+    """
+    Return the response for a cached page whose dependencies didn't change, or
+    ``None``.
+    """
+    if not is_enabled():
+        return None
+    entry = _cache().get(page_key(request))
+    if entry is None or _cache().get_many(entry['versions']) != entry['versions']:
+        return None
+    return _respond(request, entry['data'], entry['etag'])
+
+
+def cache_response(request, data, posts, pull_sources=()):
+    """
+    Cache the serialized ``data`` of a page showing ``posts`` and return the
+    response to send.
+    """
+    if not is_enabled() or is_replica_read():
+        response = Response(data)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    keys = [version_key(TIMELINE, request.user.id)]
+    keys += [version_key(AUTHOR, author_id) for author_id in pull_sources]
+    keys += [version_key(POST, post.pk) for post in posts]
+    versions = get_versions(keys)
+    key = page_key(request)
+    etag = get_etag(key, versions)
+    _cache().set(key, {'versions': versions, 'data': data, 'etag': etag}, _timeout())
+    return _respond(request, data, etag)
+
+
+def post_added(post, owners):
+    """
+    Bump the stamps of the feeds a new post shows up in: the timelines of the
+    ``owners`` it was written to, and its author's for the feeds that pull it
+    at read time.
+    """
+    bump(AUTHOR, [post.user_id])
+    bump(TIMELINE, owners)
@@ -0,0 +1,148 @@
+from base64 import b64decode, b64encode
+from uuid import UUID
+
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class NextLinkPagination(BasePagination):
+    """
+    Responses of ``{'next': url or None, 'results': [...]}`` without a total
+    count, with a client chosen ``page_size`` capped at ``max_page_size``.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+
+class KeysetCursorPagination(NextLinkPagination):
+    """
+    Newest-first cursor pagination keyed on ``(created_date, id)``.
+
+    Every page is a range scan that starts right after the last row of the
+    previous page, so neither ``OFFSET`` nor ``COUNT(*)`` is ever issued. The
+    UUID primary key breaks ties between rows created in the same microsecond.
+
+    Querysets, of model instances or ``.values()`` rows, are ordered and
+    filtered here. Other sources (see ``feed.timeline.Timeline``) have to be
+    ordered already and provide ``after(created_date, id)`` returning the rows
+    that follow that position.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.position_queryset(queryset, request)
+        return self.set_page(list(queryset[:self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.position_queryset(queryset, request)
+        if hasattr(queryset, 'afetch'):
+            return self.set_page(await queryset.afetch(self.page_size + 1))
+        return self.set_page([row async for row in queryset[:self.page_size + 1]])
+
+    def position_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if isinstance(queryset, QuerySet):
+            queryset = queryset.order_by('-created_date', '-id')
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = self.after(queryset, *position)
+        return queryset
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    @staticmethod
+    def after(queryset, created_date, pk):
+        if hasattr(queryset, 'after'):
+            return queryset.after(created_date, pk)
+        return queryset.filter(Q(created_date__lt=created_date) | Q(created_date=created_date, id__lt=pk))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            created_date, pk = b64decode(encoded.encode('ascii'), altchars=b'-_').decode('ascii').split('|')
+            created_date = parse_datetime(created_date)
+            pk = UUID(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_date, pk
+
+    def encode_cursor(self, obj):
+        created_date, pk = (obj['created_date'], obj['id']) if isinstance(obj, dict) else (obj.created_date, obj.pk)
+        raw = f'{created_date.isoformat()}|{pk}'
+        return b64encode(raw.encode('ascii'), altchars=b'-_').decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+
+class RankedPagination(NextLinkPagination):
+    """
+    Page number pagination for result lists ordered by relevance, which have
+    no stable key to seek on. It reads one row past the page to know whether
+    there is a next one and never counts. Offsets grow with the page number,
+    so only the first ``max_page`` pages are served.
+    """
+    page_query_param = 'page'
+    max_page = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        try:
+            self.page_number = min(max(int(request.query_params.get(self.page_query_param, 1)), 1), self.max_page)
+        except ValueError:
+            raise NotFound('Invalid page')
+        start = (self.page_number - 1) * self.page_size
+        rows = list(queryset[start:start + self.page_size + 1])
+        self.has_next = len(rows) > self.page_size and self.page_number < self.max_page
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.page_number + 1)
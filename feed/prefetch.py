@@ -0,0 +1,97 @@
+import asyncio
+
+from django.conf import settings
+from django.db.models import F, Prefetch, prefetch_related_objects
+from django.db.models.functions import RowNumber
+from django.db.models.expressions import Window
+
+from feed.counters import aattach_pending_counts, attach_pending_counts
+from feed.models import Comment, Like, MediaAsset
+
+
+def get_recent_comment_limit():
+    return getattr(settings, 'FEED_RECENT_COMMENTS', 3)
+
+
+def recent_comments_queryset():
+    """
+    The newest ``FEED_RECENT_COMMENTS`` comments of every post, ranked with a
+    single window function.
+    """
+    return Comment.objects.annotate(
+        rank=Window(RowNumber(), partition_by=F('post_id'), order_by=(F('created_date').desc(), F('id').desc())),
+    ).filter(rank__lte=get_recent_comment_limit()).order_by('-created_date', '-id')
+
+
+def recent_comments_prefetch():
+    """
+    Prefetch the recent comments of every post into ``post.recent_comments``
+    with a single windowed query.
+    """
+    return Prefetch('comments', queryset=recent_comments_queryset(), to_attr='recent_comments')
+
+
+def liked_post_ids(posts, viewer_id):
+    return Like.objects.filter(user_id=viewer_id, post__in=posts).values_list('post_id', flat=True)
+
+
+def attach_liked_by_me(posts, viewer_id):
+    """
+    Set ``post.liked_by_me`` on every post with one query over the viewer's likes.
+    """
+    liked = set(liked_post_ids(posts, viewer_id)) if viewer_id is not None else set()
+    for post in posts:
+        post.liked_by_me = post.pk in liked
+
+
+def prefetch_posts(posts, viewer_id=None):
+    """
+    Attach ``recent_comments``, the pending counter deltas and ``liked_by_me``
+    to a page of posts so ``PostSerializer`` renders it without a query per
+    post.
+    """
+    if not posts:
+        return posts
+    prefetch_related_objects(posts, recent_comments_prefetch(), 'asset')
+    attach_pending_counts(posts)
+    attach_liked_by_me(posts, viewer_id)
+    return posts
+
+
+async def _attach_recent_comments(posts):
+    comments = {post.pk: [] for post in posts}
+    async for comment in recent_comments_queryset().filter(post__in=posts):
+        comments[comment.post_id].append(comment)
+    for post in posts:
+        post.recent_comments = comments[post.pk]
+
+
+async def _attach_assets(posts):
+    asset_ids = {post.asset_id for post in posts if post.asset_id is not None}
+    if not asset_ids:
+        return
+    assets = {asset.pk: asset async for asset in MediaAsset.objects.filter(pk__in=asset_ids)}
+    for post in posts:
+        if post.asset_id is not None:
+            post.asset = assets[post.asset_id]
+
+
+async def _attach_liked_by_me(posts, viewer_id):
+    liked = {post_id async for post_id in liked_post_ids(posts, viewer_id)} if viewer_id is not None else set()
+    for post in posts:
+        post.liked_by_me = post.pk in liked
+
+
+async def aprefetch_posts(posts, viewer_id=None):
+    """
+    Async ``prefetch_posts``, its independent queries are issued concurrently.
+    """
+    if not posts:
+        return posts
+    await asyncio.gather(
+        _attach_recent_comments(posts),
+        _attach_assets(posts),
+        aattach_pending_counts(posts),
+        _attach_liked_by_me(posts, viewer_id),
+    )
+    return posts
@@ -0,0 +1,210 @@
+"""
+Ranked home feed (``/feed/posts/?mode=ranked``).
+
+A post's score for a viewer is
+
+    log10(1 + LIKE_WEIGHT * likes + COMMENT_WEIGHT * comments)
+        + created_timestamp / DECAY_SECONDS
+        + AFFINITY_WEIGHT * log10(1 + viewer's interactions with the author)
+
+The time term grows by one every ``DECAY_SECONDS``, so a post needs ten times
+the engagement of a post ``DECAY_SECONDS`` younger to rank level with it: the
+engagement term rewards velocity, not totals. Scores never have to be decayed.
+
+Everything the score needs is maintained incrementally in the cache from the
+model signals:
+
+* ``rank:post:<post>`` holds ``(author, created timestamp, likes, comments)``,
+  updated on every like and comment;
+* ``rank:affinity:<user>`` holds the user's interaction counts per author,
+  bounded to the ``AFFINITY_SIZE`` strongest authors;
+* ``rank:pool:<user>`` is a bounded min-heap of ``(score, post)`` with the
+  ``POOL_SIZE`` best candidates of the user's timeline. New posts are pushed
+  into the pools of their audience; authors whose posts are pulled at read
+  time reach their audience when the pool expires after ``POOL_TIMEOUT``.
+  Follows and unfollows drop the pools of the timelines they change.
+
+Serving a page reads the pool, the post entries and the affinities with three
+cache calls, sorts at most ``POOL_SIZE`` floats and loads the page's posts with
+one query. Concurrent updates of the same entry can lose an increment; the
+ranking is approximate by design.
+"""
+import heapq
+import math
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from feed import timeline
+from feed.counters import attach_pending_counts, get_count
+from feed.models import Post
+
+DEFAULT_RANKING = {
+    'CACHE': 'default',
+    'LIKE_WEIGHT': 1.0,
+    'COMMENT_WEIGHT': 3.0,
+    'AFFINITY_WEIGHT': 1.0,
+    'DECAY_SECONDS': 45000,
+    'POOL_SIZE': 500,
+    'POOL_TIMEOUT': 600,
+    'AFFINITY_SIZE': 200,
+    'TIMEOUT': 7 * 24 * 3600,
+}
+
+COUNT_INDEX = {'like_count': 2, 'comment_count': 3}
+
+
+def get_options():
+    return {**DEFAULT_RANKING, **getattr(settings, 'FEED_RANKING', {})}
+
+
+def _cache():
+    return caches[get_options()['CACHE']]
+
+
+def post_key(post_id):
+    return f'rank:post:{post_id}'
+
+
+def affinity_key(user_id):
+    return f'rank:affinity:{user_id}'
+
+
+def pool_key(user_id):
+    return f'rank:pool:{user_id}'
+
+
+def hot_score(entry, options):
+    _, created_ts, likes, comments = entry
+    engagement = options['LIKE_WEIGHT'] * likes + options['COMMENT_WEIGHT'] * comments
+    return math.log10(1 + max(engagement, 0)) + created_ts / options['DECAY_SECONDS']
+
+
+def affinity_score(interactions, options):
+    return options['AFFINITY_WEIGHT'] * math.log10(1 + max(interactions, 0))
+
+
+def make_entry(post):
+    return (post.user_id, post.created_date.timestamp(), get_count(post, 'like_count'),
+            get_count(post, 'comment_count'))
+
+
+def get_entries(post_ids):
+    """
+    Return ``{post_id: entry}``, loading every cache miss with one query.
+    """
+    entries = {}
+    keys = {post_key(post_id): post_id for post_id in post_ids}
+    for key, entry in _cache().get_many(keys).items():
+        entries[keys[key]] = entry
+    missing = [post_id for post_id in post_ids if post_id not in entries]
+    if missing:
+        posts = attach_pending_counts(list(Post.objects.filter(pk__in=missing)))
+        loaded = {post.pk: make_entry(post) for post in posts}
+        _cache().set_many({post_key(post_id): entry for post_id, entry in loaded.items()}, get_options()['TIMEOUT'])
+        entries.update(loaded)
+    return entries
+
+
+def build_pool(user_id, options):
+    posts = attach_pending_counts(timeline.get_timeline_store().get_posts(user_id)[:options['POOL_SIZE']])
+    entries = {post.pk: make_entry(post) for post in posts}
+    _cache().set_many({post_key(post_id): entry for post_id, entry in entries.items()}, options['TIMEOUT'])
+    pool = [(hot_score(entry, options), post_id) for post_id, entry in entries.items()]
+    heapq.heapify(pool)
+    _cache().set(pool_key(user_id), pool, options['POOL_TIMEOUT'])
+    return pool
+
+
+def get_ranked_ids(user_id):
+    """
+    Return the post ids of ``user_id``'s pool, best first.
+    """
+    options = get_options()
+    pool = _cache().get(pool_key(user_id))
+    if pool is None:
+        pool = build_pool(user_id, options)
+    entries = get_entries([post_id for _, post_id in pool])
+    affinity = _cache().get(affinity_key(user_id), {})
+    scored = [
+        (hot_score(entry, options) + affinity_score(affinity.get(entry[0], 0), options), post_id)
+        for post_id, entry in entries.items()
+    ]
+    scored.sort(reverse=True)
+    return [post_id for _, post_id in scored]
+
+
+class RankedFeed:
+    """
+    Lazy ranked home feed, sliced by ``feed.pagination.RankedPagination``.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._ids = None
+
+    def __getitem__(self, item):
+        if self._ids is None:
+            self._ids = get_ranked_ids(self.user_id)
+        ids = self._ids[item]
+        posts = Post.objects.in_bulk(ids)
+        return [posts[post_id] for post_id in ids if post_id in posts]
+
+
+def post_added(post, owners):
+    """
+    Record a new post and push it into the cached pools of the timeline
+    ``owners`` it was written to.
+    """
+    options = get_options()
+    entry = (post.user_id, post.created_date.timestamp(), 0, 0)
+    _cache().set(post_key(post.pk), entry, options['TIMEOUT'])
+    keys = {pool_key(owner): owner for owner in owners}
+    pools = _cache().get_many(keys)
+    if not pools:
+        return
+    score = hot_score(entry, options)
+    for pool in pools.values():
+        if len(pool) < options['POOL_SIZE']:
+            heapq.heappush(pool, (score, post.pk))
+        else:
+            heapq.heappushpop(pool, (score, post.pk))
+    _cache().set_many(pools, options['POOL_TIMEOUT'])
+
+
+def timelines_changed(owners):
+    """
+    Drop the pools of the timeline ``owners`` once a follow change commits,
+    they are rebuilt from the timelines on the next read.
+    """
+    transaction.on_commit(partial(_cache().delete_many, [pool_key(owner) for owner in owners]))
+
+
+def post_removed(post):
+    _cache().delete(post_key(post.pk))
+
+
+def record_engagement(user_id, post_id, field, delta=1):
+    """
+    Apply a like or comment to the post's entry and to ``user_id``'s affinity
+    with the post's author.
+    """
+    options = get_options()
+    entry = _cache().get(post_key(post_id))
+    if entry is not None:
+        entry = list(entry)
+        entry[COUNT_INDEX[field]] += delta
+        _cache().set(post_key(post_id), tuple(entry), options['TIMEOUT'])
+        author_id = entry[0]
+    else:
+        author_id = Post.objects.filter(pk=post_id).values_list('user_id', flat=True).first()
+    if author_id is None or author_id == user_id:
+        return
+
+    affinity = _cache().get(affinity_key(user_id), {})
+    affinity[author_id] = max(affinity.get(author_id, 0) + delta, 0)
+    if len(affinity) > options['AFFINITY_SIZE']:
+        affinity = dict(heapq.nlargest(options['AFFINITY_SIZE'], affinity.items(), key=lambda item: item[1]))
+    _cache().set(affinity_key(user_id), affinity, options['TIMEOUT'])
@@ -0,0 +1,164 @@
+"""
+Full text search over ``Post.content`` and prefix search over usernames.
+
+On SQLite builds with FTS5 the ``feed_post_fts`` index created by migrations
+``0011_post_search_index`` and ``0012_post_search_key`` is queried and hits
+are ranked with ``bm25``. The index is contentless and keyed on
+``feed_post_search_key.id``, an integer primary key assigned per post, since
+``feed_post``'s implicit rowid is renumbered by ``VACUUM`` and by migrations
+that rebuild the table. Triggers keep the index in sync with ``feed_post``.
+SQLite drops them when a migration rebuilds that table, ``migrate`` then
+rebuilds the index, see ``restore_index``. The migrations keep their own copy
+of the SQL below, changing it needs a migration rebuilding the index. Other
+databases fall back to matching every term with ``icontains``, newest first.
+
+Users are found through the ``Lower('username')`` and ``Lower('email')``
+indexes of ``CustomUser``: by username prefix, or by exact email when the
+query looks like one.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from accounts.models import CustomUser
+from feed.models import Post
+
+FTS_TABLE = 'feed_post_fts'
+KEY_TABLE = 'feed_post_search_key'
+TRIGGERS = ('feed_post_fts_insert', 'feed_post_fts_delete', 'feed_post_fts_update')
+TERM = re.compile(r'\w+', re.UNICODE)
+
+CREATE_STATEMENTS = [
+    f"CREATE TABLE {KEY_TABLE} (id INTEGER PRIMARY KEY, post_id char(32) NOT NULL UNIQUE)",
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(content, content='', "
+    f"tokenize='porter unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER feed_post_fts_insert AFTER INSERT ON feed_post BEGIN "
+    f"INSERT INTO {KEY_TABLE}(post_id) VALUES (new.id); "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) SELECT id, new.content FROM {KEY_TABLE} WHERE post_id = new.id; END",
+    f"CREATE TRIGGER feed_post_fts_delete AFTER DELETE ON feed_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) "
+    f"SELECT 'delete', id, old.content FROM {KEY_TABLE} WHERE post_id = old.id; "
+    f"DELETE FROM {KEY_TABLE} WHERE post_id = old.id; END",
+    f"CREATE TRIGGER feed_post_fts_update AFTER UPDATE OF content ON feed_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) "
+    f"SELECT 'delete', id, old.content FROM {KEY_TABLE} WHERE post_id = old.id; "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) SELECT id, new.content FROM {KEY_TABLE} WHERE post_id = new.id; END",
+    f"INSERT INTO {KEY_TABLE}(post_id) SELECT id FROM feed_post",
+    f"INSERT INTO {FTS_TABLE}(rowid, content) "
+    f"SELECT {KEY_TABLE}.id, feed_post.content FROM {KEY_TABLE} JOIN feed_post ON feed_post.id = {KEY_TABLE}.post_id",
+]
+
+DROP_STATEMENTS = [f'DROP TRIGGER IF EXISTS {trigger}' for trigger in TRIGGERS] + [
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+    f'DROP TABLE IF EXISTS {KEY_TABLE}',
+]
+
+SEARCH_SQL = (
+    f'SELECT feed_post.* FROM {FTS_TABLE} JOIN {KEY_TABLE} ON {KEY_TABLE}.id = {FTS_TABLE}.rowid '
+    f'JOIN feed_post ON feed_post.id = {KEY_TABLE}.post_id '
+    f'WHERE {FTS_TABLE} MATCH %s ORDER BY bm25({FTS_TABLE}), feed_post.created_date DESC LIMIT %s OFFSET %s'
+)
+
+
+def has_fts5(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+
+def has_index(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+def has_triggers(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'feed_post'")
+        return set(TRIGGERS) <= {row[0] for row in cursor.fetchall()}
+
+
+def drop_index(connection):
+    with connection.cursor() as cursor:
+        for statement in DROP_STATEMENTS:
+            cursor.execute(statement)
+
+
+def build_index(connection):
+    """
+    (Re)create the index and its triggers and fill it from ``feed_post``.
+    """
+    drop_index(connection)
+    with connection.cursor() as cursor:
+        for statement in CREATE_STATEMENTS:
+            cursor.execute(statement)
+
+
+def restore_index(using, **kwargs):
+    """
+    ``post_migrate`` receiver rebuilding an index whose triggers were dropped
+    with a rebuilt ``feed_post`` table.
+    """
+    connection = connections[using]
+    if has_index(connection) and not has_triggers(connection):
+        build_index(connection)
+
+
+def get_terms(query):
+    return TERM.findall(query.lower())
+
+
+def to_match_query(terms):
+    """
+    FTS5 query requiring every term, the last one as a prefix so results
+    show up while the user is still typing. Terms are quoted so user input
+    can't use the query syntax.
+    """
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+class PostSearch:
+    """
+    Lazy, relevance ordered search results, sliced by the paginator.
+    """
+
+    def __init__(self, query):
+        self.terms = get_terms(query)
+
+    def __getitem__(self, item):
+        start, stop = item.start or 0, item.stop
+        if not self.terms:
+            return []
+        connection = connections[router.db_for_read(Post)]
+        if has_index(connection):
+            return list(Post.objects.db_manager(connection.alias).raw(
+                SEARCH_SQL, [to_match_query(self.terms), stop - start, start]))
+        condition = Q()
+        for term in self.terms:
+            condition &= Q(content__icontains=term)
+        return list(Post.objects.filter(condition).order_by('-created_date', '-id')[start:stop])
+
+
+class UserSearch:
+    """
+    Users whose username starts with the query, exact match first, or whose
+    email is the query. Both read a range of a case-insensitive index.
+    """
+
+    def __init__(self, query):
+        self.query = query.lower()
+
+    def __getitem__(self, item):
+        users = CustomUser.objects.filter(is_active=True).only('id', 'username')
+        if '@' in self.query:
+            users = users.alias(email_ci=Lower('email')).filter(email_ci=self.query)
+        else:
+            users = users.alias(username_ci=Lower('username')).filter(
+                username_ci__gte=self.query, username_ci__lt=self.query + '\U0010ffff').order_by('username_ci')
+        return list(users[item])
@@ -1,8 +1,14 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
 from rest_framework import serializers
-from feed.models import Post, Like, Comment
+from feed import fast_serializers
+from feed.counters import get_count
+from feed.models import Post, Like, Comment, MediaAsset, UploadSession
+from feed.prefetch import get_recent_comment_limit
+from social_media_assignment.profiler import ProfiledSerializerMixin
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Comment
         exclude = ('modified_by', 'created_by', 'date_modified')
@@ -11,8 +17,44 @@ class CommentSerializer(serializers.ModelSerializer):
         }
 
 
-class PostSerializer(serializers.ModelSerializer):
+class MediaAssetSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    url = serializers.SerializerMethodField(read_only=True)
+    variants = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = MediaAsset
+        fields = ('id', 'status', 'content_type', 'size', 'url', 'variants')
+
+    def get_url(self, obj):
+        return obj.file.url if obj.status == MediaAsset.READY else None
+
+    def get_variants(self, obj):
+        return {name: default_storage.url(variant) for name, variant in obj.variants.items()}
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    asset = MediaAssetSerializer(read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'filename', 'content_type', 'size', 'received', 'asset')
+        read_only_fields = ('received',)
+
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('Uploads must be at least 1 byte.')
+        max_size = getattr(settings, 'FEED_UPLOAD_MAX_SIZE', None)
+        if max_size is not None and value > max_size:
+            raise serializers.ValidationError(f'Uploads must be between 1 and {max_size} bytes.')
+        return value
+
+
+class PostSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     comments = serializers.SerializerMethodField(read_only=True)
+    media = serializers.SerializerMethodField(read_only=True)
+    like_count = serializers.SerializerMethodField(read_only=True)
+    comment_count = serializers.SerializerMethodField(read_only=True)
+    liked_by_me = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Post
@@ -22,10 +64,45 @@ class PostSerializer(serializers.ModelSerializer):
             'created_date': {'read_only': True},
         }
 
+    def validate_asset(self, value):
+        request = self.context.get('request')
+        if value is not None and request is not None and not UploadSession.objects.filter(
+                user_id=request.user.id, asset=value).exists():
+            raise serializers.ValidationError('Unknown media asset.')
+        return value
+
+    def get_media(self, obj):
+        if obj.asset_id is None:
+            return None
+        if fast_serializers.is_enabled():
+            return fast_serializers.serialize(MediaAssetSerializer, obj.asset, many=False)
+        return MediaAssetSerializer(obj.asset).data
+
     def get_comments(self, obj):
-        serializer = CommentSerializer(obj.comments.all().order_by('-created_date'), many=True)
+        # Views prefetch ``recent_comments`` for the whole page, see ``feed.prefetch``.
+        comments = getattr(obj, 'recent_comments', None)
+        if comments is None:
+            comments = obj.comments.order_by('-created_date', '-id')[:get_recent_comment_limit()]
+        if fast_serializers.is_enabled():
+            return fast_serializers.serialize(CommentSerializer, comments)
+        serializer = CommentSerializer(comments, many=True)
         return serializer.data
 
+    def get_like_count(self, obj):
+        return get_count(obj, 'like_count')
+
+    def get_comment_count(self, obj):
+        return get_count(obj, 'comment_count')
+
+    def get_liked_by_me(self, obj):
+        liked_by_me = getattr(obj, 'liked_by_me', None)
+        if liked_by_me is not None:
+            return liked_by_me
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return False
+        return Like.objects.filter(user_id=request.user.id, post=obj).exists()
+
 
 class LikeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -36,4 +113,14 @@ class LikeSerializer(serializers.ModelSerializer):
         }
 
 
+class BufferedLikeSerializer(serializers.Serializer):
+    """
+    Shape-only validation for likes accepted in write-behind mode, the post is
+    checked when the buffer is flushed.
+    """
+    post = serializers.UUIDField()
+
 
+class UserSearchSerializer(serializers.Serializer):
+    user_id = serializers.UUIDField(source='id')
+    username = serializers.CharField()
@@ -0,0 +1,112 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from accounts import social_graph
+from accounts.models import UserProfile
+from feed import counters, events, page_cache, ranking
+from feed.models import Comment, Like, MediaAsset, Post
+from feed.timeline import get_timeline_store
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        owners = get_timeline_store().add_post(instance)
+        page_cache.post_added(instance, owners)
+        ranking.post_added(instance, owners)
+
+
+@receiver(post_delete, sender=Post)
+def retract_post(sender, instance, **kwargs):
+    get_timeline_store().remove_post(instance)
+
+
+def _timeline_edges(edges):
+    """
+    Turn ``(follower_id, followee_id)`` follow edges into ``(owner_id, source_id)``
+    timeline edges: a followee's feed shows their followers' posts.
+    """
+    return [(followee, follower) for follower, followee in edges]
+
+
+@receiver(m2m_changed, sender=UserProfile.followers.through)
+def sync_timeline_on_follow(sender, instance, action, reverse, pk_set, **kwargs):
+    store = get_timeline_store()
+    if action == 'post_add':
+        edges = _timeline_edges(social_graph.follow_edges(instance, reverse, pk_set))
+        store.add_edges(edges)
+    elif action == 'post_remove':
+        edges = _timeline_edges(social_graph.follow_edges(instance, reverse, pk_set))
+        store.remove_edges(edges)
+    elif action == 'pre_clear':
+        edges = _timeline_edges(social_graph.current_edges(instance, reverse))
+        store.remove_edges(edges)
+    else:
+        return
+    owners = {owner for owner, _ in edges}
+    page_cache.bump(page_cache.TIMELINE, owners)
+    ranking.timelines_changed(owners)
+    if action == 'post_add':
+        events.hub.add_topics(edges)
+    else:
+        events.hub.remove_topics(edges)
+
+
+COUNTER_FIELD_BY_MODEL = {Like: 'like_count', Comment: 'comment_count'}
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_save, sender=Comment)
+def count_engagement(sender, instance, created, **kwargs):
+    if created:
+        counters.increment(instance.post_id, COUNTER_FIELD_BY_MODEL[sender])
+        ranking.record_engagement(instance.user_id, instance.post_id, COUNTER_FIELD_BY_MODEL[sender])
+
+
+@receiver(post_delete, sender=Like)
+@receiver(post_delete, sender=Comment)
+def uncount_engagement(sender, instance, **kwargs):
+    # Deferred until commit: when the post itself is being deleted its shards
+    # may not be gone yet, and the decrement must not recreate one.
+    transaction.on_commit(partial(counters.increment, instance.post_id, COUNTER_FIELD_BY_MODEL[sender], -1))
+    ranking.record_engagement(instance.user_id, instance.post_id, COUNTER_FIELD_BY_MODEL[sender], -1)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_feed_pages_on_post_save(sender, instance, created, **kwargs):
+    if not created:
+        page_cache.bump(page_cache.POST, [instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_feed_pages_on_post_delete(sender, instance, **kwargs):
+    page_cache.bump(page_cache.POST, [instance.pk])
+    ranking.post_removed(instance)
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Like)
+@receiver(post_delete, sender=Comment)
+def invalidate_feed_pages_on_engagement(sender, instance, **kwargs):
+    page_cache.bump(page_cache.POST, [instance.post_id])
+
+
+@receiver(post_save, sender=MediaAsset)
+def invalidate_feed_pages_on_media(sender, instance, created, **kwargs):
+    if not created:
+        page_cache.bump(page_cache.POST, Post.objects.filter(asset=instance).values_list('pk', flat=True))
+
+
+PUBLISHERS = {Post: events.publish_post, Like: events.publish_like, Comment: events.publish_comment}
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Like)
+@receiver(post_save, sender=Comment)
+def publish_event(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(PUBLISHERS[sender], instance))
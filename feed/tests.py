@@ -1,9 +1,45 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
+from uuid import UUID
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, router
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from accounts.authentication import auth_versions
 from accounts.models import CustomUser, UserProfile
-from feed.models import Post, Like, Comment
+from accounts.serializers import UserTokenObtainPairSerializer
+from feed.models import Post, Like, Comment, TimelineEntry, PostCounterShard, MediaAsset
+from feed import events, fast_serializers, page_cache, search
+from feed.async_views import AsyncPostListCreateAPIView, AsyncPostDetailView, AsyncLikeCreateView, \
+    AsyncCommentCreateView, EventStreamView
+from feed.counters import get_count
+from feed.like_buffer import LikeBuffer
+from feed.prefetch import prefetch_posts
 from feed.serializers import PostSerializer, LikeSerializer, CommentSerializer
+from feed.views import PostListCreateAPIView, PostDetailView
+from rest_framework.renderers import JSONRenderer
+from social_media_assignment import metrics
+from social_media_assignment.database import ReplicaReadMiddleware
+from social_media_assignment.profiler import SlowRequestProfilerMiddleware
+from social_media_assignment.renderers import FastJSONRenderer
 
 
 class PostListCreateAPIViewTests(TestCase):
@@ -169,3 +205,1394 @@ class CommentCreateViewTests(TestCase):
         response = self.client.post(self.url, invalid_payload, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(Comment.objects.count(), 0)
+
+
+class TimelineFanOutTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = '/feed/posts/'
+        self.user1 = CustomUser.objects.create_user(username='user1', password='password1', email='test1@example.com')
+        self.user2 = CustomUser.objects.create_user(username='user2', password='password2', email='test2@example.com')
+        self.user1_profile = UserProfile.objects.create(user=self.user1)
+        self.user2_profile = UserProfile.objects.create(user=self.user2)
+        self.user1_profile.followers.add(self.user2)
+        self.client.force_authenticate(user=self.user1)
+
+    def feed_ids(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [post['id'] for post in response.data['results']]
+
+    def test_post_is_fanned_out_on_create(self):
+        post = Post.objects.create(content='Hello', user=self.user2)
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.user1, post=post).exists())
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.user2, post=post).exists())
+        self.assertEqual(self.feed_ids(), [str(post.id)])
+
+    def test_deleted_post_leaves_timeline(self):
+        post = Post.objects.create(content='Hello', user=self.user2)
+        post.delete()
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed_ids(), [])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        self.user1_profile.followers.remove(self.user2)
+        post = Post.objects.create(content='Hello', user=self.user2)
+        self.assertEqual(self.feed_ids(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user1_profile.followers.add(self.user2)
+        self.assertEqual(self.feed_ids(), [str(post.id)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user2.following.remove(self.user1_profile)
+        self.assertEqual(self.feed_ids(), [])
+
+    def test_rebuild_timelines_command(self):
+        own_post = Post.objects.create(content='Mine', user=self.user1)
+        other_post = Post.objects.create(content='Theirs', user=self.user2)
+        TimelineEntry.objects.all().delete()
+
+        call_command('rebuild_timelines', stdout=StringIO())
+
+        self.assertEqual(set(self.feed_ids()), {str(own_post.id), str(other_post.id)})
+
+
+@override_settings(FEED_FANOUT_THRESHOLD=1)
+class HybridTimelineTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = '/feed/posts/'
+        self.user1 = CustomUser.objects.create_user(username='user1', password='password1', email='test1@example.com')
+        self.user2 = CustomUser.objects.create_user(username='user2', password='password2', email='test2@example.com')
+        self.celebrity = CustomUser.objects.create_user(username='celebrity', password='password3',
+                                                        email='test3@example.com')
+        self.user1_profile = UserProfile.objects.create(user=self.user1)
+        self.user2_profile = UserProfile.objects.create(user=self.user2)
+        UserProfile.objects.create(user=self.celebrity)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user1_profile.followers.add(self.user2, self.celebrity)
+            self.user2_profile.followers.add(self.celebrity)
+        self.client.force_authenticate(user=self.user1)
+
+    def test_celebrity_posts_are_not_fanned_out(self):
+        post = Post.objects.create(content='Big news', user=self.celebrity)
+        self.assertEqual(list(TimelineEntry.objects.filter(post=post).values_list('owner_id', flat=True)),
+                         [self.celebrity.id])
+
+    def test_feed_merges_pushed_and_pulled_posts(self):
+        posts = [
+            Post.objects.create(content='Pushed 1', user=self.user2),
+            Post.objects.create(content='Pulled 1', user=self.celebrity),
+            Post.objects.create(content='Own', user=self.user1),
+            Post.objects.create(content='Pulled 2', user=self.celebrity),
+        ]
+        expected = [str(post.id) for post in reversed(posts)]
+
+        first_page = self.client.get(self.url)
+        second_page = self.client.get(first_page.data['next'])
+        self.assertIsNone(second_page.data['next'])
+        self.assertEqual([post['id'] for post in first_page.data['results'] + second_page.data['results']],
+                         expected)
+
+    def test_author_falling_below_threshold_is_backfilled(self):
+        post = Post.objects.create(content='Big news', user=self.celebrity)
+        self.user2_profile.followers.remove(self.celebrity)
+        self.assertEqual(set(TimelineEntry.objects.filter(post=post).values_list('owner_id', flat=True)),
+                         {self.celebrity.id, self.user1.id})
+        response = self.client.get(self.url)
+        self.assertEqual([item['id'] for item in response.data['results']], [str(post.id)])
+
+    def test_feed_deduplicates_posts_pushed_before_threshold(self):
+        with self.settings(FEED_FANOUT_THRESHOLD=None):
+            post = Post.objects.create(content='Pushed before', user=self.celebrity)
+        response = self.client.get(self.url)
+        self.assertEqual([item['id'] for item in response.data['results']], [str(post.id)])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user1 = CustomUser.objects.create_user(username='user1', password='password1', email='test1@example.com')
+        UserProfile.objects.create(user=self.user1)
+        self.client.force_authenticate(user=self.user1)
+
+    def collect(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_feed_pages_break_ties_on_id(self):
+        posts = [Post.objects.create(content=f'Content {i}', user=self.user1) for i in range(7)]
+        created_date = posts[0].created_date
+        Post.objects.update(created_date=created_date)
+        TimelineEntry.objects.update(post_created_date=created_date)
+
+        expected = sorted((str(post.id) for post in posts), key=lambda pk: UUID(pk), reverse=True)
+        self.assertEqual(self.collect('/feed/posts/'), expected)
+
+    def test_post_comments_are_paginated_newest_first(self):
+        post = Post.objects.create(content='Content', user=self.user1)
+        comments = [Comment.objects.create(content=f'Comment {i}', user=self.user1, post=post) for i in range(5)]
+
+        ids = self.collect(f'/feed/posts/{post.id}/comments/?page_size=2')
+        self.assertEqual(ids, [str(comment.id) for comment in reversed(comments)])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/feed/posts/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(FEED_RECENT_COMMENTS=2)
+class PostCommentPrefetchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user1 = CustomUser.objects.create_user(username='user1', password='password1', email='test1@example.com')
+        self.user2 = CustomUser.objects.create_user(username='user2', password='password2', email='test2@example.com')
+        self.user1_profile = UserProfile.objects.create(user=self.user1)
+        self.user1_profile.followers.add(self.user2)
+        self.client.force_authenticate(user=self.user1)
+        for i in range(8):
+            post = Post.objects.create(content=f'Content {i}', user=self.user2 if i % 2 else self.user1)
+            for j in range(3):
+                Comment.objects.create(content=f'Comment {j}', user=self.user2, post=post)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries), response
+
+    def test_feed_query_count_is_independent_of_page_size(self):
+        small_page_queries, small_page = self.count_queries('/feed/posts/?page_size=2')
+        large_page_queries, large_page = self.count_queries('/feed/posts/?page_size=8')
+        self.assertEqual(len(small_page.data['results']), 2)
+        self.assertEqual(len(large_page.data['results']), 8)
+        self.assertEqual(small_page_queries, large_page_queries)
+
+    def test_posts_embed_recent_comments_and_count(self):
+        _, response = self.count_queries('/feed/posts/')
+        for item in response.data['results']:
+            comments = Comment.objects.filter(post_id=item['id']).order_by('-created_date', '-id')
+            self.assertEqual(item['comment_count'], 3)
+            self.assertEqual([comment['id'] for comment in item['comments']],
+                             [str(comment.id) for comment in comments[:2]])
+
+    def test_liked_by_me_costs_one_query_per_page(self):
+        posts = list(Post.objects.order_by('-created_date', '-id'))
+        Like.objects.create(user=self.user1, post=posts[0])
+        Like.objects.create(user=self.user2, post=posts[1])
+        Like.objects.create(user=self.user1, post=posts[5])
+
+        small_page_queries, _ = self.count_queries('/feed/posts/?page_size=2')
+        large_page_queries, response = self.count_queries('/feed/posts/?page_size=8')
+        self.assertEqual(small_page_queries, large_page_queries)
+        liked = {item['id'] for item in response.data['results'] if item['liked_by_me']}
+        self.assertEqual(liked, {str(posts[0].id), str(posts[5].id)})
+        self.assertEqual({item['id']: item['like_count'] for item in response.data['results']}[str(posts[1].id)], 1)
+
+        _, response = self.count_queries(f'/feed/posts/{posts[5].id}/')
+        self.assertTrue(response.data['liked_by_me'])
+
+    def test_post_detail_matches_serializer(self):
+        post = Post.objects.filter(user=self.user1).first()
+        _, response = self.count_queries(f'/feed/posts/{post.id}/')
+        self.assertEqual(response.data, PostSerializer(post).data)
+
+
+class PostCounterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(username='testuser', password='testpassword')
+        self.other_user = CustomUser.objects.create_user(username='otheruser', password='testpassword',
+                                                         email='other@example.com')
+        self.post = Post.objects.create(content='This is a test post content.', user=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def get_counts(self):
+        response = self.client.get(f'/feed/posts/{self.post.id}/')
+        return response.data['like_count'], response.data['comment_count']
+
+    def test_like_and_comment_views_increment_counters(self):
+        self.client.post('/feed/like/', {'user': self.user.id, 'post': self.post.id}, format='json')
+        self.client.post('/feed/comment/', {'user': self.user.id, 'post': self.post.id, 'content': 'Hi'},
+                         format='json')
+        self.client.post('/feed/comment/', {'user': self.user.id, 'post': self.post.id, 'content': 'Hi'},
+                         format='json')
+        self.assertEqual(self.get_counts(), (1, 2))
+
+    def test_deletes_decrement_counters(self):
+        like = Like.objects.create(user=self.user, post=self.post)
+        Like.objects.create(user=self.other_user, post=self.post)
+        with self.captureOnCommitCallbacks(execute=True):
+            like.delete()
+        self.assertEqual(self.get_counts(), (1, 0))
+
+    def test_deleting_post_with_engagement(self):
+        Like.objects.create(user=self.user, post=self.post)
+        Comment.objects.create(user=self.user, post=self.post, content='Hi')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.delete()
+        self.assertFalse(PostCounterShard.objects.exists())
+
+    def test_reconcile_counters_fixes_drift(self):
+        Like.objects.create(user=self.user, post=self.post)
+        Comment.objects.create(user=self.user, post=self.post, content='Hi')
+        Like.objects.bulk_create([Like(user=self.other_user, post=self.post)])
+        PostCounterShard.objects.update(comment_count=5)
+
+        call_command('reconcile_counters', stdout=StringIO())
+
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (2, 1))
+        self.assertFalse(PostCounterShard.objects.exists())
+        self.assertEqual(self.get_counts(), (2, 1))
+
+
+@override_settings(FEED_LIKE_WRITE_MODE='buffered')
+class BufferedLikeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(username='testuser', password='testpassword')
+        self.post = Post.objects.create(content='This is a test post content.', user=self.user)
+        self.client.force_authenticate(user=self.user)
+        self.buffer = LikeBuffer(flush_interval=None, max_batch=3)
+        patcher = mock.patch('feed.views.get_like_buffer', return_value=self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def like(self, post_id):
+        return self.client.post('/feed/like/', {'post': post_id}, format='json')
+
+    def test_likes_are_queued_then_flushed(self):
+        response = self.like(self.post.id)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Like.objects.count(), 0)
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertTrue(Like.objects.filter(user=self.user, post=self.post).exists())
+        self.assertEqual(self.client.get(f'/feed/posts/{self.post.id}/').data['like_count'], 1)
+        self.assertEqual(self.buffer.stats['last_batch_size'], 1)
+
+    def test_flush_skips_duplicates_and_missing_posts(self):
+        Like.objects.create(user=self.user, post=self.post)
+        other_post = Post.objects.create(content='Other', user=self.user)
+        self.buffer.add(self.user.id, self.post.id)
+        self.buffer.add(self.user.id, other_post.id)
+        self.buffer.add(self.user.id, other_post.id)  # reaching MAX_BATCH flushes inline
+
+        self.assertEqual(self.buffer.pending(), 0)
+        self.assertEqual(Like.objects.count(), 2)
+        self.assertEqual(self.buffer.stats['written'], 1)
+
+        self.like(UUID(int=0))
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_invalid_payload(self):
+        response = self.client.post('/feed/like/', {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.buffer.pending(), 0)
+
+    def test_async_likes_can_flush_inline(self):
+        self.buffer.max_batch = 1
+        request = APIRequestFactory().post('/feed/like/', {'post': self.post.id}, format='json')
+        force_authenticate(request, user=self.user)
+        response = async_to_sync(AsyncLikeCreateView.as_view())(request)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.buffer.pending(), 0)
+        self.assertTrue(Like.objects.filter(user=self.user, post=self.post).exists())
+
+    def test_journal_is_replayed(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        journal = os.path.join(directory.name, 'likes.journal')
+        other_post = Post.objects.create(content='Other', user=self.user)
+        dead = LikeBuffer(flush_interval=None, journal=journal)
+        dead.add(self.user.id, self.post.id)
+        dead.close()
+        alive = LikeBuffer(flush_interval=None, journal=journal)
+        self.addCleanup(alive.close)
+        alive.add(self.user.id, other_post.id)
+
+        # Only the dead buffer's journal is taken over, and flushed right away.
+        replayed = LikeBuffer(flush_interval=None, journal=journal)
+        self.addCleanup(replayed.close)
+        self.assertEqual(replayed.pending(), 0)
+        self.assertEqual(list(Like.objects.values_list('post_id', flat=True)), [self.post.id])
+        self.assertEqual(len(os.listdir(directory.name)), 2)
+
+        alive.flush()
+        self.assertEqual(Like.objects.count(), 2)
+        self.assertEqual(os.path.getsize(alive._journal_file.name), 0)
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=directory.name, FEED_MEDIA_PROCESSING='inline',
+                                              FEED_UPLOAD_TEMP_DIR=os.path.join(directory.name, 'uploads'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.content = b'0123456789' * 10
+
+    def upload(self, content, chunk_size=40):
+        response = self.client.post('/feed/uploads/', {'filename': 'clip.mp4', 'size': len(content)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        url = f'/feed/uploads/{response.data["id"]}/'
+        for start in range(0, len(content), chunk_size):
+            chunk = content[start:start + chunk_size]
+            response = self.client.put(url, chunk, content_type='application/octet-stream',
+                                       HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(chunk) - 1}/{len(content)}')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url).data['received'], len(content))
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'{url}complete/')
+
+    def test_chunked_upload_creates_processed_asset(self):
+        response = self.upload(self.content)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        asset = MediaAsset.objects.get()
+        self.assertEqual(asset.status, MediaAsset.READY)
+        self.assertEqual(asset.content_type, 'video/mp4')
+        with asset.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertTrue(asset.file.name.startswith(f'assets/{asset.sha256[:2]}/{asset.sha256}'))
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, 'uploads')), [])
+
+    def test_upload_size_is_validated(self):
+        def errors(size):
+            response = self.client.post('/feed/uploads/', {'filename': 'clip.mp4', 'size': size}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            return [str(error) for error in response.data['size']]
+
+        with override_settings(FEED_UPLOAD_MAX_SIZE=100):
+            self.assertEqual(errors(101), ['Uploads must be between 1 and 100 bytes.'])
+        with override_settings(FEED_UPLOAD_MAX_SIZE=None):
+            self.assertEqual(errors(0), ['Uploads must be at least 1 byte.'])
+            response = self.client.post('/feed/uploads/', {'filename': 'clip.mp4', 'size': 10 ** 12}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_identical_uploads_are_deduplicated(self):
+        first = self.upload(self.content)
+        second = self.upload(self.content, chunk_size=30)
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertEqual(MediaAsset.objects.count(), 1)
+
+    def test_concurrent_completion_keeps_one_asset(self):
+        sha256 = hashlib.sha256(self.content).hexdigest()
+        save = default_storage.save
+
+        def racing_save(name, content):
+            # Another request completes the same content first.
+            winner = save(name, ContentFile(self.content))
+            MediaAsset.objects.create(user=self.user, sha256=sha256, file=winner, size=len(self.content))
+            return save(name, content)
+
+        with mock.patch('feed.media.default_storage.save', side_effect=racing_save):
+            response = self.upload(self.content)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        asset = MediaAsset.objects.get()
+        self.assertEqual(response.data['id'], str(asset.id))
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, 'assets', sha256[:2])),
+                         [os.path.basename(asset.file.name)])
+
+    def test_failed_asset_is_processed_again(self):
+        first = self.upload(self.content)
+        MediaAsset.objects.update(status=MediaAsset.FAILED)
+        second = self.upload(self.content)
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertEqual(MediaAsset.objects.get().status, MediaAsset.READY)
+
+    def test_out_of_order_chunk_is_rejected(self):
+        response = self.client.post('/feed/uploads/', {'filename': 'clip.mp4', 'size': 100}, format='json')
+        url = f'/feed/uploads/{response.data["id"]}/'
+        response = self.client.put(url, b'x' * 10, content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE='bytes 50-59/100')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['received'], 0)
+
+        response = self.client.post(f'{url}complete/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_post_references_finished_asset(self):
+        asset_id = self.upload(self.content).data['id']
+        response = self.client.post('/feed/posts/', {'content': 'Watch this', 'asset': asset_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['media']['status'], MediaAsset.READY)
+        self.assertTrue(response.data['media']['url'].startswith(settings.MEDIA_URL))
+
+        other_user = CustomUser.objects.create_user(username='other', password='password', email='o@example.com')
+        self.client.force_authenticate(user=other_user)
+        response = self.client.post('/feed/posts/', {'content': 'Stolen', 'asset': asset_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FeedPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user1 = CustomUser.objects.create_user(username='user1', password='password1', email='test1@example.com')
+        self.user2 = CustomUser.objects.create_user(username='user2', password='password2', email='test2@example.com')
+        self.user3 = CustomUser.objects.create_user(username='user3', password='password3', email='test3@example.com')
+        self.user1_profile = UserProfile.objects.create(user=self.user1)
+        self.user1_profile.followers.add(self.user2)
+        self.client.force_authenticate(user=self.user1)
+        self.post = Post.objects.create(content='Hello', user=self.user2)
+
+    def test_unchanged_feed_is_served_from_cache(self):
+        first = self.client.get('/feed/posts/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/feed/posts/')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/feed/posts/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(FEED_PAGE_CACHE_TIMEOUT=None)
+    def test_pages_are_only_cached_by_default_in_a_shared_cache(self):
+        self.assertFalse(page_cache.is_enabled())
+        self.assertNotIn('ETag', self.client.get('/feed/posts/'))
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                              'LOCATION': 'redis://127.0.0.1:6379'}}
+        with override_settings(CACHES=shared):
+            self.assertTrue(page_cache.is_enabled())
+
+    def test_pages_are_cached_per_user_and_cursor(self):
+        self.client.get('/feed/posts/')
+        self.client.force_authenticate(user=self.user3)
+        self.assertEqual(self.client.get('/feed/posts/').data['results'], [])
+        self.client.force_authenticate(user=self.user1)
+        self.assertEqual(len(self.client.get('/feed/posts/?page_size=1').data['results']), 1)
+
+    def test_if_none_match_compares_whole_etags(self):
+        etag = self.client.get('/feed/posts/')['ETag']
+        for header in (f'"other", W/{etag}', '*'):
+            response = self.client.get('/feed/posts/', HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        for header in (f'"x{etag[1:]}', f'"{etag}"', etag[:-2] + '"'):
+            response = self.client.get('/feed/posts/', HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_stamps_are_bumped_on_commit(self):
+        etag = self.client.get('/feed/posts/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(user=self.user1, post=self.post)
+            response = self.client.get('/feed/posts/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get('/feed/posts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_engagement_invalidates_the_page(self):
+        etag = self.client.get('/feed/posts/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(user=self.user1, post=self.post)
+        response = self.client.get('/feed/posts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['like_count'], 1)
+        self.assertTrue(response.data['results'][0]['liked_by_me'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(content='Nice', user=self.user2, post=self.post)
+        self.assertEqual(self.client.get('/feed/posts/').data['results'][0]['comment_count'], 1)
+
+    def test_new_and_deleted_posts_invalidate_the_page(self):
+        self.client.get('/feed/posts/')
+        with self.captureOnCommitCallbacks(execute=True):
+            new_post = Post.objects.create(content='Second', user=self.user2)
+        self.assertEqual(self.client.get('/feed/posts/').data['results'][0]['id'], str(new_post.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_post.delete()
+        self.assertEqual([item['id'] for item in self.client.get('/feed/posts/').data['results']],
+                         [str(self.post.id)])
+
+    def test_follow_changes_invalidate_the_page(self):
+        Post.objects.create(content='From user3', user=self.user3)
+        self.assertEqual(len(self.client.get('/feed/posts/').data['results']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user1_profile.followers.add(self.user3)
+        self.assertEqual(len(self.client.get('/feed/posts/').data['results']), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user1_profile.followers.clear()
+        self.assertEqual(self.client.get('/feed/posts/').data['results'], [])
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_pages_read_from_a_replica_are_not_cached(self):
+        caches[settings.DATABASE_PRIMARY_PIN_CACHE].clear()
+        self.assertNotIn('ETag', self.client.get('/feed/posts/'))
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get('/feed/posts/')
+        self.assertTrue(captured)
+
+    @override_settings(FEED_FANOUT_THRESHOLD=0)
+    def test_pulled_authors_invalidate_the_page(self):
+        self.client.get('/feed/posts/')
+        with self.captureOnCommitCallbacks(execute=True):
+            new_post = Post.objects.create(content='Pulled', user=self.user2)
+        self.assertEqual(self.client.get('/feed/posts/').data['results'][0]['id'], str(new_post.id))
+
+
+class AsyncFeedViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.user1 = CustomUser.objects.create_user(username='user1', password='password1', email='test1@example.com')
+        self.user2 = CustomUser.objects.create_user(username='user2', password='password2', email='test2@example.com')
+        self.user1_profile = UserProfile.objects.create(user=self.user1)
+        self.user1_profile.followers.add(self.user2)
+        self.posts = [Post.objects.create(content=f'Content {i}', user=self.user2 if i % 2 else self.user1)
+                      for i in range(5)]
+        Comment.objects.create(content='Nice', user=self.user2, post=self.posts[-1])
+        Like.objects.create(user=self.user1, post=self.posts[-1])
+
+    def call(self, view, method, url, data=None, **kwargs):
+        request = getattr(self.factory, method)(url, data, format='json')
+        force_authenticate(request, user=self.user1)
+        handler = async_to_sync(view.as_view()) if view.view_is_async else view.as_view()
+        response = handler(request, **kwargs)
+        response.render()
+        return response
+
+    def test_views_are_coroutines(self):
+        for view in (AsyncPostListCreateAPIView, AsyncPostDetailView, AsyncLikeCreateView, AsyncCommentCreateView):
+            self.assertTrue(view.view_is_async)
+
+    def test_feed_list_matches_sync_view(self):
+        for url in ('/feed/posts/', '/feed/posts/?page_size=2', '/feed/posts/?page_size=100'):
+            cache.clear()
+            expected = self.call(PostListCreateAPIView, 'get', url).data
+            cache.clear()
+            response = self.call(AsyncPostListCreateAPIView, 'get', url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data, expected)
+
+    @override_settings(FEED_FANOUT_THRESHOLD=0)
+    def test_feed_list_merges_pulled_authors(self):
+        cache.clear()
+        response = self.call(AsyncPostListCreateAPIView, 'get', '/feed/posts/?page_size=100')
+        self.assertEqual([item['id'] for item in response.data['results']],
+                         [str(post.id) for post in reversed(self.posts)])
+        self.assertTrue(response.data['results'][0]['liked_by_me'])
+        self.assertEqual(response.data['results'][0]['comment_count'], 1)
+
+    def test_post_detail(self):
+        post = self.posts[-1]
+        response = self.call(AsyncPostDetailView, 'get', f'/feed/posts/{post.id}/', pk=post.id)
+        self.assertEqual(response.data, self.call(PostDetailView, 'get', f'/feed/posts/{post.id}/', pk=post.id).data)
+
+        missing = UUID(int=0)
+        response = self.call(AsyncPostDetailView, 'get', f'/feed/posts/{missing}/', pk=missing)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.call(AsyncPostDetailView, 'patch', f'/feed/posts/{post.id}/', {'content': 'Edited'}, pk=post.id)
+        self.assertEqual(response.data['content'], 'Edited')
+        response = self.call(AsyncPostDetailView, 'delete', f'/feed/posts/{post.id}/', pk=post.id)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Post.objects.filter(pk=post.id).exists())
+
+    def test_create_post_like_and_comment(self):
+        response = self.call(AsyncPostListCreateAPIView, 'post', '/feed/posts/', {'content': 'Async post'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        post_id = response.data['id']
+
+        response = self.call(AsyncLikeCreateView, 'post', '/feed/like/', {'user': self.user1.id, 'post': post_id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.call(AsyncCommentCreateView, 'post', '/feed/comment/',
+                             {'user': self.user1.id, 'post': post_id, 'content': 'Async comment'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(get_count(Post.objects.get(pk=post_id), 'comment_count'), 1)
+
+    def test_unauthenticated_requests_are_rejected(self):
+        request = self.factory.get('/feed/posts/')
+        response = async_to_sync(AsyncPostListCreateAPIView.as_view())(request)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.user1 = CustomUser.objects.create_user(username='user1', password='password1', email='test1@example.com')
+        self.user2 = CustomUser.objects.create_user(username='user2', password='password2', email='test2@example.com')
+        self.user3 = CustomUser.objects.create_user(username='user3', password='password3', email='test3@example.com')
+        self.user1_profile = UserProfile.objects.create(user=self.user1)
+        self.user1_profile.followers.add(self.user2)
+
+    def create(self, model, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return model.objects.create(**kwargs)
+
+    async def open_stream(self):
+        request = AsyncRequestFactory().get('/feed/events/')
+        force_authenticate(request, user=self.user1)
+        response = await EventStreamView.as_view()(request)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        return stream
+
+    @override_settings(FEED_EVENTS_HEARTBEAT=0.05)
+    async def test_stream_pushes_activity_of_followed_users(self):
+        stream = await self.open_stream()
+        post = await sync_to_async(self.create)(Post, content='Hello', user=self.user2)
+        event = (await asyncio.wait_for(anext(stream), 1)).decode()
+        self.assertIn('event: post\n', event)
+        self.assertEqual(json.loads(event.split('data: ', 1)[1])['id'], str(post.id))
+
+        await sync_to_async(self.create)(Comment, content='Nice', user=self.user2, post=post)
+        self.assertIn('event: comment\n', (await asyncio.wait_for(anext(stream), 1)).decode())
+
+        await sync_to_async(self.create)(Post, content='Not followed', user=self.user3)
+        self.assertEqual(await asyncio.wait_for(anext(stream), 1), b': keep-alive\n\n')
+
+        await sync_to_async(self.user1_profile.followers.add)(self.user3)
+        await sync_to_async(self.create)(Like, user=self.user3, post=post)
+        self.assertIn('event: like\n', (await asyncio.wait_for(anext(stream), 1)).decode())
+
+    @override_settings(FEED_EVENTS_HEARTBEAT=0.05, FEED_EVENTS_MAX_AGE=0.2)
+    async def test_stream_ends_after_max_age_and_unsubscribes(self):
+        stream = await self.open_stream()
+        self.assertEqual(events.hub.subscriber_count(), 1)
+        self.assertEqual({part async for part in stream}, {b': keep-alive\n\n'})
+        self.assertEqual(events.hub.subscriber_count(), 0)
+
+    async def test_slow_consumer_is_told_to_resync(self):
+        subscription = events.hub.subscribe(self.user1.id, [self.user2.id], maxsize=2)
+        self.addCleanup(events.hub.unsubscribe, subscription)
+        for i in range(5):
+            await sync_to_async(events.hub.publish)(self.user2.id, f'data: {i}\n\n')
+        await asyncio.sleep(0)
+        self.assertEqual(await subscription.get(), events.RESYNC)
+        self.assertEqual(subscription.dropped, 5)
+        self.assertTrue(subscription.queue.empty())
+
+        await sync_to_async(events.hub.publish)(self.user2.id, 'data: 5\n\n')
+        self.assertEqual(await asyncio.wait_for(subscription.get(), 1), 'data: 5\n\n')
+
+
+class PostSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.best = Post.objects.create(content='Django search with Django full text indexes', user=self.user)
+        self.other = Post.objects.create(content='Searching Python code and a Django tip', user=self.user)
+        Post.objects.create(content='Nothing relevant here', user=self.user)
+
+    def search(self, query, **params):
+        response = self.client.get('/feed/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.data['results']]
+
+    def test_index_is_used_on_sqlite(self):
+        self.assertTrue(search.has_index(connection))
+
+    def test_hits_are_ranked_by_relevance(self):
+        self.assertEqual(self.search('django'), [str(self.best.id), str(self.other.id)])
+        self.assertEqual(self.search('DJANGO search'), [str(self.best.id), str(self.other.id)])
+        self.assertEqual(self.search('python'), [str(self.other.id)])
+        self.assertEqual(self.search('pyth'), [str(self.other.id)])
+        self.assertEqual(self.search('"unbalanced OR'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.best.content = 'Renamed to something else'
+        self.best.save()
+        self.assertEqual(self.search('django'), [str(self.other.id)])
+        self.assertEqual(self.search('renamed'), [str(self.best.id)])
+        self.other.delete()
+        self.assertEqual(self.search('django'), [])
+
+    def test_results_are_paginated(self):
+        for i in range(5):
+            Post.objects.create(content=f'Paged result {i}', user=self.user)
+        first = self.client.get('/feed/search/', {'q': 'paged', 'page_size': 3}).data
+        second = self.client.get(first['next']).data
+        self.assertEqual(len(first['results']), 3)
+        self.assertEqual(len(second['results']), 2)
+        self.assertIsNone(second['next'])
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get('/feed/search/').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_scan_fallback_without_index(self):
+        with mock.patch('feed.search.has_index', return_value=False):
+            self.assertEqual(set(self.search('django')), {str(self.best.id), str(self.other.id)})
+            self.assertEqual(self.search('django tip'), [str(self.other.id)])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER feed_post_fts_insert')
+        Post.objects.create(content='Missed by the index', user=self.user)
+        self.assertEqual(self.search('missed'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.search('missed')), 1)
+
+    def test_index_does_not_depend_on_post_rowids(self):
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE feed_post SET rowid = rowid + 1000')
+        self.assertEqual(self.search('django'), [str(self.best.id), str(self.other.id)])
+        self.other.delete()
+        self.assertEqual(self.search('django'), [str(self.best.id)])
+
+    def test_migrate_restores_dropped_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER feed_post_fts_insert')
+        search.restore_index(using=connection.alias)
+        Post.objects.create(content='Restored trigger', user=self.user)
+        self.assertEqual(len(self.search('restored')), 1)
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(username='Alice', password='password', email='alice@example.com')
+        self.other = CustomUser.objects.create_user(username='alicia', password='password', email='a2@example.com')
+        CustomUser.objects.create_user(username='bob', password='password', email='bob@example.com')
+        self.client.force_authenticate(user=self.user)
+
+    def search(self, query):
+        response = self.client.get('/feed/search/users/', {'q': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['username'] for item in response.data['results']]
+
+    def test_usernames_match_by_prefix(self):
+        self.assertEqual(self.search('ALI'), ['Alice', 'alicia'])
+        self.assertEqual(self.search('alicia'), ['alicia'])
+        self.assertEqual(self.search('lic'), [])
+
+    def test_emails_match_exactly(self):
+        self.assertEqual(self.search('Alice@Example.com'), ['Alice'])
+        self.assertEqual(self.search('alice@'), [])
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get('/feed/search/users/').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RankedFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user1 = CustomUser.objects.create_user(username='user1', password='password1', email='test1@example.com')
+        self.user2 = CustomUser.objects.create_user(username='user2', password='password2', email='test2@example.com')
+        self.user3 = CustomUser.objects.create_user(username='user3', password='password3', email='test3@example.com')
+        self.user1_profile = UserProfile.objects.create(user=self.user1)
+        self.user1_profile.followers.add(self.user2, self.user3)
+        self.client.force_authenticate(user=self.user1)
+
+    def ranked_ids(self, **params):
+        response = self.client.get('/feed/posts/', {'mode': 'ranked', **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.data['results']]
+
+    def test_engagement_outranks_recency(self):
+        popular = Post.objects.create(content='Popular', user=self.user2)
+        recent = Post.objects.create(content='Recent', user=self.user3)
+        self.assertEqual(self.ranked_ids(), [str(recent.id), str(popular.id)])
+
+        Like.objects.create(user=self.user3, post=popular)
+        Comment.objects.create(content='Great', user=self.user3, post=popular)
+        self.assertEqual(self.ranked_ids(), [str(popular.id), str(recent.id)])
+
+        self.assertEqual([item['id'] for item in self.client.get('/feed/posts/').data['results']],
+                         [str(recent.id), str(popular.id)])
+
+    def test_author_affinity_boosts_posts(self):
+        older = Post.objects.create(content='From a favourite author', user=self.user2)
+        Post.objects.create(content='Liked earlier', user=self.user2)
+        newer = Post.objects.create(content='From someone else', user=self.user3)
+        self.assertEqual(self.ranked_ids()[0], str(newer.id))
+
+        liked = Post.objects.get(content='Liked earlier')
+        Like.objects.create(user=self.user1, post=liked)
+        Comment.objects.create(content='Me again', user=self.user1, post=liked)
+        ranked = self.ranked_ids()
+        self.assertLess(ranked.index(str(older.id)), ranked.index(str(newer.id)))
+
+    def test_follows_drop_cached_pools(self):
+        followed = Post.objects.create(content='Followed', user=self.user2)
+        user4 = CustomUser.objects.create_user(username='user4', password='password4', email='test4@example.com')
+        not_followed = Post.objects.create(content='Not followed yet', user=user4)
+        self.assertEqual(self.ranked_ids(), [str(followed.id)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user1_profile.followers.add(user4)
+        self.assertEqual(self.ranked_ids(), [str(not_followed.id), str(followed.id)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user1_profile.followers.remove(self.user2)
+        self.assertEqual(self.ranked_ids(), [str(not_followed.id)])
+
+    def test_new_posts_reach_cached_pools(self):
+        Post.objects.create(content='First', user=self.user2)
+        self.ranked_ids()
+        new_post = Post.objects.create(content='Second', user=self.user3)
+        self.assertEqual(self.ranked_ids()[0], str(new_post.id))
+        new_post.delete()
+        self.assertNotIn(str(new_post.id), self.ranked_ids())
+
+    @override_settings(FEED_RANKING={'POOL_SIZE': 3})
+    def test_pool_is_bounded_and_paginated(self):
+        posts = [Post.objects.create(content=f'Post {i}', user=self.user2) for i in range(5)]
+        self.assertEqual(self.ranked_ids(page_size=2), [str(posts[4].id), str(posts[3].id)])
+        response = self.client.get('/feed/posts/', {'mode': 'ranked', 'page_size': 2, 'page': 2})
+        self.assertEqual([item['id'] for item in response.data['results']], [str(posts[2].id)])
+        self.assertIsNone(response.data['next'])
+
+    def test_ranked_page_costs_no_more_than_chronological(self):
+        for i in range(6):
+            post = Post.objects.create(content=f'Post {i}', user=self.user2 if i % 2 else self.user3)
+            Comment.objects.create(content='Comment', user=self.user2, post=post)
+        self.ranked_ids()
+        with CaptureQueriesContext(connection) as ranked:
+            self.ranked_ids()
+        with override_settings(FEED_PAGE_CACHE_TIMEOUT=0), CaptureQueriesContext(connection) as chronological:
+            self.client.get('/feed/posts/')
+        self.assertLessEqual(len(ranked.captured_queries), len(chronological.captured_queries))
+
+    def test_unknown_mode_is_rejected(self):
+        self.assertEqual(self.client.get('/feed/posts/', {'mode': 'popular'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=directory.name, MEDIA_SERVE_MODE='django')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.sha256 = 'ab' * 32
+        self.content = b'0123456789' * 10
+        os.makedirs(os.path.join(directory.name, 'assets', 'ab'))
+        with open(os.path.join(directory.name, 'assets', 'ab', f'{self.sha256}.mp4'), 'wb') as file:
+            file.write(self.content)
+        os.makedirs(os.path.join(directory.name, 'file'))
+        with open(os.path.join(directory.name, 'file', 'avatar.png'), 'wb') as file:
+            file.write(self.content)
+        self.url = f'/media/assets/ab/{self.sha256}.mp4'
+
+    def test_content_addressed_file_is_cached_forever(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['ETag'], f'"{self.sha256}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertNotIn('immutable', self.client.get('/media/file/avatar.png')['Cache-Control'])
+
+    def test_only_images_and_videos_are_shown_inline(self):
+        for name in ('page.html', 'image.svg'):
+            with open(os.path.join(settings.MEDIA_ROOT, 'file', name), 'wb') as file:
+                file.write(b'<script>alert(1)</script>')
+            response = self.client.get(f'/media/file/{name}')
+            self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+            self.assertEqual(response['Content-Disposition'], f'attachment; filename="{name}"')
+        response = self.client.get('/media/file/avatar.png')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertFalse(response.get('Content-Disposition', '').startswith('attachment'))
+        self.assertFalse(self.client.get(self.url).get('Content-Disposition', '').startswith('attachment'))
+
+    def test_conditional_requests_return_not_modified(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.sha256}"')
+        self.assertEqual(response.status_code, 304)
+
+        last_modified = self.client.get('/media/file/avatar.png')['Last-Modified']
+        response = self.client.get('/media/file/avatar.png', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests_return_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=200-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_missing_and_escaping_paths_are_not_found(self):
+        self.assertEqual(self.client.get('/media/missing.png').status_code, 404)
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/assets/').status_code, 404)
+
+    def test_only_upload_directories_are_served(self):
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'uploads'))
+        with open(os.path.join(settings.MEDIA_ROOT, 'uploads', 'unfinished.part'), 'wb') as file:
+            file.write(self.content)
+        self.assertEqual(self.client.get('/media/uploads/unfinished.part').status_code, 404)
+        self.assertEqual(self.client.get('/media/assets/../uploads/unfinished.part').status_code, 404)
+
+    def test_transfer_can_be_handed_to_the_web_server(self):
+        with override_settings(MEDIA_SERVE_MODE='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/assets/ab/{self.sha256}.mp4')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+
+        with override_settings(MEDIA_SERVE_MODE='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertTrue(response['X-Sendfile'].endswith(f'{self.sha256}.mp4'))
+
+        with open(os.path.join(settings.MEDIA_ROOT, 'file', 'a b?.png'), 'wb') as file:
+            file.write(self.content)
+        with override_settings(MEDIA_SERVE_MODE='x-accel-redirect'):
+            response = self.client.get('/media/file/a%20b%3F.png')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/file/a%20b%3F.png')
+
+
+class BenchmarkCommandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def generate(self, *args, **options):
+        call_command('generate_dataset', *args, users=30, avg_following=6, posts_per_user=2, likes_per_post=2,
+                     comments_per_post=1, stdout=StringIO(), **options)
+
+    def test_generated_dataset_is_reproducible(self):
+        self.generate('--epoch=2024-01-01T00:00:00Z', prefix='a')
+        through = UserProfile.followers.through.objects
+        followers = sorted(through.filter(userprofile__user__username__startswith='a').values(
+            'userprofile_id').annotate(count=Count('id')).values_list('count', flat=True), reverse=True)
+        edges = sorted(through.values_list('customuser__username', 'userprofile__user__username'))
+        posts = sorted(Post.objects.values_list('user__username', 'content', 'like_count', 'comment_count',
+                                                'created_date'))
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertGreater(followers[0], 2 * followers[len(followers) // 2])
+        self.assertTrue(TimelineEntry.objects.exists())
+        self.assertEqual(max(post[-1] for post in posts).year, 2023)
+
+        CustomUser.objects.all().delete()
+        self.generate('--epoch=2024-01-01T00:00:00Z', prefix='a')
+        self.assertEqual(sorted(through.values_list('customuser__username', 'userprofile__user__username')), edges)
+        self.assertEqual(sorted(Post.objects.values_list('user__username', 'content', 'like_count',
+                                                         'comment_count', 'created_date')), posts)
+
+    def test_benchmark_reports_json_and_leaves_the_data_alone(self):
+        self.generate()
+        counts = Like.objects.count(), Comment.objects.count(), UserProfile.followers.through.objects.count()
+        out = StringIO()
+        call_command('benchmark_feed', iterations=3, warmup=1, sample=5, stdout=out,
+                     scenario=['feed_list', 'post_detail', 'like', 'comment', 'follow'])
+        report = json.loads(out.getvalue())
+        for name in ('feed_list', 'post_detail', 'like', 'comment', 'follow'):
+            scenario = report['scenarios'][name]
+            self.assertEqual(scenario['errors'], 0, name)
+            self.assertEqual(set(scenario['latency_ms']), {'min', 'mean', 'max', 'p50', 'p90', 'p95', 'p99'})
+            self.assertGreater(scenario['queries']['max'], 0)
+            self.assertEqual(scenario['rows_scanned'], 0)
+        self.assertEqual(
+            (Like.objects.count(), Comment.objects.count(), UserProfile.followers.through.objects.count()), counts)
+
+    def test_feed_list_is_measured_cold_and_warm(self):
+        self.generate()
+        out = StringIO()
+        call_command('benchmark_feed', iterations=3, warmup=0, sample=5, stdout=out,
+                     scenario=['feed_list', 'feed_list_cached'])
+        report = json.loads(out.getvalue())
+        self.assertGreater(report['scenarios']['feed_list']['queries']['min'], 0)
+        self.assertEqual(report['scenarios']['feed_list_cached']['queries']['max'], 0)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(username='user', password='password', email='test@example.com')
+        UserProfile.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user)
+        Post.objects.create(user=self.user, content='Post')
+
+    def test_records_queries_and_timings_per_url_name(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get('/feed/posts/')
+        queries = len(captured)
+        endpoint = metrics.registry.get('post-list-create', 'GET')
+        self.assertEqual(endpoint.statuses, {200: 1})
+        self.assertEqual(endpoint.queries.sum, queries)
+        self.assertGreater(endpoint.db_seconds, 0)
+        self.assertGreater(endpoint.serialize_seconds, 0)
+        self.assertGreater(endpoint.response_bytes, 0)
+
+        with override_settings(METRICS_TOKEN='secret'):
+            response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('http_requests_total{view="post-list-create",method="GET",status="200"} 1', body)
+        self.assertIn(f'http_request_queries_sum{{view="post-list-create",method="GET"}} {queries}', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint_needs_staff_or_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret').status_code,
+                         status.HTTP_200_OK)
+
+        staff = CustomUser.objects.create_user(username='staff', password='password', email='s@example.com',
+                                               is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics/').status_code, status.HTTP_200_OK)
+
+    def test_metrics_endpoint_accepts_staff_api_tokens(self):
+        staff = CustomUser.objects.create_user(username='staff', password='password', email='s@example.com',
+                                               is_staff=True)
+        client = APIClient()
+        for user, expected in ((self.user, status.HTTP_404_NOT_FOUND), (staff, status.HTTP_200_OK)):
+            token = UserTokenObtainPairSerializer.get_token(user).access_token
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(client.get('/metrics/').status_code, expected)
+        staff.is_active = False
+        staff.save()
+        auth_versions.clear()
+        self.assertEqual(client.get('/metrics/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_async_requests_are_recorded(self):
+        async def get_response(request):
+            await sync_to_async(Post.objects.count)()
+            return HttpResponse('ok')
+
+        middleware = metrics.RequestMetricsMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(AsyncRequestFactory().get('/feed/posts/'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        endpoint = metrics.registry.get(metrics.UNRESOLVED, 'GET')
+        self.assertEqual((endpoint.statuses, endpoint.queries.sum), ({200: 1}, 1))
+
+    def test_query_budgets(self):
+        self.assertEqual(settings.QUERY_BUDGET_ACTION, 'raise')
+        with override_settings(QUERY_BUDGETS={'post-list-create': 1}):
+            with self.assertRaisesMessage(metrics.QueryBudgetExceeded, 'post-list-create ran'):
+                self.client.get('/feed/posts/')
+        cache.clear()
+        with override_settings(QUERY_BUDGETS={'post-list-create': 1}, QUERY_BUDGET_ACTION='warn'):
+            with self.assertLogs('social_media_assignment.metrics', 'WARNING'):
+                self.assertEqual(self.client.get('/feed/posts/').status_code, status.HTTP_200_OK)
+
+
+class SlowRequestProfilerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(username='user', password='password', email='test@example.com')
+        UserProfile.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user)
+        post = Post.objects.create(user=self.user, content='Post')
+        Comment.objects.create(user=self.user, post=post, content='Comment')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def profiler_settings(self, **options):
+        return override_settings(SLOW_REQUEST_PROFILER={
+            **settings.SLOW_REQUEST_PROFILER, 'DIRECTORY': self.directory, 'INTERVAL': 0.001, **options})
+
+    def reports(self):
+        reports = []
+        for name in sorted(os.listdir(self.directory)):
+            with open(os.path.join(self.directory, name)) as f:
+                reports.append(json.load(f))
+        return reports
+
+    def test_slow_requests_leave_a_report(self):
+        with self.profiler_settings(ENABLED=True, THRESHOLD=0):
+            self.assertEqual(self.client.get('/feed/posts/').status_code, status.HTTP_200_OK)
+        report, = self.reports()
+        self.assertEqual((report['view'], report['status'], report['forced']), ('post-list-create', 200, False))
+        self.assertTrue(report['queries'])
+        self.assertTrue(all(query['plan'] for query in report['queries'] if query['sql'].startswith('SELECT')))
+        self.assertEqual(report['serializers']['PostSerializer']['calls'], 1)
+        self.assertEqual(report['serializers']['CommentSerializer.content']['calls'], 1)
+        self.assertIn('PostSerializer.comments', report['serializers'])
+
+    def test_fast_and_other_requests_are_not_kept(self):
+        with self.profiler_settings(ENABLED=True, THRESHOLD=60):
+            self.client.get('/feed/posts/')
+        with self.profiler_settings(ENABLED=True, THRESHOLD=0, VIEWS=()):
+            self.client.get('/feed/posts/')
+        self.assertEqual(self.reports(), [])
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_header_profiles_metrics_clients_only(self):
+        with self.profiler_settings(MAX_FILES=2):
+            self.client.get('/feed/posts/', HTTP_X_PROFILE_REQUEST='1')
+            self.client.get('/feed/posts/', HTTP_X_PROFILE_REQUEST='1', HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(self.reports(), [])
+            for _ in range(3):
+                self.client.get('/feed/posts/', HTTP_X_PROFILE_REQUEST='1', HTTP_AUTHORIZATION='Bearer secret')
+        reports = self.reports()
+        self.assertEqual(len(reports), 2)
+        self.assertTrue(reports[0]['forced'])
+
+    def test_header_profiles_staff_api_users(self):
+        staff = CustomUser.objects.create_user(username='staff', password='password', email='s@example.com',
+                                               is_staff=True)
+        client = APIClient()
+        for user, reports in ((self.user, 0), (staff, 1)):
+            token = UserTokenObtainPairSerializer.get_token(user).access_token
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            with self.profiler_settings():
+                self.assertEqual(client.get('/feed/posts/', HTTP_X_PROFILE_REQUEST='1').status_code,
+                                 status.HTTP_200_OK)
+            self.assertEqual(len(self.reports()), reports)
+
+    def test_reports_leave_out_query_parameters(self):
+        with self.profiler_settings(ENABLED=True, THRESHOLD=0, VIEWS=('post-search',)):
+            self.client.get('/feed/search/', {'q': 'secretterm'})
+        report, = self.reports()
+        self.assertTrue(report['queries'])
+        self.assertNotIn('params', report['queries'][0])
+        self.assertNotIn('secretterm', json.dumps(report['queries']))
+
+    def test_async_requests_are_profiled(self):
+        async def get_response(request):
+            # The handler calls process_view once the middleware chain ran.
+            middleware.process_view(request, None, (), {})
+            await sync_to_async(Post.objects.count)()
+            return HttpResponse('ok')
+
+        middleware = SlowRequestProfilerMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        request = AsyncRequestFactory().get('/feed/posts/')
+        request.resolver_match = resolve('/feed/posts/')
+        with self.profiler_settings(ENABLED=True, THRESHOLD=0):
+            response = async_to_sync(middleware)(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report, = self.reports()
+        query, = report['queries']
+        self.assertTrue(query['plan'])
+        self.assertFalse(any(line.startswith('EXPLAIN failed') for line in query['plan']))
+
+
+class FastSerializerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='user', password='password', email='test@example.com')
+        UserProfile.objects.create(user=self.user)
+        asset = MediaAsset.objects.create(user=self.user, sha256='a' * 64, file='assets/' + 'a' * 64, size=3,
+                                          content_type='image/png', status=MediaAsset.READY,
+                                          variants={'thumbnail': 'assets/thumb.png'})
+        self.posts = [
+            Post.objects.create(user=self.user, content='Line\u2028separator and ünïcode'),
+            Post.objects.create(user=self.user, content='With media', asset=asset, file='file/upload.txt'),
+        ]
+        Comment.objects.create(user=self.user, post=self.posts[0], content='Comment')
+        Like.objects.create(user=self.user, post=self.posts[1])
+        self.request = APIRequestFactory().get('/feed/posts/')
+        force_authenticate(self.request, user=self.user)
+        self.request.user = self.user
+
+    def render_both(self, serializer_class, instances):
+        context = {'request': self.request}
+        with override_settings(FEED_FAST_SERIALIZERS=False):
+            drf = serializer_class(instances, many=True, context=context).data
+        fast = fast_serializers.serialize(serializer_class, instances, context)
+        return drf, fast
+
+    def test_same_output_as_drf_serializers(self):
+        for serializer_class, instances in (
+            (PostSerializer, prefetch_posts(list(Post.objects.order_by('created_date')), self.user.id)),
+            (PostSerializer, list(Post.objects.order_by('created_date'))),
+            (CommentSerializer, list(Comment.objects.all())),
+            (LikeSerializer, list(Like.objects.all())),
+        ):
+            drf, fast = self.render_both(serializer_class, instances)
+            self.assertEqual(fast, drf)
+            self.assertEqual(FastJSONRenderer().render(fast), JSONRenderer().render(drf))
+
+    def test_values_rows(self):
+        drf, _ = self.render_both(CommentSerializer, list(Comment.objects.all()))
+        rows = Comment.objects.values(*fast_serializers.value_names(CommentSerializer))
+        self.assertEqual(fast_serializers.serialize(CommentSerializer, rows, source=fast_serializers.VALUES), drf)
+        with self.assertRaises(TypeError):
+            fast_serializers.compile_serializer(PostSerializer, fast_serializers.VALUES)
+
+    def test_views_can_fall_back_to_drf(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        fast = client.get(f'/feed/posts/{self.posts[1].id}/').content
+        with override_settings(FEED_FAST_SERIALIZERS=False):
+            self.assertEqual(client.get(f'/feed/posts/{self.posts[1].id}/').content, fast)
+
+        url = f'/feed/posts/{self.posts[0].id}/comments/?page_size=1'
+        Comment.objects.create(user=self.user, post=self.posts[0], content='Second')
+        fast = client.get(url).content
+        with override_settings(FEED_FAST_SERIALIZERS=False):
+            self.assertEqual(client.get(url).content, fast)
+
+
+class DatabaseRoutingTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.pins = caches[settings.DATABASE_PRIMARY_PIN_CACHE]
+        self.pins.clear()
+
+    def route(self, method, path, user=None):
+        request = getattr(RequestFactory(), method)(path)
+        request.user = user or AnonymousUser()
+        request.resolver_match = resolve(path)
+        middleware = ReplicaReadMiddleware(lambda request: HttpResponse(router.db_for_read(Post)))
+        middleware.process_view(request, request.resolver_match.func, (), {})
+        return middleware(request).content.decode()
+
+    def test_sqlite_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_feed_reads_go_to_a_replica(self):
+        self.assertEqual(self.route('get', '/feed/posts/'), 'replica_1')
+        self.assertEqual(self.route('get', f'/feed/posts/{UUID(int=1)}/'), 'replica_1')
+        self.assertEqual(self.route('post', '/feed/posts/'), 'default')
+        self.assertEqual(self.route('get', '/accounts/suggestions/'), 'default')
+        self.assertEqual(router.db_for_read(Post), 'default')
+        self.assertEqual(router.db_for_write(Post), 'default')
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_async_requests_are_routed(self):
+        async def get_response(request):
+            # The handler calls process_view once the middleware chain ran.
+            middleware.process_view(request, request.resolver_match.func, (), {})
+            return HttpResponse(router.db_for_read(Post))
+
+        middleware = ReplicaReadMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        request = AsyncRequestFactory().get('/feed/posts/')
+        request.resolver_match = resolve('/feed/posts/')
+        self.assertEqual(async_to_sync(middleware)(request).content, b'replica_1')
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_the_primary(self):
+        self.assertEqual(self.route('get', '/feed/posts/'), 'default')
+
+    def test_health(self):
+        response = self.client.get('/health/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['databases']['default']['status'], 'ok')
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_writes_pin_the_user_to_the_primary(self):
+        user = CustomUser.objects.create_user(username='writer', password='password', email='writer@example.com')
+        UserProfile.objects.create(user=user)
+        other = CustomUser.objects.create_user(username='other', password='password', email='other@example.com')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        self.assertEqual(client.post('/feed/posts/', {}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.route('get', '/feed/posts/', user), 'replica_1')
+        response = client.post('/feed/posts/', {'content': 'Fresh'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('primary_pin', response.cookies)
+        self.assertTrue(self.pins.get(f'pin:{user.pk}'))
+
+        # Any request of the user, from any client, once authenticated.
+        self.assertEqual(self.route('get', '/feed/posts/', user), 'default')
+        self.assertEqual(self.route('get', '/feed/posts/', other), 'replica_1')
+        self.assertEqual(self.route('get', '/feed/posts/'), 'replica_1')
+        self.pins.delete(f'pin:{user.pk}')
+        self.assertEqual(self.route('get', '/feed/posts/', user), 'replica_1')
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'], DATABASE_PRIMARY_PIN_SECONDS=0)
+    def test_no_pin_without_pin_seconds(self):
+        user = CustomUser.objects.create_user(username='writer', password='password', email='writer@example.com')
+        UserProfile.objects.create(user=user)
+        client = APIClient()
+        client.force_authenticate(user=user)
+        client.post('/feed/posts/', {'content': 'Fresh'}, format='json')
+        self.assertEqual(self.route('get', '/feed/posts/', user), 'replica_1')
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'], DATABASE_PRIMARY_PIN_CACHE='default')
+    def test_replicas_need_a_shared_pin_cache(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, 'DATABASE_PRIMARY_PIN_CACHE'):
+            ReplicaReadMiddleware(lambda request: HttpResponse())
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_pin_without_replicas(self):
+        user = CustomUser.objects.create_user(username='writer', password='password', email='writer@example.com')
+        UserProfile.objects.create(user=user)
+        client = APIClient()
+        client.force_authenticate(user=user)
+        client.post('/feed/posts/', {'content': 'Fresh'}, format='json')
+        self.assertIsNone(self.pins.get(f'pin:{user.pk}'))
+
+
+@skipUnless('replica_1' in settings.DATABASES, 'The test settings add a SQLite replica on SQLite only.')
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReadYourWritesTests(TestCase):
+    """
+    With two SQLite databases, the replica missing the primary's latest rows
+    stands in for replication lag.
+    """
+    databases = {'default', 'replica_1'}
+
+    def setUp(self):
+        cache.clear()
+        caches[settings.DATABASE_PRIMARY_PIN_CACHE].clear()
+        self.user = CustomUser.objects.create_user(username='writer', password='password', email='writer@example.com')
+        self.reader = CustomUser.objects.create_user(username='reader', password='password',
+                                                     email='reader@example.com')
+        # Replicated before the write below.
+        for user in (self.user, self.reader):
+            UserProfile.objects.create(user=user)
+            user.save(using='replica_1')
+            UserProfile.objects.get(user=user).save(using='replica_1')
+
+    def test_writer_reads_own_post(self):
+        writer = APIClient()
+        writer.force_authenticate(user=self.user)
+        response = writer.post('/feed/posts/', {'content': 'Fresh'}, format='json')
+        post_id = response.data['id']
+
+        # Other users read the lagging replica.
+        reader = APIClient()
+        reader.force_authenticate(user=self.reader)
+        self.assertEqual(reader.get(f'/feed/posts/{post_id}/').status_code, status.HTTP_404_NOT_FOUND)
+
+        # Every device of the writer reads the primary.
+        for client in (writer, APIClient()):
+            client.force_authenticate(user=self.user)
+            self.assertEqual(client.get(f'/feed/posts/{post_id}/').status_code, status.HTTP_200_OK)
+            self.assertEqual([post['id'] for post in client.get('/feed/posts/').data['results']], [post_id])
+
+    def test_replica_pages_are_not_cached(self):
+        post = Post.objects.create(user=self.user, content='Fresh')
+        client = APIClient()
+        client.force_authenticate(user=self.reader)
+        self.assertEqual(client.get(f'/feed/posts/{post.id}/').status_code, status.HTTP_404_NOT_FOUND)
+        response = client.get('/feed/posts/')
+        self.assertEqual(response.data['results'], [])
+        self.assertNotIn('ETag', response)
+
+    def test_revoked_tokens_are_checked_on_the_primary(self):
+        client = APIClient()
+        token = UserTokenObtainPairSerializer.get_token(self.user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(client.get('/feed/posts/').status_code, status.HTTP_200_OK)
+
+        self.user.set_password('changed-password')
+        self.user.save()
+        auth_versions.clear()
+        self.assertEqual(client.get('/feed/posts/').status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,233 @@
+import asyncio
+import heapq
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from accounts import social_graph
+from accounts.models import UserProfile
+from feed.models import Post, TimelineEntry
+
+
+def get_fanout_threshold():
+    """
+    Audience size above which an author's posts are pulled at read time instead
+    of being pushed to every timeline. ``None`` always pushes.
+    """
+    return getattr(settings, 'FEED_FANOUT_THRESHOLD', None)
+
+
+def get_feed_sources(user_id):
+    """
+    Return the ids of the users whose posts show up in ``user_id``'s home feed,
+    i.e. the users listed in their ``profile.followers``.
+    """
+    return social_graph.get_follower_ids(user_id)
+
+
+def get_audience_size(author_id):
+    return UserProfile.followers.through.objects.filter(customuser_id=author_id).count()
+
+
+def get_post_audience(author_id):
+    """
+    Return the ids of the users whose home feed should receive a post written by
+    ``author_id``: the author and every user that lists the author in
+    ``profile.followers``. Read from the follow table, a stale cached set would
+    leave followers without the post for good.
+    """
+    owners = UserProfile.followers.through.objects.filter(customuser_id=author_id).values_list(
+        'userprofile__user_id', flat=True)
+    return [author_id] + [owner for owner in owners if owner != author_id]
+
+
+def get_pull_sources(source_ids):
+    """
+    Return the subset of ``source_ids`` whose audience is above the fan-out
+    threshold and whose posts therefore have to be pulled at read time.
+    """
+    threshold = get_fanout_threshold()
+    if threshold is None or not source_ids:
+        return set()
+    audiences = social_graph.get_following_counts(source_ids)
+    return {source for source, audience in audiences.items() if audience > threshold}
+
+
+class Timeline:
+    """
+    Lazy home feed, newest first, that k-way merges the owner's pushed
+    timeline with one ``(created_date, id)`` ordered stream per pulled author.
+
+    Slicing ``[:n]`` reads at most ``n`` rows from each stream, so a page costs
+    one indexed range scan per stream regardless of audience size.
+    ``after(created_date, id)`` narrows every stream to the rows that follow a
+    keyset position, see ``feed.pagination.KeysetCursorPagination``.
+    """
+    ordered = True
+
+    def __init__(self, owner_id, pull_sources=(), position=None):
+        self.owner_id = owner_id
+        self.pull_sources = pull_sources
+        self.position = position
+
+    def after(self, created_date, pk):
+        return Timeline(self.owner_id, self.pull_sources, (created_date, pk))
+
+    def _pushed(self):
+        condition = Q(timeline_entries__owner_id=self.owner_id)
+        if self.position is not None:
+            created_date, pk = self.position
+            condition &= (Q(timeline_entries__post_created_date__lt=created_date) |
+                          Q(timeline_entries__post_created_date=created_date, timeline_entries__post_id__lt=pk))
+        # A single filter() call keeps the owner and position conditions on one join.
+        return Post.objects.filter(condition).order_by(
+            '-timeline_entries__post_created_date', '-timeline_entries__post_id')
+
+    def _pulled(self, source):
+        posts = Post.objects.filter(user_id=source)
+        if self.position is not None:
+            created_date, pk = self.position
+            posts = posts.filter(Q(created_date__lt=created_date) | Q(created_date=created_date, id__lt=pk))
+        return posts.order_by('-created_date', '-id')
+
+    def _streams(self):
+        return [self._pushed()] + [self._pulled(source) for source in self.pull_sources]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, item):
+        if isinstance(item, int):
+            return self[item:item + 1][0]
+        start, stop = item.start or 0, item.stop
+        streams = self._streams()
+        if stop is not None:
+            streams = [stream[:stop] for stream in streams]
+        if len(streams) == 1:
+            return list(streams[0])[start:stop]
+        return merge_streams(streams, stop)[start:stop]
+
+    async def afetch(self, stop):
+        """
+        Async ``self[:stop]``: the streams are read concurrently.
+        """
+        streams = [stream[:stop] for stream in self._streams()]
+        rows = await asyncio.gather(*[_alist(stream) for stream in streams])
+        return merge_streams(rows, stop)
+
+
+async def _alist(queryset):
+    return [row async for row in queryset]
+
+
+def merge_streams(streams, stop=None):
+    """
+    Merge newest-first post streams into one, dropping duplicates and stopping
+    after ``stop`` posts.
+    """
+    posts, seen = [], set()
+    for post in heapq.merge(*streams, key=lambda post: (post.created_date, post.pk), reverse=True):
+        if post.pk in seen:
+            continue
+        seen.add(post.pk)
+        posts.append(post)
+        if stop is not None and len(posts) >= stop:
+            break
+    return posts
+
+
+class DatabaseTimelineStore:
+    """
+    Timeline store backed by the ``TimelineEntry`` table.
+
+    Posts are fanned out to every owner's timeline on write, so reading a home
+    feed is an ordered range scan over a single owner's rows. Authors whose
+    audience exceeds ``FEED_FANOUT_THRESHOLD`` only write to their own
+    timeline; their posts are merged into their audience's feeds on read.
+    When unfollows take an author back to the threshold, the posts they wrote
+    while being pulled are copied to their remaining audience. Changing the
+    threshold setting leaves already written rows alone, run
+    ``rebuild_timelines`` afterwards to re-distribute them.
+    """
+    batch_size = 1000
+
+    def add_post(self, post):
+        """
+        Write ``post`` to its owners' timelines and return those owners, just
+        the author's when the post is pulled at read time.
+        """
+        threshold = get_fanout_threshold()
+        if threshold is not None and get_audience_size(post.user_id) > threshold:
+            owners = [post.user_id]
+        else:
+            owners = get_post_audience(post.user_id)
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(owner_id=owner, post=post, post_created_date=post.created_date) for owner in owners],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        return owners
+
+    def remove_post(self, post):
+        TimelineEntry.objects.filter(post_id=post.pk).delete()
+
+    def add_edges(self, edges):
+        """
+        Backfill timelines after follow edges were added. ``edges`` is an
+        iterable of ``(owner_id, source_id)`` pairs.
+        """
+        owners_by_source = self._group_by_source(edges)
+        for source in get_pull_sources(list(owners_by_source)):
+            owners_by_source[source].intersection_update({source})
+        self._copy_posts(owners_by_source)
+
+    def _copy_posts(self, owners_by_source):
+        if not owners_by_source:
+            return
+        posts = Post.objects.filter(user_id__in=owners_by_source).values_list('id', 'user_id', 'created_date')
+        entries = [
+            TimelineEntry(owner_id=owner, post_id=post_id, post_created_date=created_date)
+            for post_id, source, created_date in posts.iterator()
+            for owner in owners_by_source[source]
+        ]
+        TimelineEntry.objects.bulk_create(entries, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def remove_edges(self, edges):
+        """
+        Drop the posts of unfollowed sources. ``edges`` is an iterable of
+        ``(owner_id, source_id)`` pairs.
+        """
+        threshold = get_fanout_threshold()
+        for source, owners in self._group_by_source(edges).items():
+            TimelineEntry.objects.filter(owner_id__in=owners, post__user_id=source).delete()
+            if threshold is None:
+                continue
+            # Counted without the removed edges, which pre_clear hasn't deleted yet.
+            remaining = list(UserProfile.followers.through.objects.filter(customuser_id=source).exclude(
+                userprofile__user_id__in=owners).values_list('userprofile__user_id', flat=True))
+            if len(remaining) <= threshold < len(remaining) + len(owners):
+                self._copy_posts({source: set(remaining) - {source}})
+
+    def rebuild(self, owner_id):
+        TimelineEntry.objects.filter(owner_id=owner_id).delete()
+        sources = [owner_id] + list(UserProfile.followers.through.objects.filter(
+            userprofile__user_id=owner_id).values_list('customuser_id', flat=True))
+        self.add_edges((owner_id, source) for source in sources)
+
+    def get_posts(self, owner_id):
+        pull_sources = get_pull_sources(get_feed_sources(owner_id))
+        pull_sources.discard(owner_id)
+        return Timeline(owner_id, sorted(pull_sources))
+
+    @staticmethod
+    def _group_by_source(edges):
+        owners_by_source = defaultdict(set)
+        for owner, source in edges:
+            owners_by_source[source].add(owner)
+        return owners_by_source
+
+
+def get_timeline_store():
+    return import_string(getattr(settings, 'FEED_TIMELINE_STORE', 'feed.timeline.DatabaseTimelineStore'))()
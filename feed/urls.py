@@ -1,9 +1,25 @@
+from django.conf import settings
 from django.urls import path
-from feed.views import PostListCreateAPIView, PostDetailView, LikeCreateView, CommentCreateView
+from feed.async_views import EventStreamView
+from feed.views import PostListCreateAPIView, PostDetailView, LikeCreateView, CommentCreateView, \
+    PostCommentListView, PostSearchView, UserSearchView, UploadSessionCreateView, UploadSessionDetailView, \
+    UploadCompleteView
+
+if getattr(settings, 'FEED_ASYNC_VIEWS', False):
+    from feed.async_views import AsyncPostListCreateAPIView as PostListCreateAPIView, \
+        AsyncPostDetailView as PostDetailView, AsyncLikeCreateView as LikeCreateView, \
+        AsyncCommentCreateView as CommentCreateView
 
 urlpatterns = [
     path('posts/', PostListCreateAPIView.as_view(), name='post-list-create'),
     path('posts/<uuid:pk>/', PostDetailView.as_view(), name='post-detail'),
+    path('posts/<uuid:pk>/comments/', PostCommentListView.as_view(), name='post-comment-list'),
+    path('search/', PostSearchView.as_view(), name='post-search'),
+    path('search/users/', UserSearchView.as_view(), name='user-search'),
     path('like/', LikeCreateView.as_view(), name='like-create'),
     path('comment/', CommentCreateView.as_view(), name='comment-create'),
+    path('events/', EventStreamView.as_view(), name='event-stream'),
+    path('uploads/', UploadSessionCreateView.as_view(), name='upload-create'),
+    path('uploads/<uuid:pk>/', UploadSessionDetailView.as_view(), name='upload-detail'),
+    path('uploads/<uuid:pk>/complete/', UploadCompleteView.as_view(), name='upload-complete'),
 ]
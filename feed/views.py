@@ -1,34 +1,211 @@
+import re
+
+from django.conf import settings
+from django.db import transaction
 from rest_framework import generics
-from feed.models import Post, Like, Comment
-from feed.serializers import PostSerializer, LikeSerializer, CommentSerializer
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from feed import fast_serializers, media, page_cache
+from feed.fast_serializers import FastReadSerializerMixin
+from feed.models import Post, Like, Comment, UploadSession
+from feed.pagination import KeysetCursorPagination, RankedPagination
+from feed.prefetch import prefetch_posts
+from feed.ranking import RankedFeed
+from feed.search import PostSearch, UserSearch
+from feed.like_buffer import get_like_buffer
+from feed.serializers import PostSerializer, LikeSerializer, CommentSerializer, BufferedLikeSerializer, \
+    UploadSessionSerializer, MediaAssetSerializer, UserSearchSerializer
+from feed.timeline import get_timeline_store
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
 
 
-class PostListCreateAPIView(generics.ListCreateAPIView):
+class PostListCreateAPIView(FastReadSerializerMixin, generics.ListCreateAPIView):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
+    pagination_class = KeysetCursorPagination
+    modes = ('chronological', 'ranked')
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        post = serializer.save(user=self.request.user)
+        # A brand new post has no comments, spare the serializer the lookups.
+        post.recent_comments, post.pending_counts, post.liked_by_me = [], {}, False
+
+    def get_mode(self):
+        mode = self.request.query_params.get('mode', 'chronological')
+        if mode not in self.modes:
+            raise ValidationError({'mode': f'Expected one of: {", ".join(self.modes)}.'})
+        return mode
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            ranked = self.request.method == 'GET' and self.get_mode() == 'ranked'
+            self._paginator = RankedPagination() if ranked else self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
-        user = self.request.user
-        users = [user.id]
-        followed_to_users = user.profile.followers.all().values_list('id', flat=True).distinct()
-        if followed_to_users.exists():
-            users = users + list(followed_to_users)
-        return Post.objects.filter(user_id__in=users).order_by('-created_date')
+        if self.get_mode() == 'ranked':
+            return RankedFeed(self.request.user.id)
+        return get_timeline_store().get_posts(self.request.user.id)
+
+    def list(self, request, *args, **kwargs):
+        if self.get_mode() == 'ranked':
+            # Ranks move with engagement on any post, ranked pages aren't cached.
+            return super().list(request, *args, **kwargs)
+        response = page_cache.get_cached_response(request)
+        if response is not None:
+            return response
+        response = super().list(request, *args, **kwargs)
+        return page_cache.cache_response(request, response.data, self.paginator.page,
+                                         getattr(self.timeline, 'pull_sources', ()))
 
+    def paginate_queryset(self, queryset):
+        self.timeline = queryset
+        return prefetch_posts(super().paginate_queryset(queryset), self.request.user.id)
 
-class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
+
+class PostDetailView(FastReadSerializerMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
 
+    def get_object(self):
+        post = super().get_object()
+        if self.request.method != 'DELETE':
+            prefetch_posts([post], self.request.user.id)
+        return post
+
+
+class PostSearchView(FastReadSerializerMixin, generics.ListAPIView):
+    """
+    Posts matching every term of ``q``, most relevant first.
+    """
+    serializer_class = PostSerializer
+    pagination_class = RankedPagination
+
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'This query parameter is required.'})
+        return PostSearch(query)
+
+    def paginate_queryset(self, queryset):
+        return prefetch_posts(super().paginate_queryset(queryset), self.request.user.id)
+
+
+class UserSearchView(generics.ListAPIView):
+    """
+    Users whose username starts with ``q``, or whose email is ``q``.
+    """
+    serializer_class = UserSearchSerializer
+    pagination_class = RankedPagination
+
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'This query parameter is required.'})
+        return UserSearch(query)
+
 
 class LikeCreateView(generics.CreateAPIView):
     queryset = Like.objects.all()
     serializer_class = LikeSerializer
 
+    def create(self, request, *args, **kwargs):
+        if getattr(settings, 'FEED_LIKE_WRITE_MODE', 'sync') != 'buffered':
+            return super().create(request, *args, **kwargs)
+
+        serializer = BufferedLikeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        get_like_buffer().add(request.user.id, serializer.validated_data['post'])
+        return Response({'post': serializer.validated_data['post'], 'status': 'queued'},
+                        status=status.HTTP_202_ACCEPTED)
+
 
 class CommentCreateView(generics.CreateAPIView):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
+
+
+class PostCommentListView(FastReadSerializerMixin, generics.ListAPIView):
+    serializer_class = CommentSerializer
+    pagination_class = KeysetCursorPagination
+    fast_serializer_source = fast_serializers.VALUES
+
+    def get_queryset(self):
+        comments = Comment.objects.filter(post_id=self.kwargs['pk'])
+        if fast_serializers.is_enabled():
+            return comments.values(*fast_serializers.value_names(self.serializer_class))
+        return comments
+
+
+class UploadSessionCreateView(generics.CreateAPIView):
+    """
+    Start a resumable upload by announcing its name, type and size.
+    """
+    serializer_class = UploadSessionSerializer
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class UploadSessionDetailView(generics.RetrieveAPIView):
+    """
+    ``GET`` reports how many bytes were received so a client can resume.
+    ``PUT`` appends one chunk: the body is streamed to disk at the offset
+    given by ``Content-Range: bytes <start>-<end>/<size>``, which has to
+    equal the current ``received`` count. Chunks of one upload are written
+    one at a time, the session row stays locked while a chunk is written.
+    """
+    serializer_class = UploadSessionSerializer
+
+    def get_queryset(self):
+        queryset = UploadSession.objects.filter(user_id=self.request.user.id)
+        if self.request.method == 'PUT':
+            queryset = queryset.select_for_update()
+        return queryset
+
+    @transaction.atomic
+    def put(self, request, *args, **kwargs):
+        session = self.get_object()
+        match = CONTENT_RANGE.match(request.headers.get('Content-Range', ''))
+        if match is None:
+            return Response({'message': 'A "Content-Range: bytes start-end/size" header is required.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        start, end, size = map(int, match.groups())
+        if size != session.size or end < start or end >= size:
+            return Response({'message': 'Content-Range does not match the upload.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            received = media.write_chunk(session, request.stream, start, end - start + 1)
+        except media.UploadOffsetError:
+            return Response({'received': session.received}, status=status.HTTP_409_CONFLICT)
+        if not UploadSession.objects.filter(pk=session.pk, received=start).update(received=received):
+            session.refresh_from_db()
+            return Response({'received': session.received}, status=status.HTTP_409_CONFLICT)
+        session.received = received
+        return Response(self.get_serializer(session).data)
+
+
+class UploadCompleteView(generics.GenericAPIView):
+    """
+    Finish an upload: the file is hashed, deduplicated against existing assets
+    and handed to the background media pipeline.
+    """
+    serializer_class = MediaAssetSerializer
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user_id=self.request.user.id).select_for_update()
+
+    @transaction.atomic
+    def post(self, request, *args, **kwargs):
+        session = self.get_object()
+        if session.asset is None:
+            if session.received != session.size:
+                return Response({'received': session.received}, status=status.HTTP_409_CONFLICT)
+            session.asset = media.finish_upload(session)
+            session.save(update_fields=['asset', 'date_modified'])
+        return Response(self.get_serializer(session.asset).data, status=status.HTTP_201_CREATED)
+
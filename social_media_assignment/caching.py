@@ -0,0 +1,17 @@
+"""
+Cache configuration helpers.
+"""
+from django.conf import settings
+
+# Backends whose entries are only seen by the process that wrote them.
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared_cache(alias):
+    """
+    Whether every worker process sees the entries of the cache ``alias``.
+    """
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
@@ -0,0 +1,211 @@
+"""
+Read replica routing and database health checks.
+
+``ReplicaReadMiddleware`` sends the reads of ``GET``/``HEAD`` requests to the
+views listed in ``DATABASE_REPLICA_VIEWS`` (the feed, post detail, search and
+comment list) to one of the ``DATABASE_REPLICAS``, picked at random once per
+request so a request sees one consistent copy. Every other read, and every
+write, goes to the primary through ``PrimaryReplicaRouter``. Without replicas
+configured everything stays on ``default``.
+
+Replicas lag behind the primary. So that users see their own posts, comments
+and likes right away, a successful write request by an authenticated user
+pins that user's reads to the primary for ``DATABASE_PRIMARY_PIN_SECONDS``,
+which should exceed the replication lag. The pin is kept under
+``pin:<user_id>`` in ``DATABASE_PRIMARY_PIN_CACHE``, so it holds on every
+device of the user. That cache has to be shared between the workers (Redis,
+Memcached): a read landing on a worker that doesn't see the pin would hit a
+lagging replica, so ``ReplicaReadMiddleware`` refuses to start with replicas
+and a process local pin cache. The pin is checked once the request is
+authenticated, at its first read routed to a replica. Other users keep reading
+from the replicas.
+Authentication always reads from the primary, see ``primary_reads``, so a
+lagging replica can't accept a revoked token.
+
+Locally, ``DB_REPLICA_NAME`` adds a second SQLite database standing in for a
+replica, ``sync_sqlite_replica`` copies the primary into it. The test settings
+always add one.
+"""
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import JsonResponse
+
+from social_media_assignment.caching import is_shared_cache
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRead:
+    """
+    The replica a request reads from, unless its user is pinned to the
+    primary.
+    """
+
+    def __init__(self, request, alias):
+        self.request = request
+        self.alias = alias
+        self.checked = False
+
+    def get_alias(self):
+        if not self.checked:
+            # The session user and the cache may read the database, from the
+            # primary.
+            with primary_reads():
+                user = getattr(self.request, 'user', None)
+                if user is not None and user.is_authenticated:
+                    self.checked = True
+                    if is_pinned(user.pk):
+                        self.alias = None
+        return self.alias
+
+
+replica_read = contextvars.ContextVar('replica_read', default=None)
+
+
+def get_replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def get_pin_seconds():
+    return getattr(settings, 'DATABASE_PRIMARY_PIN_SECONDS', 5)
+
+
+def get_pin_cache_alias():
+    return getattr(settings, 'DATABASE_PRIMARY_PIN_CACHE', 'default')
+
+
+def check_pin_cache():
+    alias = get_pin_cache_alias()
+    if get_replicas() and not is_shared_cache(alias):
+        raise ImproperlyConfigured(
+            f"Read replicas need a DATABASE_PRIMARY_PIN_CACHE shared between workers, the {alias!r} cache is "
+            f"process local and other workers would miss the pins."
+        )
+
+
+def pin_key(user_id):
+    return f'pin:{user_id}'
+
+
+def is_pinned(user_id):
+    return caches[get_pin_cache_alias()].get(pin_key(user_id)) is not None
+
+
+def pin_to_primary(user_id):
+    if get_pin_seconds() > 0:
+        caches[get_pin_cache_alias()].set(pin_key(user_id), True, get_pin_seconds())
+
+
+def get_read_alias():
+    current = replica_read.get()
+    return None if current is None else current.get_alias()
+
+
+def is_replica_read():
+    return get_read_alias() is not None
+
+
+@contextmanager
+def primary_reads():
+    """
+    Send the reads of the block to the primary, even in a request routed to a
+    replica.
+    """
+    token = replica_read.set(None)
+    try:
+        yield
+    finally:
+        replica_read.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return get_read_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the primary's rows.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Real replicas get the schema by replication, the local SQLite
+        # stand-in (and its test database) is migrated like the primary.
+        return db not in get_replicas() or connections[db].vendor == 'sqlite'
+
+
+class ReplicaReadMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        check_pin_cache()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_read.set(None)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_read.set(None)
+        # Reading a session user queries the database.
+        return await sync_to_async(self.process_response)(request, response)
+
+    def process_response(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400 or not get_replicas():
+            return response
+        # DRF sets the user it authenticated on the request.
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replicas = get_replicas()
+        if not replicas or request.method not in ('GET', 'HEAD'):
+            return None
+        if request.resolver_match.url_name in getattr(settings, 'DATABASE_REPLICA_VIEWS', ()):
+            replica_read.set(ReplicaRead(request, random.choice(replicas)))
+        return None
+
+
+def check_database(alias):
+    start = time.perf_counter()
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+def health_view(request):
+    """
+    ``200`` when every configured database answers, ``503`` otherwise.
+    """
+    databases, healthy = {}, True
+    for alias in settings.DATABASES:
+        try:
+            databases[alias] = {'status': 'ok', 'ms': check_database(alias)}
+        except Exception:
+            databases[alias] = {'status': 'unavailable'}
+            healthy = False
+    return JsonResponse({'status': 'ok' if healthy else 'unavailable', 'databases': databases},
+                        status=200 if healthy else 503)
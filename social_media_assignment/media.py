@@ -0,0 +1,173 @@
+"""
+Serving of user uploaded media.
+
+Replaces ``django.conf.urls.static.static`` with a view that supports
+conditional requests, single byte ranges and long lived caching of content
+addressed files. Files are streamed through ``FileResponse`` so WSGI servers
+with a ``wsgi.file_wrapper`` (gunicorn, uWSGI) can ``sendfile`` them, or are
+handed off to the front web server with ``X-Accel-Redirect``/``X-Sendfile``.
+
+Only files under ``MEDIA_SERVE_PREFIXES``, the directories models upload to,
+are served, anything else in ``MEDIA_ROOT`` is a 404.
+
+Uploads are named by their users, and so is the content type guessed from
+their extension. Only the images and videos of ``MEDIA_INLINE_TYPES`` are
+shown inline; everything else, HTML and SVG included, is sent as an
+attachment so it can't run as same-origin content, and browsers are told not
+to sniff a different type.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, quote_etag
+
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{64}')
+DEFAULT_INLINE_TYPES = (
+    'image/avif', 'image/gif', 'image/jpeg', 'image/png', 'image/webp',
+    'video/mp4', 'video/ogg', 'video/quicktime', 'video/webm',
+)
+
+
+class RangeFile:
+    """
+    Read-only view of ``length`` bytes of an open file, starting at its
+    current position. ``fileno`` is exposed so ``sendfile`` still applies.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def is_immutable(path):
+    """
+    Files stored under their content hash never change, see ``feed.media``.
+    """
+    prefixes = tuple(getattr(settings, 'MEDIA_IMMUTABLE_PREFIXES', ('assets/',)))
+    return path.startswith(prefixes) and CONTENT_ADDRESSED_NAME.match(os.path.basename(path)) is not None
+
+
+def get_etag(path, file_stat):
+    if is_immutable(path):
+        return quote_etag(os.path.basename(path).split('.')[0])
+    return quote_etag(f'{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}')
+
+
+def is_inline(content_type):
+    return content_type in getattr(settings, 'MEDIA_INLINE_TYPES', DEFAULT_INLINE_TYPES)
+
+
+def parse_range(header, size):
+    """
+    Return the ``(start, end)`` of a single ``bytes=`` range, ``None`` when the
+    header should be ignored, or raise ``ValueError`` if it can't be satisfied.
+    """
+    match = RANGE_HEADER.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def is_served(path):
+    prefixes = tuple(getattr(settings, 'MEDIA_SERVE_PREFIXES', ('assets/', 'file/')))
+    # Normalized first, 'assets/../uploads/' must not pass for 'assets/'.
+    return posixpath.normpath(path) == path.rstrip('/') and path.startswith(prefixes)
+
+
+def serve_media(request, path):
+    if not is_served(path):
+        raise Http404('"%(path)s" does not exist' % {'path': path})
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        file_stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('"%(path)s" does not exist' % {'path': path})
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404('"%(path)s" does not exist' % {'path': path})
+
+    etag = get_etag(path, file_stat)
+    last_modified = int(file_stat.st_mtime)
+    if is_immutable(path):
+        cache_control = 'public, max-age=31536000, immutable'
+    else:
+        cache_control = f'public, max-age={getattr(settings, "MEDIA_CACHE_MAX_AGE", 3600)}'
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        mode = getattr(settings, 'MEDIA_SERVE_MODE', 'django')
+        if mode == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix + quote(path)
+        elif mode == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = full_path
+        else:
+            response = _file_response(request, full_path, file_stat.st_size, content_type, etag)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    response['X-Content-Type-Options'] = 'nosniff'
+    if not is_inline(content_type):
+        response['Content-Disposition'] = content_disposition_header(True, os.path.basename(path))
+    return response
+
+
+def _file_response(request, full_path, size, content_type, etag):
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(RangeFile(file, end - start + 1), status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,308 @@
+"""
+Per endpoint request metrics and SQL query budgets.
+
+``RequestMetricsMiddleware`` records, for every request, the URL name it
+resolved to (``post-list-create``, ``follow_user``, ...), how many SQL queries
+it ran and how long they took, the time spent serializing the response, its
+duration and its size. Queries are counted with a database execute wrapper,
+so this works with ``DEBUG = False``. The wrapper is installed on every
+connection and finds the request through a context variable, since async
+views run their queries on other threads, with their own connections.
+
+Serialization time is the time the view spent outside of SQL queries plus the
+time spent rendering the response. It is only measured for DRF and other
+template responses, the only ones whose rendering happens after the view.
+
+``metrics_view`` serves the totals of the current process in the Prometheus
+text format to active staff users, authenticated like API requests (JWT access
+token) or by the admin session, and to scrapers sending ``METRICS_TOKEN`` as a
+bearer token. Client addresses aren't trusted, behind a proxy they are all the
+proxy's.
+
+``QUERY_BUDGETS`` maps URL names to the most queries a request may run. A
+request over its budget raises ``QueryBudgetExceeded`` when
+``QUERY_BUDGET_ACTION`` is ``'raise'``, failing the test that made it, or
+logs a warning when it is ``'warn'``. The test settings set ``'raise'``, see
+``social_media_assignment.test_settings``.
+"""
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseNotFound
+from django.utils.crypto import constant_time_compare
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+UNRESOLVED = '<unresolved>'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.response_bytes = 0
+        self.statuses = defaultdict(int)
+
+
+class MetricsRegistry:
+    """
+    Totals per ``(url name, method)`` of the current process.
+    """
+    counters = (
+        ('db_seconds', 'Seconds spent running SQL queries.'),
+        ('serialize_seconds', 'Seconds spent in views outside of SQL queries and rendering responses.'),
+        ('response_bytes', 'Bytes of response bodies with a known length.'),
+    )
+
+    def __init__(self):
+        self._endpoints = defaultdict(EndpointMetrics)
+        self._lock = threading.Lock()
+
+    def record(self, view, method, status, duration, queries, db_seconds, serialize_seconds, size):
+        with self._lock:
+            endpoint = self._endpoints[view, method]
+            endpoint.statuses[status] += 1
+            endpoint.duration.observe(duration)
+            endpoint.queries.observe(queries)
+            endpoint.db_seconds += db_seconds
+            endpoint.serialize_seconds += serialize_seconds
+            endpoint.response_bytes += size
+
+    def get(self, view, method):
+        with self._lock:
+            return self._endpoints.get((view, method))
+
+    def clear(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def render(self):
+        lines = [
+            '# HELP http_requests_total Requests by URL name, method and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            for (view, method), endpoint in endpoints:
+                for status, count in sorted(endpoint.statuses.items()):
+                    lines.append(f'http_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            for name, help_text, attribute in (
+                ('http_request_duration_seconds', 'Request duration.', 'duration'),
+                ('http_request_queries', 'SQL queries per request.', 'queries'),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (view, method), endpoint in endpoints:
+                    lines += getattr(endpoint, attribute).samples(name, f'view="{view}",method="{method}"')
+            for attribute, help_text in self.counters:
+                name = f'http_request_{attribute}_total'
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (view, method), endpoint in endpoints:
+                    lines.append(f'{name}{{view="{view}",method="{method}"}} {getattr(endpoint, attribute)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """
+    Query count and timings of one request, collected by the middleware.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self._view_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - start
+            self.queries += 1
+
+    def view_started(self):
+        self._view_started = time.perf_counter(), self.db_seconds
+
+    def view_finished(self):
+        if self._view_started is not None:
+            started, db_seconds = self._view_started
+            self.serialize_seconds += time.perf_counter() - started - (self.db_seconds - db_seconds)
+            self._view_started = None
+
+    def timed_render(self, render):
+        def wrapper():
+            start, db_seconds = time.perf_counter(), self.db_seconds
+            try:
+                return render()
+            finally:
+                self.serialize_seconds += time.perf_counter() - start - (self.db_seconds - db_seconds)
+        return wrapper
+
+
+def install_execute_wrapper(wrapper):
+    """
+    Add ``wrapper`` to the open connections of this thread and to every
+    connection opened afterwards, in any thread.
+    """
+    def install(connection, **kwargs):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+    connection_created.connect(install, weak=False, dispatch_uid=wrapper)
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+
+
+def count_query(execute, sql, params, many, context):
+    request_metrics = current_metrics.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    return request_metrics(execute, sql, params, many, context)
+
+
+def get_query_budget(view):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view)
+
+
+def check_query_budget(view, queries):
+    budget = get_query_budget(view)
+    if budget is None or queries <= budget:
+        return
+    message = f'{view} ran {queries} SQL queries, its budget is {budget}'
+    if getattr(settings, 'QUERY_BUDGET_ACTION', 'warn') == 'raise':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        install_execute_wrapper(count_query)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_metrics = request.request_metrics = RequestMetrics()
+        token = current_metrics.set(request_metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.record(request, response, request_metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        request_metrics = request.request_metrics = RequestMetrics()
+        token = current_metrics.set(request_metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.record(request, response, request_metrics, time.perf_counter() - start)
+
+    def record(self, request, response, request_metrics, duration):
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else UNRESOLVED
+        size = len(response.content) if not response.streaming else int(response.get('Content-Length') or 0)
+        registry.record(view, request.method, response.status_code, duration, request_metrics.queries,
+                        request_metrics.db_seconds, request_metrics.serialize_seconds, size)
+        check_query_budget(view, request_metrics.queries)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.request_metrics.view_started()
+
+    def process_template_response(self, request, response):
+        request_metrics = request.request_metrics
+        request_metrics.view_finished()
+        response.render = request_metrics.timed_render(response.render)
+        return response
+
+
+def get_api_user(request):
+    """
+    The user the API's ``DEFAULT_AUTHENTICATION_CLASSES`` authenticate, a JWT
+    access token's, else the session user. ``None`` for invalid credentials.
+    """
+    api_request = Request(request)
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = authentication_class().authenticate(api_request)
+        except APIException:
+            return None
+        if result is not None:
+            return result[0]
+    return getattr(request, 'user', None)
+
+
+def is_metrics_client(request):
+    """
+    Active staff users, signed in to the API or the admin, or clients sending
+    ``Authorization: Bearer <METRICS_TOKEN>``.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and constant_time_compare(credentials.strip(), token):
+        return True
+    user = get_api_user(request)
+    return user is not None and user.is_active and user.is_staff
+
+
+def metrics_view(request):
+    if not is_metrics_client(request):
+        return HttpResponseNotFound()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
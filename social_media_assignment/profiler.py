@@ -0,0 +1,281 @@
+"""
+Sampling profiler for slow requests.
+
+``SlowRequestProfilerMiddleware`` profiles requests to the URL names listed
+in ``SLOW_REQUEST_PROFILER['VIEWS']`` while ``ENABLED`` is set. Clients allowed
+to read the metrics, staff users and holders of ``METRICS_TOKEN``, can also
+profile a single request to any view by sending the ``HEADER``. A profiled
+request gets:
+
+* a background thread that samples the request thread's stack every
+  ``INTERVAL`` seconds with ``sys._current_frames()``;
+* a database execute wrapper that records every SQL statement and its time;
+* per field timings of the serializers using ``ProfiledSerializerMixin`` and
+  of the compiled ones of ``feed.fast_serializers``.
+
+If the request takes longer than ``THRESHOLD`` seconds, or the header asked
+for it, a JSON report is written to ``DIRECTORY`` with the stacks in collapsed
+(flame graph) form, the SQL with its ``EXPLAIN QUERY PLAN`` (``EXPLAIN`` on
+other databases) and the serializer breakdown. Query parameters are only used
+to explain the queries, reports don't contain them. Only the newest
+``MAX_FILES`` reports are kept.
+
+Stacks are sampled on the thread that started the view, code that async views
+run on other threads is only seen through its SQL and serializer timings.
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+
+from social_media_assignment.metrics import install_execute_wrapper, is_metrics_client
+
+DEFAULT_SLOW_REQUEST_PROFILER = {
+    'ENABLED': False,
+    'VIEWS': ('post-list-create',),
+    'THRESHOLD': 0.5,
+    'INTERVAL': 0.005,
+    'DIRECTORY': None,
+    'MAX_FILES': 100,
+    'HEADER': 'X-Profile-Request',
+    'MAX_STACK_DEPTH': 64,
+}
+
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+
+def get_options():
+    options = {**DEFAULT_SLOW_REQUEST_PROFILER, **getattr(settings, 'SLOW_REQUEST_PROFILER', {})}
+    if options['DIRECTORY'] is None:
+        options['DIRECTORY'] = os.path.join(settings.BASE_DIR, 'profiles')
+    return options
+
+
+class StackSampler(threading.Thread):
+    """
+    Counts the collapsed stacks of ``thread_id`` every ``interval`` seconds.
+    """
+
+    def __init__(self, thread_id, interval, max_depth):
+        super().__init__(name='slow-request-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None and len(frames) < self.max_depth:
+                code = frame.f_code
+                frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(frames))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfile:
+    def __init__(self, view, forced, options):
+        self.view = view
+        self.forced = forced
+        self.options = options
+        self.queries = []
+        self.serializers = defaultdict(lambda: {'calls': 0, 'seconds': 0.0})
+        self.sampler = StackSampler(threading.get_ident(), options['INTERVAL'], options['MAX_STACK_DEPTH'])
+        self.started_at = timezone.now()
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((context['connection'].alias, sql, params, many, time.perf_counter() - start))
+
+    def time_serializer(self, name, seconds):
+        entry = self.serializers[name]
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+
+    def begin(self):
+        self.sampler.start()
+
+    def end(self):
+        self.duration = time.perf_counter() - self.start
+        self.sampler.stop()
+
+    def is_slow(self):
+        return self.duration >= self.options['THRESHOLD']
+
+
+class ProfiledSerializerMixin:
+    """
+    Times every field of the serializer while a request is being profiled.
+    Timings include nested serializers and ``SerializerMethodField`` methods.
+    """
+
+    def to_representation(self, instance):
+        profile = current_profile.get()
+        if profile is None:
+            return super().to_representation(instance)
+
+        start = time.perf_counter()
+        name = type(self).__name__
+        ret = OrderedDict()
+        for field in self._readable_fields:
+            field_start = time.perf_counter()
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                continue
+            check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+            ret[field.field_name] = None if check_for_none is None else field.to_representation(attribute)
+            profile.time_serializer(f'{name}.{field.field_name}', time.perf_counter() - field_start)
+        profile.time_serializer(name, time.perf_counter() - start)
+        return ret
+
+
+def record_query(execute, sql, params, many, context):
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def explain(alias, sql, params):
+    connection = connections[alias]
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif connection.vendor in ('postgresql', 'mysql'):
+        prefix = 'EXPLAIN '
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+
+
+def build_report(profile, request, response):
+    stacks = profile.sampler.stacks
+    leaves = Counter()
+    for stack, count in stacks.items():
+        leaves[stack.rsplit(';', 1)[-1]] += count
+    queries = []
+    for alias, sql, params, many, seconds in profile.queries:
+        is_select = not many and sql.lstrip().upper().startswith('SELECT')
+        queries.append({
+            'database': alias,
+            'sql': sql,
+            'ms': round(seconds * 1000, 3),
+            'plan': explain(alias, sql, params) if is_select else None,
+        })
+    return {
+        'started_at': profile.started_at.isoformat(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': profile.view,
+        'status': response.status_code,
+        'forced': profile.forced,
+        'duration_ms': round(profile.duration * 1000, 3),
+        'sample_interval_ms': profile.options['INTERVAL'] * 1000,
+        'samples': sum(stacks.values()),
+        'hot_frames': [{'frame': frame, 'samples': count} for frame, count in leaves.most_common(20)],
+        'stacks': [{'stack': stack, 'samples': count} for stack, count in stacks.most_common()],
+        'queries': queries,
+        'db_ms': round(sum(query['ms'] for query in queries), 3),
+        'serializers': {
+            name: {'calls': entry['calls'], 'ms': round(entry['seconds'] * 1000, 3)}
+            for name, entry in sorted(profile.serializers.items(), key=lambda item: -item[1]['seconds'])
+        },
+    }
+
+
+def write_report(report, options):
+    directory = options['DIRECTORY']
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{report['view']}-{uuid.uuid4().hex[:8]}.json"
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    reports = sorted(entry for entry in os.listdir(directory) if entry.endswith('.json'))
+    for old in reports[:-options['MAX_FILES']]:
+        try:
+            os.remove(os.path.join(directory, old))
+        except FileNotFoundError:
+            pass
+    return path
+
+
+class SlowRequestProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        install_execute_wrapper(record_query)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.slow_request_profile = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self.end_profile(request)
+        return self.report(request, response)
+
+    async def __acall__(self, request):
+        request.slow_request_profile = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.end_profile(request)
+        # Explaining the queries and writing the report block.
+        return await sync_to_async(self.report)(request, response)
+
+    def end_profile(self, request):
+        if request.slow_request_profile is not None:
+            request.slow_request_profile.end()
+            current_profile.set(None)
+
+    def report(self, request, response):
+        profile = request.slow_request_profile
+        if profile is not None and (profile.forced or profile.is_slow()):
+            write_report(build_report(profile, request, response), profile.options)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        options = get_options()
+        view = request.resolver_match.url_name or request.resolver_match.view_name
+        header = 'HTTP_' + options['HEADER'].upper().replace('-', '_')
+        forced = bool(request.META.get(header)) and is_metrics_client(request)
+        if not forced and not (options['ENABLED'] and view in options['VIEWS']):
+            return None
+        profile = request.slow_request_profile = RequestProfile(view, forced, options)
+        current_profile.set(profile)
+        profile.begin()
+        return None
@@ -0,0 +1,26 @@
+"""
+JSON renderer that encodes with orjson when it is installed.
+
+orjson writes the same compact UTF-8 JSON as DRF's ``JSONRenderer`` several
+times faster. Values it doesn't encode natively, including datetimes (DRF
+truncates them to milliseconds), go through DRF's ``JSONEncoder.default``.
+Without orjson, or when an indented response is asked for, rendering is left
+to ``JSONRenderer``.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, responses are then rendered by json.dumps.
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact or self.get_indent(
+                accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=self.encoder_class().default,
+                           option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        # Same escaping as JSONRenderer, keeps the output a strict javascript subset.
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -42,6 +42,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'social_media_assignment.metrics.RequestMetricsMiddleware',
+    'social_media_assignment.profiler.SlowRequestProfilerMiddleware',
+    'social_media_assignment.database.ReplicaReadMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,11 +78,95 @@ AUTH_USER_MODEL = 'accounts.CustomUser'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite unless DB_ENGINE=postgresql, configured from the DB_* environment
+# variables. DB_REPLICA_HOSTS is a comma separated list of PostgreSQL read
+# replicas, see social_media_assignment.database for what is read from them.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'social_media'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Keep connections open between requests; a health check before
+            # reuse replaces the ones the server or a failover dropped.
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            # Behind PgBouncer in transaction pooling mode set DB_PGBOUNCER=1
+            # (and usually DB_CONN_MAX_AGE=0): server side cursors don't
+            # survive a pooled transaction.
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_PGBOUNCER', '') in ('1', 'true', 'yes'),
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+            },
+        }
+    }
+    for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+        DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+else:
+    DATABASES = {
+        'default': {
+            # Runs OPTIONS['init_command'] on connect, see social_media_assignment.sqlite3.
+            'ENGINE': 'social_media_assignment.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # WAL lets readers carry on while a write is in progress,
+                # synchronous=NORMAL only fsyncs at checkpoints in WAL mode,
+                # writers wait up to busy_timeout ms for the lock instead of
+                # failing with "database is locked".
+                'init_command': (
+                    'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA busy_timeout=5000; '
+                    'PRAGMA mmap_size=268435456; PRAGMA cache_size=-20000; PRAGMA temp_store=MEMORY'
+                ),
+            },
+        }
     }
+    # A second SQLite database standing in for a read replica, refreshed
+    # from the primary with `manage.py sync_sqlite_replica`.
+    if os.environ.get('DB_REPLICA_NAME'):
+        DATABASES['replica_1'] = {**DATABASES['default'], 'NAME': os.environ['DB_REPLICA_NAME']}
+
+# Read replicas, see social_media_assignment.database.
+# Database aliases the reads of DATABASE_REPLICA_VIEWS go to.
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+# URL names whose GET requests read from a replica.
+DATABASE_REPLICA_VIEWS = ('post-list-create', 'post-detail', 'post-search', 'post-comment-list', 'profile_detail')
+# Seconds a user's reads stay on the primary after they wrote.
+DATABASE_PRIMARY_PIN_SECONDS = 5
+# Cache alias of those pins, must be shared between workers to use replicas.
+DATABASE_PRIMARY_PIN_CACHE = 'default'
+DATABASE_ROUTERS = ['social_media_assignment.database.PrimaryReplicaRouter']
+
+# Metrics and profiling
+# Bearer token of the scrapers allowed to read /metrics/, besides staff users.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Most SQL queries a request to each URL name may run.
+QUERY_BUDGETS = {
+    'post-list-create': 10,
+    'post-detail': 8,
+    'post-comment-list': 5,
+    'like-create': 12,
+    'comment-create': 12,
+    'follow_user': 12,
+    'unfollow_user': 12,
+    'token_obtain_pair': 3,
+}
+# 'warn' logs requests over their budget, 'raise' fails them.
+QUERY_BUDGET_ACTION = 'warn'
+# Slow request reports, see social_media_assignment.profiler.
+SLOW_REQUEST_PROFILER = {
+    'ENABLED': False,
+    'VIEWS': ('post-list-create',),
+    'THRESHOLD': 0.5,
+    'INTERVAL': 0.005,
+    'DIRECTORY': os.path.join(BASE_DIR, 'profiles'),
+    'MAX_FILES': 100,
+    'HEADER': 'X-Profile-Request',
 }
 
 # Password validation
@@ -100,6 +187,22 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# https://docs.djangoproject.com/en/4.2/topics/auth/passwords/
+
+# Put Argon2PasswordHasher first once argon2-cffi is installed.
+PASSWORD_HASHERS = [
+    'accounts.hashers.TunedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+# Work factor of TunedPBKDF2PasswordHasher.
+ACCOUNTS_PBKDF2_ITERATIONS = 600000
+# When logins re-hash outdated passwords: 'background', 'inline' or 'off'.
+ACCOUNTS_PASSWORD_REHASH = 'background'
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -121,16 +224,126 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Process local, point 'default' at Redis or Memcached with several workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'social-media-assignment',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Media serving, see social_media_assignment.media.
+# 'django' streams files, 'x-accel-redirect' and 'x-sendfile' hand them to nginx or Apache.
+MEDIA_SERVE_MODE = 'django'
+# nginx internal location aliased to MEDIA_ROOT, for 'x-accel-redirect'.
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# Only files under these prefixes of MEDIA_ROOT are served.
+MEDIA_SERVE_PREFIXES = ('assets/', 'file/')
+# Content addressed files under these prefixes are cached forever.
+MEDIA_IMMUTABLE_PREFIXES = ('assets/',)
+# Browser cache lifetime (seconds) of every other media file.
+MEDIA_CACHE_MAX_AGE = 3600
+# Content types shown inline, any other media file is downloaded.
+MEDIA_INLINE_TYPES = (
+    'image/avif', 'image/gif', 'image/jpeg', 'image/png', 'image/webp',
+    'video/mp4', 'video/ogg', 'video/quicktime', 'video/webm',
+)
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 3,
+    # FastJSONRenderer uses orjson when installed and falls back to JSONRenderer.
+    'DEFAULT_RENDERER_CLASSES': (
+        'social_media_assignment.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.StatelessJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '30/min',
+        'login_account': '10/min',
+    },
+}
+
+# Authentication
+# Per-process LRU of users' token auth versions, changes made by other
+# processes revoke tokens within the TTL (seconds).
+ACCOUNTS_AUTH_VERSION_CACHE_SIZE = 10000
+ACCOUNTS_AUTH_VERSION_CACHE_TTL = 60
+
+# Social graph
+# Cache alias and lifetime (seconds) of the per-user follower/following ids.
+SOCIAL_GRAPH_CACHE = 'default'
+SOCIAL_GRAPH_CACHE_TIMEOUT = 3600
+# Follow suggestions, see accounts.suggestions.
+ACCOUNTS_SUGGESTIONS = {
+    'CACHE': 'default',
+    'TIMEOUT': 3600,
+    'SIZE': 500,
+    'MAX_SOURCES': 5000,
+}
+
+# Feed
+# Dotted path to the class that materializes users' home timelines.
+FEED_TIMELINE_STORE = 'feed.timeline.DatabaseTimelineStore'
+# Authors with more subscribers are merged into feeds at read time instead.
+FEED_FANOUT_THRESHOLD = 10000
+# Number of most recent comments embedded in every serialized post.
+FEED_RECENT_COMMENTS = 3
+# Rows each post's like/comment counter is spread over.
+FEED_COUNTER_SHARDS = 8
+# 'sync' inserts every like in its request, 'buffered' writes them in batches.
+FEED_LIKE_WRITE_MODE = 'sync'
+# Batching and durability of buffered likes, see feed.like_buffer.
+FEED_LIKE_BUFFER = {
+    'FLUSH_INTERVAL': 0.005,
+    'MAX_BATCH': 500,
+    'JOURNAL': None,
+    'FSYNC': False,
+}
+# Largest resumable upload (bytes), see feed.media.
+FEED_UPLOAD_MAX_SIZE = 2 * 1024 ** 3
+# Unfinished uploads, kept outside MEDIA_ROOT so they are never served.
+FEED_UPLOAD_TEMP_DIR = os.path.join(BASE_DIR, 'uploads')
+# Image sizes generated from uploads when Pillow is installed.
+FEED_MEDIA_VARIANTS = {
+    'thumbnail': (320, 320),
+    'medium': (1080, 1080),
+}
+# 'background' processes finished uploads on a worker thread, 'inline' in the request.
+FEED_MEDIA_PROCESSING = 'background'
+# Serve the hot feed endpoints with feed.async_views, under ASGI only.
+FEED_ASYNC_VIEWS = False
+# Serialize posts and comments with the compiled feed.fast_serializers.
+FEED_FAST_SERIALIZERS = True
+# Server-sent events: messages queued per client, keep-alive and lifetime (seconds).
+FEED_EVENTS_QUEUE_SIZE = 100
+FEED_EVENTS_HEARTBEAT = 15
+FEED_EVENTS_MAX_AGE = 300
+# Cache alias of the serialized home feed pages, see feed.page_cache.
+FEED_PAGE_CACHE = 'default'
+# Lifetime (seconds) of a cached page, 0 disables it, None caches only in a shared cache.
+FEED_PAGE_CACHE_TIMEOUT = None
+# Ranked feed (?mode=ranked), see feed.ranking.
+FEED_RANKING = {
+    'CACHE': 'default',
+    'LIKE_WEIGHT': 1.0,
+    'COMMENT_WEIGHT': 3.0,
+    'AFFINITY_WEIGHT': 1.0,
+    'DECAY_SECONDS': 45000,
+    'POOL_SIZE': 500,
+    'POOL_TIMEOUT': 600,
+    'AFFINITY_SIZE': 200,
+    'TIMEOUT': 7 * 24 * 3600,
 }
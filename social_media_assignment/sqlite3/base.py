@@ -0,0 +1,21 @@
+"""
+SQLite backend that runs ``OPTIONS['init_command']`` on every new connection,
+like the built-in backend does from Django 5.1 on. Used to apply the WAL
+tuning PRAGMAs in ``settings.DATABASES``.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('init_command', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        init_command = self.settings_dict['OPTIONS'].get('init_command')
+        if init_command:
+            for statement in filter(None, (part.strip() for part in init_command.split(';'))):
+                conn.execute(statement)
+        return conn
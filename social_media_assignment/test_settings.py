@@ -0,0 +1,26 @@
+"""
+Settings of the test suite, ``manage.py test`` uses them.
+"""
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+# Requests over their QUERY_BUDGETS raise and fail the test that made them,
+# instead of logging a warning as served requests do.
+QUERY_BUDGET_ACTION = 'raise'
+
+# Tests run in one process, which sees every feed page cache invalidation.
+FEED_PAGE_CACHE_TIMEOUT = 300
+
+# A second SQLite database standing in for a lagging replica. Tests only read
+# from it when they list it in DATABASE_REPLICAS, see ReadYourWritesTests.
+if DB_ENGINE != 'postgresql':
+    DATABASES.setdefault('replica_1', {**DATABASES['default'], 'NAME': BASE_DIR / 'replica.sqlite3'})
+DATABASE_REPLICAS = []
+# Replicas need a pin cache shared between workers, the local memory cache isn't.
+CACHES['pins'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(tempfile.gettempdir(), 'social-media-assignment-pins'),
+}
+DATABASE_PRIMARY_PIN_CACHE = 'pins'